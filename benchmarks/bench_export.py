@@ -0,0 +1,474 @@
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Add the package root to the module search path so that benchmarks can be run as scripts from any directory without
+# installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Feature list ID of the synthetic feature table.
+FEATURE_LIST_ID = '00000000-0000-0000-0000-000000000000'
+# Name of the intensity column of the synthetic feature table.
+INTENSITY_COLUMN_NAME = 'intensity'
+# Width and height in pixels of the synthetic ion images.
+IMAGE_SIZE = 32
+# Fraction of fragment features whose synthetic ion image is co-localized with the precursors of their window.
+COLOCALIZED_FRACTION = 0.8
+# Number of threads used to check that multi-threaded co-localization filtering matches single-threaded filtering.
+COLOCALIZATION_THREADS = 4
+# Number of spectra queued for the background writer thread in the write queue scenarios.
+WRITE_QUEUE_SIZE = 64
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description='Time each stage of an iprm-PASEF export using synthetic feature '
+                                                 'tables and a stand-in for scilslab.LocalSession.')
+    parser.add_argument('--windows',
+                        help='Number of precursor isolation windows. Defaults to 2000.',
+                        default=2000,
+                        type=int)
+    parser.add_argument('--fragments',
+                        help='Number of fragment features per isolation window. Defaults to 50.',
+                        default=50,
+                        type=int)
+    parser.add_argument('--precursors',
+                        help='Number of precursor features per isolation window. Defaults to 2.',
+                        default=2,
+                        type=int)
+    parser.add_argument('--user_columns',
+                        help='Number of additional user columns in the feature table. Defaults to 10.',
+                        default=10,
+                        type=int)
+    parser.add_argument('--repeat',
+                        help='Number of times each stage is run. The fastest run is reported. Defaults to 3.',
+                        default=3,
+                        type=int)
+    parser.add_argument('--workers',
+                        help='Number of worker processes used to write individual files for each precursor window. '
+                             'Defaults to 1.',
+                        default=1,
+                        type=int)
+    parser.add_argument('--skip_per_window',
+                        help='If this flag is used, do not benchmark writing individual files for each precursor '
+                             'window.',
+                        action='store_true')
+    parser.add_argument('--seed',
+                        help='Random seed used to generate the synthetic feature table. Defaults to 0.',
+                        default=0,
+                        type=int)
+    parser.add_argument('--output',
+                        help='Path to a JSON file to write results to, i.e. to compare results between versions.',
+                        default='',
+                        type=str)
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def get_synthetic_feature_table(n_windows, n_fragments, n_precursors, n_user_columns, seed=0):
+    """
+    Generate a synthetic iprm-PASEF feature table in the format returned by SCiLS Lab with all user columns included.
+
+    :param n_windows: Number of precursor isolation windows.
+    :type n_windows: int
+    :param n_fragments: Number of fragment features per isolation window.
+    :type n_fragments: int
+    :param n_precursors: Number of precursor features per isolation window.
+    :type n_precursors: int
+    :param n_user_columns: Number of additional user columns.
+    :type n_user_columns: int
+    :param seed: Random seed.
+    :type seed: int
+    :return: Feature table with rows in random order.
+    :rtype: pandas.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    window_mz = np.round(rng.uniform(300, 1500, n_windows), 4)
+    window_ook0 = np.round(rng.uniform(0.6, 1.6, n_windows), 4)
+    labels = np.array([f'{mz:.4f} m/z, 1/K0 {ook0:.4f}' for mz, ook0 in zip(window_mz, window_ook0)], dtype=object)
+    features_per_window = n_precursors + n_fragments
+    window_index = np.repeat(np.arange(n_windows), features_per_window)
+    is_precursor = np.tile(np.arange(features_per_window) < n_precursors, n_windows)
+    n_features = window_index.size
+    mz = np.where(is_precursor,
+                  window_mz[window_index] + rng.normal(0, 0.1, n_features),
+                  rng.uniform(50, window_mz[window_index]))
+    ook0 = window_ook0[window_index] + np.where(is_precursor, rng.normal(0, 0.01, n_features), 0)
+    feature_list = pd.DataFrame({'isolation_window': labels[window_index],
+                                 'type': np.where(is_precursor, 'Precursor', 'Fragment').astype(object),
+                                 'mz_low': mz - 0.01,
+                                 'mz_high': mz + 0.01,
+                                 'one_over_k0_low': ook0 - 0.005,
+                                 'one_over_k0_high': ook0 + 0.005,
+                                 INTENSITY_COLUMN_NAME: rng.exponential(1e4, n_features)})
+    for index in range(n_user_columns):
+        feature_list[f'user_column_{index}'] = rng.random(n_features)
+    feature_list = feature_list.iloc[rng.permutation(n_features)].reset_index(drop=True)
+    feature_list.index.name = 'id'
+    return feature_list
+
+
+class FakeFeatureTable(object):
+    """
+    Stand-in for the feature_table attribute of scilslab.LocalSession.dataset_proxy returning a pre-generated synthetic
+    feature table.
+
+    :param feature_list: Synthetic feature table returned by get_synthetic_feature_table().
+    :type feature_list: pandas.DataFrame
+    """
+    def __init__(self, feature_list):
+        self.feature_list = feature_list
+
+    def get_feature_lists(self):
+        return pd.DataFrame({'name': ['Synthetic iprm-PASEF feature list'], 'id': [FEATURE_LIST_ID]})
+
+    def get_features(self, feature_list_id, include_all_user_columns=False):
+        if feature_list_id != FEATURE_LIST_ID:
+            raise ValueError(f'Unknown feature list ID "{feature_list_id}".')
+        # SCiLS Lab returns a new data frame for each query.
+        return self.feature_list.copy()
+
+
+class FakeDatasetProxy(object):
+    """
+    Stand-in for scilslab.LocalSession.dataset_proxy serving a synthetic feature table and synthetic ion images. The
+    ion images of precursor features and COLOCALIZED_FRACTION of the fragment features are noisy copies of a random
+    image for each isolation window, while the remaining fragment features have unrelated random ion images.
+
+    :param feature_list: Synthetic feature table returned by get_synthetic_feature_table().
+    :type feature_list: pandas.DataFrame
+    :param seed: Random seed.
+    :type seed: int
+    """
+    def __init__(self, feature_list, seed=0):
+        self.feature_table = FakeFeatureTable(feature_list)
+        self.seed = seed
+        self._features = None
+
+    def _get_features(self):
+        # Map the m/z range of each feature to its isolation window, or to -1 for unrelated fragment ion images.
+        if self._features is None:
+            feature_list = self.feature_table.feature_list
+            rng = np.random.default_rng(self.seed)
+            window_codes = pd.factorize(feature_list['isolation_window'])[0]
+            unrelated = (feature_list['type'].values == 'Fragment') & \
+                (rng.random(feature_list.shape[0]) >= COLOCALIZED_FRACTION)
+            window_codes[unrelated] = -1
+            self._features = dict(zip(zip(feature_list['mz_low'].tolist(), feature_list['mz_high'].tolist()),
+                                      enumerate(window_codes.tolist())))
+        return self._features
+
+    def get_ion_images(self, mz_low, mz_high):
+        images = []
+        for key in zip(mz_low, mz_high):
+            feature_index, window_code = self._get_features()[key]
+            rng = np.random.default_rng([self.seed, feature_index])
+            if window_code >= 0:
+                image = np.random.default_rng([self.seed, window_code, 0]).random((IMAGE_SIZE, IMAGE_SIZE))
+                image = image * rng.uniform(0.5, 2) + rng.normal(0, 0.1, image.shape)
+            else:
+                image = rng.random((IMAGE_SIZE, IMAGE_SIZE))
+            images.append(types.SimpleNamespace(values=image))
+        return images
+
+
+class FakeLocalSession(object):
+    """
+    Stand-in for scilslab.LocalSession serving a synthetic feature table and ion images. Used as the session_factory of
+    exporter.session.ScilsSession.
+
+    :param filename: Path to the *.slx file. Not required to exist.
+    :type filename: str
+    :param feature_list: Synthetic feature table returned by get_synthetic_feature_table().
+    :type feature_list: pandas.DataFrame
+    """
+    def __init__(self, filename=None, feature_list=None):
+        self.filename = filename
+        self.dataset_proxy = FakeDatasetProxy(feature_list)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        pass
+
+
+def import_exporter():
+    """
+    Import the exporter modules used by the benchmark. If scilslab is not installed, a module providing
+    FakeLocalSession as LocalSession is registered in its place, so the benchmark runs without SCiLS Lab.
+
+    :return: Namespace containing the imported exporter modules.
+    :rtype: types.SimpleNamespace
+    """
+    try:
+        import scilslab
+    except ImportError:
+        sys.modules['scilslab'] = types.ModuleType('scilslab')
+        sys.modules['scilslab'].LocalSession = FakeLocalSession
+    from exporter import colocalization, feature_table, isolation_window, mgf, mzml, session, spectra
+    return types.SimpleNamespace(colocalization=colocalization, feature_table=feature_table,
+                                 isolation_window=isolation_window, mgf=mgf, mzml=mzml, session=session,
+                                 spectra=spectra)
+
+
+def get_writer_scenarios(exporter, slx, skip_per_window=False, workers=1):
+    """
+    Get the output sinks to benchmark for each combination of format, encoding, compression, and single file vs
+    per-window mode. Optional encodings are skipped if their dependencies are not installed.
+
+    :param exporter: Namespace returned by import_exporter().
+    :type exporter: types.SimpleNamespace
+    :param slx: Path to the *.slx file used to name output files.
+    :type slx: str
+    :param skip_per_window: If True, only benchmark writing a single file.
+    :type skip_per_window: bool
+    :param workers: Number of worker processes used to write individual files for each precursor window.
+    :type workers: int
+    :return: Dictionary of scenario names and functions returning an output sink for a given output directory.
+    :rtype: dict
+    """
+    def mzml_sink(outdir, mz_encoding=64, intensity_encoding=64, compression='zlib', export_single_file=True,
+                  **kwargs):
+        return exporter.mzml.MzmlSink(slx, outdir, '+', False, mz_encoding, intensity_encoding, compression,
+                                      export_single_file, workers=workers, **kwargs)
+
+    scenarios = {'mgf single': lambda outdir: exporter.mgf.MgfSink(slx, outdir, True),
+                 'mgf single (mz 4dp, intensity 1dp)': lambda outdir: exporter.mgf.MgfSink(slx, outdir, True,
+                                                                                           mz_precision=4,
+                                                                                           intensity_precision=1),
+                 'mzml single 64-bit zlib': lambda outdir: mzml_sink(outdir),
+                 'mzml single 32-bit zlib': lambda outdir: mzml_sink(outdir, 32, 32),
+                 'mzml single 64-bit none': lambda outdir: mzml_sink(outdir, compression='none'),
+                 'mgf single (write queue)': lambda outdir: exporter.mgf.MgfSink(slx, outdir, True,
+                                                                                 write_queue_size=WRITE_QUEUE_SIZE),
+                 'mzml single 64-bit (write queue)': lambda outdir: mzml_sink(outdir,
+                                                                              write_queue_size=WRITE_QUEUE_SIZE)}
+    if exporter.mzml.pynumpress is not None:
+        scenarios['mzml single numpress zlib'] = lambda outdir: mzml_sink(outdir, 'numpress_linear', 'numpress_slof')
+    if exporter.mzml.MzMLbWriter is not None:
+        scenarios['mzmlb single 64-bit zlib'] = lambda outdir: mzml_sink(outdir, mzmlb=True)
+    if not skip_per_window:
+        scenarios.update({'mgf per-window': lambda outdir: exporter.mgf.MgfSink(slx, outdir, False, workers),
+                          'mgf per-window zip': lambda outdir: exporter.mgf.MgfSink(slx, outdir, False, workers,
+                                                                                    archive='zip'),
+                          'mzml per-window 64-bit zlib': lambda outdir: mzml_sink(outdir, export_single_file=False),
+                          'mzml per-window zip': lambda outdir: mzml_sink(outdir, export_single_file=False,
+                                                                          archive='zip')})
+    return scenarios
+
+
+def get_directory_size(path):
+    """
+    Get the total size of all files in a directory.
+
+    :param path: Path to the directory.
+    :type path: str
+    :return: Size in bytes.
+    :rtype: int
+    """
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, dirs, filenames in os.walk(path) for filename in filenames)
+
+
+def run_stage(function, repeat, setup=None):
+    """
+    Time a benchmark stage and measure its peak memory usage. Each run is timed separately and memory usage is
+    measured in an additional run with tracemalloc enabled, so tracing does not affect the reported times.
+
+    :param function: Function running the stage. Called with the return value of setup if provided.
+    :type function: collections.abc.Callable
+    :param repeat: Number of timed runs.
+    :type repeat: int
+    :param setup: Function called before each run that is not included in the timings (i.e. to create an empty output
+        directory).
+    :type setup: collections.abc.Callable | None
+    :return: Tuple containing the fastest run time in seconds, peak traced memory in bytes, and the return value of
+        the last run.
+    :rtype: tuple[float, int, object]
+    """
+    def run():
+        args = [setup()] if setup is not None else []
+        start_time = time.perf_counter()
+        result = function(*args)
+        return time.perf_counter() - start_time, result
+
+    times = []
+    for i in range(max(1, repeat)):
+        seconds, result = run()
+        times.append(seconds)
+    tracemalloc.start()
+    try:
+        run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak_memory, result
+
+
+def main():
+    """
+    Run benchmark.
+    """
+    args = get_args()
+    exporter = import_exporter()
+    feature_list = get_synthetic_feature_table(args['windows'], args['fragments'], args['precursors'],
+                                               args['user_columns'], args['seed'])
+    n_features = feature_list.shape[0]
+    results = []
+    failures = []
+
+    def report(stage, seconds, peak_memory, throughput, unit, output_size=None):
+        results.append({'stage': stage, 'seconds': seconds, 'peak_memory': peak_memory, 'throughput': throughput,
+                        'throughput_unit': unit, 'output_size': output_size})
+        print(f'{stage:<36} {seconds:8.3f} s {throughput:12,.0f} {unit:<11} {peak_memory / 1024 ** 2:9.1f} MB peak' +
+              (f' {output_size / 1024 ** 2:9.1f} MB output' if output_size is not None else ''))
+
+    print(f'{args["windows"]} windows, {n_features} features ({args["precursors"]} precursors and '
+          f'{args["fragments"]} fragments per window, {args["user_columns"]} user columns), best of {args["repeat"]} '
+          f'runs')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        slx = os.path.join(tmpdir, 'synthetic_iprm-PASEF.slx')
+        cache_dir = os.path.join(tmpdir, 'cache')
+
+        def fetch(use_cache, columns=None):
+            session = exporter.session.ScilsSession(
+                slx, session_factory=lambda filename: FakeLocalSession(filename, feature_list)
+            )
+            with session:
+                return exporter.feature_table.get_feature_table(slx, FEATURE_LIST_ID, session=session,
+                                                                use_cache=use_cache, cache_dir=cache_dir,
+                                                                columns=columns)
+
+        # Fetch the feature table from the session, then from the on-disk cache. The synthetic session only copies the
+        # feature table, so the uncached stage does not include the cost of querying SCiLS Lab.
+        seconds, peak_memory, features = run_stage(lambda: fetch(False), args['repeat'])
+        report('fetch (stand-in, copy only)', seconds, peak_memory, n_features / seconds, 'features/s')
+        fetch(True)
+        seconds, peak_memory, features = run_stage(lambda: fetch(True), args['repeat'])
+        report('fetch (cached)', seconds, peak_memory, n_features / seconds, 'features/s')
+        # Read only the columns needed for export from the cache and store them in compact data types.
+        columns = exporter.feature_table.get_feature_columns(INTENSITY_COLUMN_NAME)
+        seconds, peak_memory, projected = run_stage(
+            lambda: exporter.feature_table.project_feature_table(fetch(True, columns), INTENSITY_COLUMN_NAME),
+            args['repeat']
+        )
+        report('fetch (cached, projected)', seconds, peak_memory, n_features / seconds, 'features/s')
+
+        # Parse isolation windows and build spectra with the default 1% relative intensity threshold.
+        seconds, peak_memory, windows = run_stage(
+            lambda: exporter.isolation_window.factorize_isolation_windows(features), args['repeat']
+        )
+        report('windowing', seconds, peak_memory, n_features / seconds, 'features/s')
+        seconds, peak_memory, spectra = run_stage(
+            lambda: exporter.spectra.build_ms2_spectra(features, INTENSITY_COLUMN_NAME, False, 0.01), args['repeat']
+        )
+        report('filtering', seconds, peak_memory, n_features / seconds, 'features/s')
+        # Build spectra for the intensity column and up to three user columns in a single pass.
+        intensity_columns = [INTENSITY_COLUMN_NAME] + [f'user_column_{index}'
+                                                       for index in range(min(args['user_columns'], 3))]
+        seconds, peak_memory, column_spectra = run_stage(
+            lambda: exporter.spectra.build_ms2_spectra(features, intensity_columns, False, 0.01), args['repeat']
+        )
+        report(f'filtering ({len(intensity_columns)} intensity columns)', seconds, peak_memory,
+               n_features * len(intensity_columns) / seconds, 'features/s')
+        # Build spectra with all additional fragment filters enabled, which are applied to all windows at once.
+        fragment_filters = {'precursor_exclusion': 1.0, 'min_intensity': 1.0, 'min_signal_to_noise': 2.0, 'top_n': 50}
+        seconds, peak_memory, filtered_spectra = run_stage(
+            lambda: exporter.spectra.build_ms2_spectra(features, INTENSITY_COLUMN_NAME, False, 0.01,
+                                                       fragment_filters=fragment_filters), args['repeat']
+        )
+        report('filtering (all fragment filters)', seconds, peak_memory, n_features / seconds, 'features/s')
+
+        # Remove fragments that are not co-localized with their precursors, fetching ion images from a new session
+        # and then from the ion image cache of a warm session.
+        def colocalization(session):
+            return exporter.colocalization.filter_colocalized_fragments(session, features, 0.5)
+
+        seconds, peak_memory, colocalized = run_stage(
+            lambda: colocalization(exporter.session.ScilsSession(
+                slx, session_factory=lambda filename: FakeLocalSession(filename, feature_list)
+            )), args['repeat']
+        )
+        report('colocalization', seconds, peak_memory, n_features / seconds, 'features/s')
+        warm_session = exporter.session.ScilsSession(
+            slx, session_factory=lambda filename: FakeLocalSession(filename, feature_list)
+        )
+        colocalization(warm_session)
+        seconds, peak_memory, colocalized = run_stage(lambda: colocalization(warm_session), args['repeat'])
+        report('colocalization (cached images)', seconds, peak_memory, n_features / seconds, 'features/s')
+        # Scoring isolation windows in multiple threads must keep the same fragments as scoring them in one thread.
+        single_threaded = exporter.colocalization.filter_colocalized_fragments(warm_session, features, 0.5, threads=1)
+        multi_threaded = exporter.colocalization.filter_colocalized_fragments(warm_session, features, 0.5,
+                                                                              threads=COLOCALIZATION_THREADS)
+        if not single_threaded.index.equals(multi_threaded.index):
+            failures.append(f'Co-localization filtering with {COLOCALIZATION_THREADS} threads keeps '
+                            f'{multi_threaded.shape[0]} features, but {single_threaded.shape[0]} features are kept '
+                            f'with a single thread.')
+        n_spectra = len(spectra)
+        # Iterate over all spectra using the in-memory spectrum API, which only creates views of the peak arrays.
+        seconds, peak_memory, n_peaks = run_stage(lambda: sum(scan['mz_array'].size for scan in spectra),
+                                                  args['repeat'])
+        report('iterate spectra (in-memory)', seconds, peak_memory, n_spectra / seconds, 'spectra/s')
+
+        # Write spectra for each scenario into a new output directory per run.
+        scenarios = get_writer_scenarios(exporter, slx, args['skip_per_window'], args['workers'])
+        for name, get_sink in scenarios.items():
+            def setup():
+                outdir = tempfile.mkdtemp(dir=tmpdir)
+                return outdir, get_sink(outdir)
+
+            def write(outdir_sink):
+                outdir, sink = outdir_sink
+                exporter.spectra.write_ms2_spectra(spectra, [sink])
+                output_size = get_directory_size(outdir)
+                shutil.rmtree(outdir)
+                return output_size
+
+            seconds, peak_memory, output_size = run_stage(write, args['repeat'], setup)
+            report(name, seconds, peak_memory, n_spectra / seconds, 'spectra/s', output_size)
+
+        # Fragment filters can remove all fragments of a window, so spectra without peaks must be written by every
+        # scenario.
+        empty_spectra = exporter.spectra.build_ms2_spectra(features, INTENSITY_COLUMN_NAME, False, 0.01,
+                                                           fragment_filters={'min_intensity': np.inf})
+        for name, get_sink in scenarios.items():
+            outdir = tempfile.mkdtemp(dir=tmpdir)
+            try:
+                exporter.spectra.write_ms2_spectra(empty_spectra, [get_sink(outdir)])
+            except Exception as exception:
+                failures.append(f'{name} fails to write spectra without peaks: {exception!r}')
+            shutil.rmtree(outdir)
+
+    if args['output']:
+        with open(args['output'], 'w') as output_file:
+            json.dump({'parameters': args, 'features': n_features, 'spectra': n_spectra, 'results': results,
+                       'failures': failures},
+                      output_file,
+                      indent=4)
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+# Modules imported by each command line entry point in setup.py and the heavy packages each entry point must not
+# import at startup. Heavy packages are only imported lazily when they are used.
+ENTRY_POINTS = {'get_feature_lists': ('exporter.get_feature_list_ids', ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'get_intensity_column_names': ('exporter.get_intensity_column_names',
+                                               ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'iprmpasef_to_mgf': ('exporter.mgf', ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'iprmpasef_to_mzml': ('exporter.mzml', ['PySide6', 'scilslab']),
+                'iprmpasef_export': ('exporter.export', ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'iprmpasef_batch': ('exporter.batch', ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'iprmpasef_server': ('exporter.server', ['PySide6', 'psims', 'pyteomics', 'scilslab']),
+                'iprmpasef_client': ('exporter.client',
+                                     ['PySide6', 'psims', 'pyteomics', 'scilslab', 'numpy', 'pandas'])}
+# Number of packages with the largest cumulative import time reported for each entry point.
+TOP_PACKAGES = 3
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description='Measure the import time of each command line entry point using '
+                                                 '"python -X importtime" and check that heavy packages are only '
+                                                 'imported when they are used.')
+    parser.add_argument('--repeat',
+                        help='Number of times each entry point is imported. The fastest run is reported. Defaults to '
+                             '5.',
+                        default=5,
+                        type=int)
+    parser.add_argument('--max_time',
+                        help='If used, fail if importing any entry point takes longer than this number of '
+                             'milliseconds.',
+                        default=None,
+                        type=float)
+    parser.add_argument('--output',
+                        help='Path to a JSON file to write results to, i.e. to compare results between versions.',
+                        default='',
+                        type=str)
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def parse_importtime(output):
+    """
+    Parse the output of "python -X importtime".
+
+    :param output: Output written to stderr by "python -X importtime".
+    :type output: str
+    :return: Dict of cumulative import times in microseconds indexed by module name.
+    :rtype: dict
+    """
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative_time, module_name = line[len('import time:'):].split('|')
+        import_times[module_name.strip()] = int(cumulative_time)
+    return import_times
+
+
+def time_import(module_name):
+    """
+    Import a module in a new Python interpreter with "-X importtime" enabled. The package root is added to PYTHONPATH
+    so the benchmark runs without installing the package.
+
+    :param module_name: Module to import.
+    :type module_name: str
+    :return: Tuple containing the interpreter startup time in seconds and the import times returned by
+        parse_importtime().
+    :rtype: tuple[float, dict]
+    """
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([package_root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    start_time = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                             env=env,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE,
+                             text=True)
+    startup_time = time.perf_counter() - start_time
+    if process.returncode != 0:
+        raise RuntimeError(f'Importing {module_name} failed:\n{process.stderr}')
+    return startup_time, parse_importtime(process.stderr)
+
+
+def main():
+    """
+    Run benchmark.
+    """
+    args = get_args()
+    results = {}
+    failures = []
+    print(f'best of {args["repeat"]} runs')
+    for entry_point, (module_name, disallowed) in ENTRY_POINTS.items():
+        runs = [time_import(module_name) for i in range(max(1, args['repeat']))]
+        startup_time, import_times = min(runs, key=lambda run: run[1][module_name])
+        import_time = import_times[module_name] / 1e6
+        packages = {name: cumulative_time for name, cumulative_time in import_times.items()
+                    if '.' not in name and name not in ['exporter', module_name]}
+        top_packages = sorted(packages, key=packages.get, reverse=True)[:TOP_PACKAGES]
+        imported = [package for package in disallowed if package in import_times]
+        results[entry_point] = {'module': module_name,
+                                'import_time': import_time,
+                                'startup_time': startup_time,
+                                'top_packages': {name: packages[name] / 1e6 for name in top_packages},
+                                'disallowed_imports': imported}
+        print(f'{entry_point:<28} {import_time * 1000:8.1f} ms import {startup_time * 1000:8.1f} ms startup   ' +
+              ', '.join([f'{name} {packages[name] / 1000:.1f} ms' for name in top_packages]))
+        if imported:
+            failures.append(f'{entry_point} imports {", ".join(imported)} at startup.')
+        if args['max_time'] is not None and import_time * 1000 > args['max_time']:
+            failures.append(f'{entry_point} takes {import_time * 1000:.1f} ms to import, which exceeds '
+                            f'{args["max_time"]} ms.')
+    if args['output']:
+        with open(args['output'], 'w') as output_file:
+            json.dump({'parameters': args, 'results': results, 'failures': failures}, output_file, indent=4)
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from pyteomics import mgf
+
+# Add the package root to the module search path so that benchmarks can be run as scripts from any directory without
+# installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporter.mgf_writer import write_mgf  # noqa: E402
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description='Compare exporter.mgf_writer.write_mgf() with pyteomics.mgf.write().')
+    parser.add_argument('--spectra',
+                        help='Number of MS/MS spectra to write. Defaults to 2000.',
+                        default=2000,
+                        type=int)
+    parser.add_argument('--peaks',
+                        help='Number of fragment peaks per MS/MS spectrum. Defaults to 200.',
+                        default=200,
+                        type=int)
+    parser.add_argument('--repeat',
+                        help='Number of times each writer is run. The fastest run is reported. Defaults to 5.',
+                        default=5,
+                        type=int)
+    parser.add_argument('--seed',
+                        help='Random seed used to generate synthetic spectra. Defaults to 0.',
+                        default=0,
+                        type=int)
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def get_synthetic_spectra(n_spectra, n_peaks, seed=0):
+    """
+    Generate synthetic MS/MS spectra in the format returned by exporter.mgf.get_mgf_spectrum().
+
+    :param n_spectra: Number of MS/MS spectra.
+    :type n_spectra: int
+    :param n_peaks: Number of fragment peaks per MS/MS spectrum.
+    :type n_peaks: int
+    :param seed: Random seed.
+    :type seed: int
+    :return: pyteomics MGF spectrum dicts.
+    :rtype: list[dict]
+    """
+    rng = np.random.default_rng(seed)
+    return [{'m/z array': np.sort(rng.uniform(50, 2000, n_peaks)),
+             'intensity array': rng.uniform(0, 1e6, n_peaks),
+             'params': {'FEATURE_ID': index + 1,
+                        'PEPMASS': rng.uniform(300, 1500),
+                        'ION_MOBILITY': rng.uniform(0.6, 1.6),
+                        'SCANS': 1,
+                        'MSLEVEL': 2}}
+            for index in range(n_spectra)]
+
+
+def time_writer(writer, spectra, output, repeat):
+    """
+    Time a writer function.
+
+    :param writer: Function taking a list of spectra and an output path.
+    :type writer: collections.abc.Callable
+    :param spectra: pyteomics MGF spectrum dicts.
+    :type spectra: list[dict]
+    :param output: Path to the output MGF file.
+    :type output: str
+    :param repeat: Number of runs.
+    :type repeat: int
+    :return: Fastest run time in seconds.
+    :rtype: float
+    """
+    times = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        writer(spectra, output)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def main():
+    """
+    Run benchmark.
+    """
+    args = get_args()
+    spectra = get_synthetic_spectra(args['spectra'], args['peaks'], args['seed'])
+    n_peaks = args['spectra'] * args['peaks']
+    writers = {'pyteomics': lambda spectra, output: mgf.write(spectra, output=output, file_mode='w'),
+               'native': write_mgf,
+               'native (mz 4dp, intensity 1dp)': lambda spectra, output: write_mgf(spectra, output, 4, 1)}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = {}
+        for name, writer in writers.items():
+            output = os.path.join(tmpdir, f'{len(results)}.mgf')
+            results[name] = (time_writer(writer, spectra, output, args['repeat']), output)
+        with open(results['pyteomics'][1], 'rb') as pyteomics_file, open(results['native'][1], 'rb') as native_file:
+            identical = pyteomics_file.read() == native_file.read()
+        baseline = results['pyteomics'][0]
+        print(f'{args["spectra"]} spectra, {n_peaks} peaks, best of {args["repeat"]} runs')
+        for name, (seconds, output) in results.items():
+            print(f'{name:<32} {seconds:8.3f} s {n_peaks / seconds / 1e6:8.2f} M peaks/s {baseline / seconds:6.2f}x '
+                  f'{os.path.getsize(output) / 1024 ** 2:8.1f} MB')
+        print(f'native output identical to pyteomics: {identical}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,34 @@
-import os
-import copy
-import argparse
-from scilslab import LocalSession
-import numpy as np
-import pandas as pd
-from pyteomics import mgf
-from psims.mzml import MzMLWriter
-from PySide6.QtCore import QCoreApplication, QMetaObject, QRect
-from PySide6.QtWidgets import QCheckBox, QComboBox, QLabel, QLineEdit, QPushButton, QRadioButton, QSpinBox, QWidget
-
-from exporter.iprmpasef_exporter_template import *
-from exporter.mgf import *
-from exporter.mzml import *
+import importlib
+import importlib.util
+
+
+# Modules whose public names are available from the exporter package, in order of precedence. They are only imported
+# when one of their names is first accessed, so command line entry points do not import PySide6, psims, or scilslab
+# unless they use them.
+LAZY_MODULES = ['exporter.spectra', 'exporter.mzml', 'exporter.mgf', 'exporter.iprmpasef_exporter_template']
+# Library API of the exporter package and the module defining each name.
+API = {'MS2Spectra': 'exporter.spectra',
+       'extract_spectra': 'exporter.spectra',
+       'write_spectra': 'exporter.export'}
+__all__ = list(API)
+
+
+def __getattr__(name):
+    """
+    Get a name from the library API or from one of the modules in LAZY_MODULES, importing modules in order of precedence
+    until the name is found. Submodules of the exporter package are imported by the import system as usual.
+
+    :param name: Attribute name.
+    :type name: str
+    :return: Attribute value.
+    :rtype: object
+    """
+    if name.startswith('_') or importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    for module_name in [API[name]] if name in API else LAZY_MODULES:
+        module = importlib.import_module(module_name)
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,191 @@
+import os
+import io
+import json
+import shutil
+import tarfile
+import zipfile
+from collections import deque
+
+
+# Archive formats supported for per-window output. "sharded" writes individual files into numbered subdirectories.
+ARCHIVE_FORMATS = ['zip', 'tar', 'sharded']
+# Number of decimal places used for precursor m/z and 1/K0 values in archive member names.
+MEMBER_NAME_PRECISION = 4
+# Maximum number of per-window files written to each subdirectory of a sharded directory layout.
+SHARD_SIZE = 1000
+# Name of the manifest mapping isolation windows to archive member names.
+MANIFEST_NAME = 'manifest.json'
+# Modification time used for all zip archive members so that archives are reproducible.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def get_archive_path(slx, outdir, extension, archive_format):
+    """
+    Get the path to the archive (or sharded directory) containing the individual files for each precursor window.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the archive.
+    :type slx: str
+    :param outdir: Path to folder in which to write the archive.
+    :type outdir: str
+    :param extension: File extension of the archive members without the leading period (i.e. "mgf" or "mzML").
+    :type extension: str
+    :param archive_format: Archive format, either "zip", "tar", or "sharded".
+    :type archive_format: str
+    :return: Path to the archive file or sharded directory.
+    :rtype: str
+    """
+    archive_name = f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_{extension}'
+    if archive_format in ['zip', 'tar']:
+        archive_name += f'.{archive_format}'
+    return os.path.join(outdir, archive_name)
+
+
+def get_member_name(slx, scan_number, selected_ion_mz, selected_ion_mobility, extension):
+    """
+    Get the deterministic name of the archive member containing the MS/MS spectrum from a single isolation window.
+    Precursor m/z and 1/K0 values are written with a fixed number of decimal places, and the scan number keeps member
+    names unique and sorted in export order.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the member.
+    :type slx: str
+    :param scan_number: Scan number of the MS/MS spectrum.
+    :type scan_number: int
+    :param selected_ion_mz: Precursor m/z of the MS/MS spectrum.
+    :type selected_ion_mz: float
+    :param selected_ion_mobility: Precursor 1/K0 of the MS/MS spectrum.
+    :type selected_ion_mobility: float
+    :param extension: File extension without the leading period (i.e. "mgf" or "mzML").
+    :type extension: str
+    :return: Member name.
+    :rtype: str
+    """
+    return f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_{scan_number:06d}' \
+           f'_mz{selected_ion_mz:.{MEMBER_NAME_PRECISION}f}' \
+           f'_ook0{selected_ion_mobility:.{MEMBER_NAME_PRECISION}f}.{extension}'
+
+
+class WindowArchive(object):
+    """
+    Write the individual files for each precursor window into a single zip or tar archive or into a sharded directory
+    layout instead of creating one file per window in the output directory. A manifest mapping each isolation window to
+    its member name is added when the archive is closed.
+
+    Windows are registered with add_window() when they are submitted for writing and their file contents are added
+    with write() in the same order, which allows file contents to be generated in worker processes.
+
+    :param path: Path to the archive file or sharded directory returned by get_archive_path().
+    :type path: str
+    :param archive_format: Archive format, either "zip", "tar", or "sharded".
+    :type archive_format: str
+    :param slx: Path to the input SCiLS Lab *.slx file used to name archive members.
+    :type slx: str
+    :param extension: File extension of the archive members without the leading period (i.e. "mgf" or "mzML").
+    :type extension: str
+    """
+    def __init__(self, path, archive_format, slx, extension):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unknown archive format "{archive_format}". Expected one of {ARCHIVE_FORMATS}.')
+        self.path = path
+        self.archive_format = archive_format
+        self.slx = slx
+        self.extension = extension
+        self.manifest = []
+        self._pending = deque()
+        self._archive = None
+
+    def open(self):
+        """
+        Create the archive file or sharded directory.
+        """
+        if self.archive_format == 'zip':
+            # Members are stored without compression. mzML binary data arrays are already compressed and storing
+            # members keeps archiving faster than writing individual files.
+            self._archive = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_STORED)
+        elif self.archive_format == 'tar':
+            self._archive = tarfile.open(self.path, 'w')
+        else:
+            os.makedirs(self.path, exist_ok=True)
+
+    def add_window(self, scan):
+        """
+        Register the next isolation window to be written and add it to the manifest.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :return: Member name of the isolation window within the archive.
+        :rtype: str
+        """
+        member_name = get_member_name(self.slx, scan['scan_number'], scan['selected_ion_mz'],
+                                      scan['selected_ion_mobility'], self.extension)
+        if self.archive_format == 'sharded':
+            member_name = f'{(scan["scan_number"] - 1) // SHARD_SIZE:04d}/{member_name}'
+        self.manifest.append({'scan_number': int(scan['scan_number']),
+                              'isolation_window': str(scan['isolation_window']),
+                              'selected_ion_mz': float(scan['selected_ion_mz']),
+                              'selected_ion_mobility': float(scan['selected_ion_mobility']),
+                              'member': member_name})
+        self._pending.append(member_name)
+        return member_name
+
+    def write(self, data):
+        """
+        Add the file contents of the earliest registered isolation window that has not been written yet.
+
+        :param data: File contents.
+        :type data: bytes
+        """
+        self._write_member(self._pending.popleft(), data)
+
+    def _write_member(self, member_name, data):
+        """
+        Add a member to the archive or write it to the sharded directory.
+
+        :param member_name: Member name.
+        :type member_name: str
+        :param data: File contents.
+        :type data: bytes
+        """
+        if self.archive_format == 'zip':
+            self._archive.writestr(zipfile.ZipInfo(member_name, date_time=ZIP_DATE_TIME), data)
+        elif self.archive_format == 'tar':
+            tar_info = tarfile.TarInfo(member_name)
+            tar_info.size = len(data)
+            self._archive.addfile(tar_info, io.BytesIO(data))
+        else:
+            path = os.path.join(self.path, *member_name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as member_file:
+                member_file.write(data)
+
+    def close(self):
+        """
+        Add the manifest and close the archive.
+        """
+        manifest = {'format': self.extension,
+                    'archive_format': self.archive_format,
+                    'windows': self.manifest}
+        self._write_member(MANIFEST_NAME, json.dumps(manifest, indent=4).encode())
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def abort(self):
+        """
+        Stop writing and remove the archive file or sharded directory.
+        """
+        try:
+            if self._archive is not None:
+                self._archive.close()
+        except Exception:
+            # The archive is removed below regardless of whether it could be closed cleanly.
+            pass
+        finally:
+            self._archive = None
+            self._pending.clear()
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path, ignore_errors=True)
+            elif os.path.isfile(self.path):
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
@@ -0,0 +1,247 @@
+from exporter.mzml_options import DEFAULT_COMPRESSION_LEVEL, encoding_type
+from exporter.archive import ARCHIVE_FORMATS
+from exporter.profiling import PROFILE_MODES
+from exporter.colocalization import COLOCALIZATION_METHODS
+from exporter.fragment_filters import FRAGMENT_FILTERS, get_fragment_filters
+
+
+# Polarity command line parameter values and the corresponding polarity used for mzML export.
+POLARITIES = {'positive': '+', 'negative': '-'}
+
+
+def add_export_arguments(parser, file_type=None):
+    """
+    Add the general command line parameters shared by the iprmpasef_to_mgf, iprmpasef_to_mzml, and iprmpasef_export
+    commands.
+
+    :param parser: Command line parser.
+    :type parser: argparse.ArgumentParser
+    :param file_type: File type written by the command (i.e. "MGF" or "mzML") used in parameter descriptions. If None,
+        parameters are described for multiple export formats.
+    :type file_type: str | None
+    """
+    files = f'{file_type} files' if file_type is not None else 'files'
+    per_format = '' if file_type is not None else ' per export format'
+    single_file = f'a single {file_type} file' if file_type is not None else 'a single file per export format'
+    parser.add_argument('--scils',
+                        help='Path to SCiLS .slx file.',
+                        required=True,
+                        type=str)
+    parser.add_argument('--outdir',
+                        help='Output directory.',
+                        default='',
+                        type=str)
+    parser.add_argument('--feature_list_id',
+                        help='UUID for the MS1 feature table of interest. If unknown, please run the '
+                             '"get_feature_lists" command.',
+                        required=True,
+                        type=str)
+    parser.add_argument('--intensity_column_name',
+                        help='Name of the column from the feature table to use intensity values from. If unknown, '
+                             'please run the "get_intensity_column_names" command. Multiple column names can be given '
+                             'to export spectra for each column in a single pass, in which case the files for each '
+                             'column are written to a subdirectory of the output directory named after the column.',
+                        nargs='+',
+                        required=True,
+                        type=str)
+    parser.add_argument('--export_single_file',
+                        help=f'If this flag is used, create {single_file} containing all MS/MS spectra. Otherwise, '
+                             f'create individual {files} for each precursor window.',
+                        action='store_true')
+    parser.add_argument('--get_precursor_from_isolation_window',
+                        help='If this flag is used, populate the precursor m/z and 1/K0 values from the isolation '
+                             'window that was defined in the iprm-PASEF timsControl method.',
+                        action='store_true')
+    parser.add_argument('--relative_intensity_threshold',
+                        help='Fragments below this percentage of the total ion count (TIC) intensity are filtered and '
+                             'removed from the final MS/MS spectrum for a given precursor. '
+                             'Example: relative_intensity_threshold == 1 is equal to 1%% of the TIC as the cutoff. '
+                             'Defaults to 1 (i.e. 1%%).',
+                        metavar='[0-100]',
+                        default=1,
+                        choices=range(0, 101),
+                        type=int)
+    parser.add_argument('--colocalization_threshold',
+                        help='If used, remove fragments whose ion image is not spatially co-localized with the summed '
+                             'ion image of the precursors in their isolation window before relative intensity '
+                             'filtering. Fragments with a Pearson or cosine correlation below this threshold (-1 to 1) '
+                             'are removed. Ion images are fetched from SCiLS Lab, which can take a long time for large '
+                             'feature lists. Disabled by default.',
+                        default=None,
+                        type=float)
+    parser.add_argument('--colocalization_method',
+                        help='Correlation measure used to score co-localization with --colocalization_threshold, '
+                             'either Pearson (\"pearson\") or cosine (\"cosine\") correlation. Defaults to '
+                             '\"pearson\".',
+                        default='pearson',
+                        type=str,
+                        choices=COLOCALIZATION_METHODS)
+    parser.add_argument('--precursor_exclusion',
+                        help='If used, remove fragments within this m/z tolerance (in Da) of the precursor m/z of '
+                             'their isolation window, i.e. unfragmented precursor signal. Disabled by default.',
+                        default=None,
+                        type=float)
+    parser.add_argument('--min_intensity',
+                        help='If used, remove fragments with an intensity below this absolute value. Disabled by '
+                             'default.',
+                        default=None,
+                        type=float)
+    parser.add_argument('--min_signal_to_noise',
+                        help='If used, remove fragments whose intensity is below this multiple of the noise level of '
+                             'their isolation window, which is estimated as the median intensity of all fragments in '
+                             'the window. Disabled by default.',
+                        default=None,
+                        type=float)
+    parser.add_argument('--top_n',
+                        help='If used, keep only this number of the most intense fragments in each isolation window '
+                             'after all other fragment filters are applied. Disabled by default.',
+                        default=None,
+                        type=int)
+    parser.add_argument('--workers',
+                        help=f'Number of worker processes used to write individual {files} for each precursor window '
+                             f'when --export_single_file is not used. Defaults to 1.',
+                        default=1,
+                        type=int)
+    parser.add_argument('--write_queue_size',
+                        help='If greater than 0, write single files (--export_single_file) and archives (--archive) '
+                             'in a background thread while the next spectra are formatted and encoded, queueing at '
+                             'most this number of spectra. Useful when writing to slow disks or network shares. Output '
+                             'files are identical. Defaults to 0 (disabled).',
+                        default=0,
+                        type=int)
+    parser.add_argument('--archive',
+                        help=f'Write the individual {files} for each precursor window into a single zip (\"zip\") or '
+                             f'tar (\"tar\") archive or into a sharded directory layout (\"sharded\"){per_format} '
+                             f'instead of the output directory when --export_single_file is not used. Files are named '
+                             f'using the scan number and the precursor m/z and 1/K0 rounded to 4 decimal places, and a '
+                             f'manifest.json file mapping each isolation window to its file is included.',
+                        default=None,
+                        type=str,
+                        choices=ARCHIVE_FORMATS)
+    parser.add_argument('--incremental',
+                        help=f'If this flag is used, only rewrite the individual {files} of precursor windows that '
+                             f'changed since the previous export to the same output directory and remove the files of '
+                             f'windows that no longer exist. A manifest of content hashes for each window is written '
+                             f'to the output directory{per_format}. Cannot be used with --export_single_file or '
+                             f'--archive.',
+                        action='store_true')
+    parser.add_argument('--profile',
+                        help='Write a JSON report containing the wall time, CPU time, peak memory usage, and number of '
+                             'items processed for each export stage and the slowest precursor windows to the output '
+                             'directory. Use \"--profile cprofile\" or \"--profile pyinstrument\" to additionally '
+                             'write a cProfile (*.prof) or pyinstrument (*.html) profile. pyinstrument profiles '
+                             'require pyinstrument to be installed.',
+                        nargs='?',
+                        const='stages',
+                        default=None,
+                        type=str,
+                        choices=PROFILE_MODES)
+    parser.add_argument('--no_cache',
+                        help='If this flag is used, always fetch the feature table from SCiLS Lab instead of reading it '
+                             'from the on-disk feature table cache.',
+                        action='store_true')
+    parser.add_argument('--float32',
+                        help='If this flag is used, store the m/z, 1/K0, and intensity columns of the feature table as '
+                             '32-bit floats to reduce memory usage. Values are rounded to approximately 7 significant '
+                             'digits.',
+                        action='store_true')
+
+
+def add_mgf_arguments(parser, file_type=None):
+    """
+    Add the MGF command line parameters.
+
+    :param parser: Command line parser.
+    :type parser: argparse.ArgumentParser
+    :param file_type: File type written by the command as described in add_export_arguments().
+    :type file_type: str | None
+    """
+    in_mgf_files = '' if file_type is not None else ' in MGF files'
+    parser.add_argument('--mz_precision',
+                        help=f'Number of decimal places used for fragment m/z values{in_mgf_files}. Defaults to the '
+                             f'shortest representation of each value that round trips.',
+                        default=None,
+                        type=int)
+    parser.add_argument('--intensity_precision',
+                        help=f'Number of decimal places used for fragment intensity values{in_mgf_files}. Defaults to '
+                             f'the shortest representation of each value that round trips.',
+                        default=None,
+                        type=int)
+
+
+def add_mzml_arguments(parser, file_type=None):
+    """
+    Add the mzML command line parameters. The polarity is required if the command only writes mzML files.
+
+    :param parser: Command line parser.
+    :type parser: argparse.ArgumentParser
+    :param file_type: File type written by the command as described in add_export_arguments().
+    :type file_type: str | None
+    """
+    parser.add_argument('--polarity',
+                        help='Polarity of the spectra in the dataset. Either "positive" or "negative".' +
+                             (' Required if mzML is selected as an export format.' if file_type is None else ''),
+                        choices=list(POLARITIES),
+                        required=file_type is not None,
+                        default=None,
+                        type=str)
+    parser.add_argument('--barebones_metadata',
+                        help='Only use basic mzML metadata. Use if downstream data analysis tools throw errors with '
+                             'descriptive CV terms.',
+                        action='store_true')
+    parser.add_argument('--mz_encoding',
+                        help='Choose encoding for m/z array: 32-bit (\"32\"), 64-bit (\"64\"), or MS-Numpress linear '
+                             'prediction (\"numpress_linear\"). Defaults to 64-bit.',
+                        default=64,
+                        type=encoding_type,
+                        choices=[32, 64, 'numpress_linear'])
+    parser.add_argument('--intensity_encoding',
+                        help='Choose encoding for intensity array: 32-bit (\"32\"), 64-bit (\"64\"), MS-Numpress short '
+                             'logged float (\"numpress_slof\"), or MS-Numpress positive integer (\"numpress_pic\"). '
+                             'Defaults to 64-bit.',
+                        default=64,
+                        type=encoding_type,
+                        choices=[32, 64, 'numpress_slof', 'numpress_pic'])
+    parser.add_argument('--compression',
+                        help='Choose between ZLIB compression (\"zlib\") or no compression (\"none\"). ZLIB '
+                             'compression is applied after MS-Numpress encoding. Defaults to \"zlib\".',
+                        default='zlib',
+                        type=str,
+                        choices=['zlib', 'none'])
+    parser.add_argument('--compression_level',
+                        help='ZLIB compression level from 0 (fastest) to 9 (smallest files). Defaults to 6.',
+                        default=DEFAULT_COMPRESSION_LEVEL,
+                        type=int,
+                        choices=range(0, 10))
+    parser.add_argument('--encoding_threads',
+                        help='Number of threads used to compress and encode mzML binary data arrays while spectra are '
+                             'written when --export_single_file is used. Defaults to 1.',
+                        default=1,
+                        type=int)
+    parser.add_argument('--mzmlb',
+                        help='If this flag is used, write mzMLb files, which store binary data arrays in HDF5 datasets '
+                             'compressed using --compression and --compression_level, instead of mzML files. Requires '
+                             'h5py. Cannot be used with MS-Numpress encoding.',
+                        action='store_true')
+
+
+def get_export_parameters(args):
+    """
+    Convert command line parameters parsed using add_export_arguments(), add_mgf_arguments(), and add_mzml_arguments()
+    to parameters for exporter.export.convert_iprmpasef_feature_list().
+
+    :param args: Arguments with default or user specified values.
+    :type args: dict
+    :return: Parameters for exporter.export.convert_iprmpasef_feature_list() indexed by parameter name.
+    :rtype: dict
+    """
+    parameters = {key: value for key, value in args.items()
+                  if key not in ['scils', 'export_format', 'no_cache'] + list(FRAGMENT_FILTERS)}
+    parameters['slx'] = args['scils']
+    if 'export_format' in args:
+        parameters['export_formats'] = args['export_format']
+    parameters['use_cache'] = not args['no_cache']
+    parameters['fragment_filters'] = get_fragment_filters(args)
+    if parameters.get('polarity') is not None:
+        parameters['polarity'] = POLARITIES[parameters['polarity']]
+    return parameters
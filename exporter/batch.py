@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from exporter.session import ScilsSession
+from exporter.export import EXPORT_FORMATS, convert_iprmpasef_feature_list
+from exporter.fragment_filters import get_fragment_filters
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Default values for optional job parameters. Keys match the command line parameters of iprmpasef_to_mgf and
+# iprmpasef_to_mzml.
+JOB_DEFAULTS = {'outdir': '',
+                'export_single_file': False,
+                'get_precursor_from_isolation_window': False,
+                'relative_intensity_threshold': 1,
+                'workers': 1,
+                'no_cache': False,
+                'mz_precision': None,
+                'intensity_precision': None,
+                'barebones_metadata': False,
+                'mz_encoding': 64,
+                'intensity_encoding': 64,
+                'compression': 'zlib',
+                'compression_level': 6,
+                'encoding_threads': 1,
+                'mzmlb': False,
+                'archive': None,
+                'profile': None,
+                'incremental': False,
+                'float32': False,
+                'colocalization_threshold': None,
+                'colocalization_method': 'pearson',
+                'precursor_exclusion': None,
+                'min_intensity': None,
+                'min_signal_to_noise': None,
+                'top_n': None,
+                'write_queue_size': 0}
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser()
+    # General parameters
+    parser.add_argument('--manifest',
+                        help='Path to a JSON or YAML job manifest listing the SCiLS .slx file, feature list ID, '
+                             'intensity column name, export format(s) ("mgf" and/or "mzml"), and any optional export '
+                             'parameters for each job.',
+                        required=True,
+                        type=str)
+    parser.add_argument('--concurrency',
+                        help='Maximum number of SCiLS .slx files to export concurrently. Overrides the "concurrency" '
+                             'value in the manifest. Defaults to 1.',
+                        default=None,
+                        type=int)
+    parser.add_argument('--report',
+                        help='Path to the JSON summary report. Defaults to the manifest path with a "_report.json" '
+                             'suffix.',
+                        default='',
+                        type=str)
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def load_manifest(manifest):
+    """
+    Load a batch job manifest. The manifest is either a list of jobs or a dict containing a "jobs" list and optional
+    "concurrency" and "defaults" keys. Values in "defaults" are applied to every job that does not specify them.
+
+    :param manifest: Path to a *.json, *.yaml, or *.yml job manifest.
+    :type manifest: str
+    :return: Tuple containing the list of job dicts and the concurrency specified in the manifest (or None).
+    :rtype: tuple[list[dict], int | None]
+    """
+    with open(manifest, 'r') as manifest_file:
+        if os.path.splitext(manifest)[1].lower() in ['.yaml', '.yml']:
+            if yaml is None:
+                raise ImportError('PyYAML is required to read YAML job manifests. Install PyYAML or use a JSON '
+                                  'manifest.')
+            contents = yaml.safe_load(manifest_file)
+        else:
+            contents = json.load(manifest_file)
+    if isinstance(contents, list):
+        contents = {'jobs': contents}
+    if not isinstance(contents, dict) or not isinstance(contents.get('jobs'), list):
+        raise ValueError(f'Job manifest {manifest} must be a list of jobs or contain a "jobs" list.')
+    defaults = contents.get('defaults', {})
+    jobs = [{**defaults, **job} for job in contents['jobs']]
+    return jobs, contents.get('concurrency')
+
+
+def run_job(job, session):
+    """
+    Run a single export job using exporter.export.convert_iprmpasef_feature_list().
+
+    :param job: Job dict containing scils, feature_list_id, intensity_column_name, and format keys and any optional
+        export parameters. The intensity column name and format are either a single value or a list of values.
+    :type job: dict
+    :param session: Open SCiLS Lab session for the job's *.slx file.
+    :type session: exporter.session.ScilsSession
+    """
+    for key in ['scils', 'feature_list_id', 'intensity_column_name', 'format']:
+        if key not in job:
+            raise ValueError(f'Job is missing required parameter "{key}".')
+    args = {**JOB_DEFAULTS, **job}
+    export_formats = args['format'] if isinstance(args['format'], list) else [args['format']]
+    export_formats = [export_format.lower() for export_format in export_formats]
+    for export_format in export_formats:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format "{export_format}". Expected one of {EXPORT_FORMATS}.')
+    polarity = None
+    if 'mzml' in export_formats:
+        if args.get('polarity') not in ['positive', 'negative']:
+            raise ValueError('mzML jobs require a polarity of either "positive" or "negative".')
+        polarity = '+' if args['polarity'] == 'positive' else '-'
+    convert_iprmpasef_feature_list(slx=session,
+                                   outdir=args['outdir'],
+                                   feature_list_id=args['feature_list_id'],
+                                   intensity_column_name=args['intensity_column_name'],
+                                   export_formats=export_formats,
+                                   export_single_file=args['export_single_file'],
+                                   get_precursor_from_isolation_window=args['get_precursor_from_isolation_window'],
+                                   relative_intensity_threshold=args['relative_intensity_threshold'],
+                                   workers=args['workers'],
+                                   use_cache=not args['no_cache'],
+                                   mz_precision=args['mz_precision'],
+                                   intensity_precision=args['intensity_precision'],
+                                   polarity=polarity,
+                                   barebones_metadata=args['barebones_metadata'],
+                                   mz_encoding=args['mz_encoding'],
+                                   intensity_encoding=args['intensity_encoding'],
+                                   compression=args['compression'],
+                                   compression_level=args['compression_level'],
+                                   encoding_threads=args['encoding_threads'],
+                                   mzmlb=args['mzmlb'],
+                                   archive=args['archive'],
+                                   profile=args['profile'],
+                                   incremental=args['incremental'],
+                                   float32=args['float32'],
+                                   colocalization_threshold=args['colocalization_threshold'],
+                                   colocalization_method=args['colocalization_method'],
+                                   fragment_filters=get_fragment_filters(args),
+                                   write_queue_size=args['write_queue_size'])
+
+
+def run_job_with_result(job, session):
+    """
+    Run a single export job using run_job() and record its status, error message, and duration. Exceptions raised by
+    the job are recorded instead of being raised, so a failed job does not stop the remaining jobs.
+
+    :param job: Job dict as described in run_job().
+    :type job: dict
+    :param session: Open SCiLS Lab session for the job's *.slx file.
+    :type session: exporter.session.ScilsSession
+    :return: Job result dict containing the job, status ("success" or "failed"), error, and duration keys.
+    :rtype: dict
+    """
+    start_time = time.perf_counter()
+    try:
+        run_job(job, session)
+        result = {'status': 'success', 'error': None}
+    except Exception as exception:
+        result = {'status': 'failed',
+                  'error': ''.join(traceback.format_exception_only(type(exception), exception)).strip()}
+    result['duration'] = time.perf_counter() - start_time
+    return {'job': job, **result}
+
+
+def run_dataset_jobs(slx, jobs):
+    """
+    Run all jobs for a single *.slx file sequentially using one shared SCiLS Lab session. Failed jobs are recorded and
+    do not stop the remaining jobs.
+
+    :param slx: Path to the input SCiLS Lab *.slx file.
+    :type slx: str
+    :param jobs: List of (job index, job dict) tuples for this *.slx file.
+    :type jobs: list[tuple[int, dict]]
+    :return: List of (job index, job result dict) tuples.
+    :rtype: list[tuple[int, dict]]
+    """
+    results = []
+    with ScilsSession(slx) as session:
+        for index, job in jobs:
+            results.append((index, run_job_with_result(job, session)))
+    return results
+
+
+def run_batch(jobs, concurrency=1):
+    """
+    Run a batch of export jobs. Jobs for the same *.slx file share a single SCiLS Lab session and run sequentially,
+    while jobs for different *.slx files run concurrently in up to "concurrency" threads.
+
+    :param jobs: List of job dicts.
+    :type jobs: list[dict]
+    :param concurrency: Maximum number of *.slx files to process concurrently.
+    :type concurrency: int
+    :return: Summary report containing the number of succeeded and failed jobs and results for each job in manifest
+        order.
+    :rtype: dict
+    """
+    datasets = {}
+    results = [None] * len(jobs)
+    for index, job in enumerate(jobs):
+        if 'scils' not in job:
+            results[index] = {'job': job,
+                              'status': 'failed',
+                              'error': 'ValueError: Job is missing required parameter "scils".',
+                              'duration': 0.0}
+            continue
+        # Jobs are grouped by absolute path, so different relative or absolute paths to the same *.slx file share a
+        # single session.
+        datasets.setdefault(os.path.abspath(job['scils']), []).append((index, job))
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run_dataset_jobs, slx, dataset_jobs) for slx, dataset_jobs in datasets.items()]
+        for future in futures:
+            for index, result in future.result():
+                results[index] = result
+    return {'succeeded': sum(result['status'] == 'success' for result in results),
+            'failed': sum(result['status'] == 'failed' for result in results),
+            'duration': time.perf_counter() - start_time,
+            'jobs': results}
+
+
+def main():
+    """
+    Run workflow.
+    """
+    args = get_args()
+    jobs, concurrency = load_manifest(args['manifest'])
+    if args['concurrency'] is not None:
+        concurrency = args['concurrency']
+    if concurrency is None:
+        concurrency = 1
+    if args['report'] == '':
+        args['report'] = f'{os.path.splitext(args["manifest"])[0]}_report.json'
+    report = run_batch(jobs, concurrency)
+    with open(args['report'], 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+    for index, result in enumerate(report['jobs']):
+        print(f'Job {index + 1}: {result["status"]}' + (f' ({result["error"]})' if result['error'] else ''))
+    print(f'{report["succeeded"]} job(s) succeeded and {report["failed"]} job(s) failed. Summary report written to '
+          f'{args["report"]}.')
+    if report['failed']:
+        sys.exit(1)
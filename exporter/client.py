@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import argparse
+import urllib.error
+import urllib.request
+
+
+# Default host and port of the export server. Identical to exporter.server.DEFAULT_HOST and
+# exporter.server.DEFAULT_PORT, which are not imported so that the client starts without importing pandas.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# HTTP header containing the access token of the export server. Requests without the token are rejected.
+TOKEN_HEADER = 'X-Exporter-Token'
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser()
+    # General parameters
+    parser.add_argument('--host',
+                        help=f'Host name or IP address of the export server. Defaults to {DEFAULT_HOST}.',
+                        default=DEFAULT_HOST,
+                        type=str)
+    parser.add_argument('--port',
+                        help=f'Port of the export server. Defaults to {DEFAULT_PORT}.',
+                        default=DEFAULT_PORT,
+                        type=int)
+    parser.add_argument('--token_file',
+                        help='Path to the file containing the access token written by the export server. Defaults to '
+                             'the token file of the server listening on --port.',
+                        default=None,
+                        type=str)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status',
+                        help='Show the SCiLS .slx files kept open by the export server.')
+    feature_lists = commands.add_parser('feature_lists',
+                                        help='List the feature lists in a SCiLS .slx file.')
+    feature_lists.add_argument('--scils',
+                               help='Path to SCiLS .slx file.',
+                               required=True,
+                               type=str)
+    intensity_columns = commands.add_parser('intensity_columns',
+                                            help='List the column names of a feature table.')
+    intensity_columns.add_argument('--scils',
+                                   help='Path to SCiLS .slx file.',
+                                   required=True,
+                                   type=str)
+    intensity_columns.add_argument('--feature_list_id',
+                                   help='UUID for the MS1 feature table of interest.',
+                                   required=True,
+                                   type=str)
+    intensity_columns.add_argument('--no_cache',
+                                   help='If this flag is used, fetch the feature table from SCiLS Lab instead of '
+                                        'reading the column names from the feature table cache.',
+                                   action='store_true')
+    export = commands.add_parser('export',
+                                 help='Run an export job.')
+    export.add_argument('--job',
+                        help='Path to a JSON file containing a single job or a JSON object as used in iprmpasef_batch '
+                             'job manifests.',
+                        required=True,
+                        type=str)
+    commands.add_parser('shutdown',
+                        help='Stop the export server after running requests are finished.')
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def get_token_path(port=DEFAULT_PORT):
+    """
+    Get the default path of the file containing the access token of the export server listening on a port. The file is
+    stored in the user's local application data directory (or ~/.cache), which other users cannot read.
+
+    :param port: Port of the export server.
+    :type port: int
+    :return: Path to the token file.
+    :rtype: str
+    """
+    return os.path.join(os.environ.get('LOCALAPPDATA', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'iprm-PASEF_Exporter',
+                        f'server_{port}.token')
+
+
+def read_token(token_path):
+    """
+    Read the access token of the export server.
+
+    :param token_path: Path to the token file written by the export server.
+    :type token_path: str
+    :return: Access token.
+    :rtype: str
+    """
+    with open(token_path, 'r') as token_file:
+        return token_file.read().strip()
+
+
+def send_request(command, request=None, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+    """
+    Send a request to the export server. The status command is sent as a GET request, while all other commands are
+    sent as POST requests with a JSON body.
+
+    :param command: Request command, either "status", "feature_lists", "intensity_columns", "export", or "shutdown".
+    :type command: str
+    :param request: Request parameters.
+    :type request: dict | None
+    :param host: Host name or IP address of the export server.
+    :type host: str
+    :param port: Port of the export server.
+    :type port: int
+    :param token: Access token of the export server. If None, the token is read from get_token_path().
+    :type token: str | None
+    :return: Response containing at least the status and error keys.
+    :rtype: dict
+    """
+    if token is None:
+        token = read_token(get_token_path(port))
+    url = f'http://{host}:{port}/{command}'
+    if command == 'status':
+        http_request = urllib.request.Request(url, headers={TOKEN_HEADER: token})
+    else:
+        http_request = urllib.request.Request(url,
+                                              data=json.dumps(request if request is not None else {}).encode('utf-8'),
+                                              headers={'Content-Type': 'application/json', TOKEN_HEADER: token})
+    try:
+        with urllib.request.urlopen(http_request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as error:
+        # Failed requests still contain a JSON response describing the error.
+        return json.load(error)
+
+
+def load_job(job):
+    """
+    Load an export job from a JSON file or a JSON string.
+
+    :param job: Path to a JSON file or a JSON object.
+    :type job: str
+    :return: Job dict.
+    :rtype: dict
+    """
+    if os.path.isfile(job):
+        with open(job, 'r') as job_file:
+            return json.load(job_file)
+    return json.loads(job)
+
+
+def main():
+    """
+    Run workflow.
+    """
+    args = get_args()
+    request = {key: value for key, value in args.items()
+               if key not in ['host', 'port', 'token_file', 'command', 'job']}
+    if args['command'] == 'export':
+        request = load_job(args['job'])
+    # Paths are resolved by the client, since the export server may run in a different working directory.
+    for key in ['scils', 'outdir']:
+        if request.get(key):
+            request[key] = os.path.abspath(request[key])
+    token_path = args['token_file'] if args['token_file'] is not None else get_token_path(args['port'])
+    try:
+        token = read_token(token_path)
+    except OSError:
+        print(f'Unable to read the export server access token from {token_path}. Start the export server using the '
+              f'"iprmpasef_server" command or use --token_file.')
+        sys.exit(1)
+    try:
+        response = send_request(args['command'], request, args['host'], args['port'], token)
+    except urllib.error.URLError as error:
+        print(f'Unable to connect to the export server at {args["host"]}:{args["port"]} ({error.reason}). Start it '
+              f'using the "iprmpasef_server" command.')
+        sys.exit(1)
+    if response['status'] != 'success':
+        print(f'Request failed: {response["error"]}')
+        sys.exit(1)
+    if args['command'] == 'status':
+        if not response['sessions']:
+            print('No SCiLS .slx files are open.')
+        for session in response['sessions']:
+            print(f'{session["scils"]}: {"open" if session["open"] else "closed"}, {session["requests"]} running '
+                  f'request(s), idle for {session["idle_time"]:.0f} s')
+    elif args['command'] == 'feature_lists':
+        for feature_list in response['feature_lists']:
+            print(f'{feature_list["id"]}\t{feature_list["name"]}')
+    elif args['command'] == 'intensity_columns':
+        for column in response['columns']:
+            print(column)
+    elif args['command'] == 'export':
+        print(f'Export finished in {response["duration"]:.1f} s.')
@@ -0,0 +1,212 @@
+import os
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from exporter.isolation_window import factorize_isolation_windows
+from exporter.profiling import profile_stage
+
+
+# Correlation measures used to score the spatial co-localization of fragment and precursor ion images.
+COLOCALIZATION_METHODS = ['pearson', 'cosine']
+# Number of ion images requested from SCiLS Lab in a single query.
+IMAGE_BATCH_SIZE = 256
+# Default maximum size of the ion image cache in bytes (1 GB).
+MAX_IMAGE_CACHE_SIZE = 1024 ** 3
+
+
+class IonImageCache(object):
+    """
+    Least recently used cache of ion images keyed by m/z range. Ion images are stored as flattened 32-bit float arrays,
+    with pixels outside of the measured region set to 0. Used by exporter.session.ScilsSession so that ion images are
+    only fetched from SCiLS Lab once per session.
+
+    :param max_size: Maximum size of the cache in bytes. Least recently used ion images are removed once this size is
+        exceeded.
+    :type max_size: int
+    """
+    def __init__(self, max_size=MAX_IMAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._images = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _add(self, key, image):
+        if key in self._images:
+            return
+        self._images[key] = image
+        self.size += image.nbytes
+        while self.size > self.max_size and self._images:
+            self.size -= self._images.popitem(last=False)[1].nbytes
+
+    def get_images(self, dataset_proxy, mz_low, mz_high, batch_size=IMAGE_BATCH_SIZE):
+        """
+        Get ion images for one or more m/z ranges. Ion images that are not cached are fetched from SCiLS Lab in batches
+        of batch_size m/z ranges using dataset_proxy.get_ion_images().
+
+        :param dataset_proxy: Dataset proxy of a SCiLS Lab session.
+        :type dataset_proxy: scilslab.DatasetProxy
+        :param mz_low: Lower bounds of the m/z ranges.
+        :type mz_low: numpy.ndarray
+        :param mz_high: Upper bounds of the m/z ranges.
+        :type mz_high: numpy.ndarray
+        :param batch_size: Maximum number of ion images requested in a single query.
+        :type batch_size: int
+        :return: Ion images with one row per m/z range.
+        :rtype: numpy.ndarray
+        """
+        keys = list(zip(np.asarray(mz_low, dtype=np.float64).tolist(), np.asarray(mz_high, dtype=np.float64).tolist()))
+        images = {}
+        with self._lock:
+            for key in keys:
+                if key in self._images:
+                    self._images.move_to_end(key)
+                    images[key] = self._images[key]
+        missing = list(dict.fromkeys([key for key in keys if key not in images]))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            ion_images = dataset_proxy.get_ion_images([key[0] for key in batch], [key[1] for key in batch])
+            if len(ion_images) != len(batch):
+                raise ValueError(f'Expected {len(batch)} ion images from SCiLS Lab but received {len(ion_images)}.')
+            with self._lock:
+                for key, ion_image in zip(batch, ion_images):
+                    images[key] = np.nan_to_num(np.asarray(ion_image.values, dtype=np.float32).ravel())
+                    self._add(key, images[key])
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([images[key] for key in keys])
+
+    def clear(self):
+        """
+        Remove all cached ion images.
+        """
+        with self._lock:
+            self._images.clear()
+            self.size = 0
+
+
+def get_colocalization_scores(fragment_images, reference_image, method='pearson'):
+    """
+    Score the spatial co-localization of fragment ion images with a reference (precursor) ion image using a single
+    matrix-vector product.
+
+    :param fragment_images: Fragment ion images with one row per fragment.
+    :type fragment_images: numpy.ndarray
+    :param reference_image: Reference ion image.
+    :type reference_image: numpy.ndarray
+    :param method: Correlation measure, either "pearson" or "cosine".
+    :type method: str
+    :return: Score between -1 and 1 for each fragment. Fragments with constant (i.e. empty) ion images are scored 0. If
+        the reference ion image is constant, None is returned.
+    :rtype: numpy.ndarray | None
+    """
+    fragment_images = np.asarray(fragment_images, dtype=np.float64)
+    reference_image = np.asarray(reference_image, dtype=np.float64)
+    if method == 'pearson':
+        fragment_images = fragment_images - fragment_images.mean(axis=1, keepdims=True)
+        reference_image = reference_image - reference_image.mean()
+    elif method != 'cosine':
+        raise ValueError(f'Unknown co-localization method "{method}". Expected one of {COLOCALIZATION_METHODS}.')
+    reference_norm = np.linalg.norm(reference_image)
+    if reference_norm == 0:
+        return None
+    fragment_norms = np.linalg.norm(fragment_images, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = (fragment_images @ reference_image) / (fragment_norms * reference_norm)
+    return np.where(fragment_norms > 0, scores, 0.0)
+
+
+def filter_colocalized_fragments(session, feature_list, threshold, method='pearson', threads=None, profiler=None):
+    """
+    Remove fragment features whose ion image is not co-localized with the ion image of the precursor features in the
+    same isolation window. The reference image of each window is the sum of its precursor ion images. Windows without
+    precursor features or with an empty precursor ion image keep all fragments. Isolation windows are processed in
+    chunks of about IMAGE_BATCH_SIZE features: the ion images of each chunk are fetched using the ion image cache of
+    the session while the windows of the previous chunk are scored in a thread pool, so only the ion images of two
+    chunks are held in memory at once.
+
+    :param session: SCiLS Lab session for the input *.slx file.
+    :type session: exporter.session.ScilsSession
+    :param feature_list: iprm-PASEF feature table containing isolation_window, type, mz_low, and mz_high columns.
+    :type feature_list: pandas.DataFrame
+    :param threshold: Minimum co-localization score (-1 to 1) of fragments that are kept.
+    :type threshold: float
+    :param method: Correlation measure, either "pearson" or "cosine".
+    :type method: str
+    :param threads: Number of threads used to score isolation windows. Defaults to the number of CPUs.
+    :type threads: int | None
+    :param profiler: Export profiler used to time fetching ion images and scoring.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    :return: Feature table without the fragment features below the threshold.
+    :rtype: pandas.DataFrame
+    """
+    if method not in COLOCALIZATION_METHODS:
+        raise ValueError(f'Unknown co-localization method "{method}". Expected one of {COLOCALIZATION_METHODS}.')
+    if not -1 <= threshold <= 1:
+        raise ValueError(f'Co-localization threshold must be between -1 and 1, got {threshold}.')
+    window_codes, isolation_windows = factorize_isolation_windows(feature_list)
+    n_windows = isolation_windows.shape[0]
+    feature_type = feature_list['type'].values
+    is_precursor = (feature_type == 'Precursor') & (window_codes >= 0)
+    is_fragment = (feature_type == 'Fragment') & (window_codes >= 0)
+    # Sort precursor and fragment features by isolation window.
+    rows = np.flatnonzero(is_precursor | is_fragment)
+    rows = rows[np.argsort(window_codes[rows], kind='stable')]
+    window_starts = np.searchsorted(window_codes[rows], np.arange(n_windows + 1))
+    mz_low = feature_list['mz_low'].values
+    mz_high = feature_list['mz_high'].values
+    keep = np.ones(feature_list.shape[0], dtype=bool)
+    threads = threads if threads is not None else os.cpu_count()
+
+    def score_windows(chunk_first, first, last, images, image_indices):
+        # Score each window in [first, last) using the ion images of the chunk starting at window chunk_first.
+        removed = []
+        chunk_start = window_starts[chunk_first]
+        for index in range(first, last):
+            window = slice(window_starts[index] - chunk_start, window_starts[index + 1] - chunk_start)
+            window_rows = rows[window_starts[index]:window_starts[index + 1]]
+            precursors = is_precursor[window_rows]
+            fragments = is_fragment[window_rows]
+            if not precursors.any() or not fragments.any():
+                continue
+            window_indices = image_indices[window]
+            scores = get_colocalization_scores(images[window_indices[fragments]],
+                                               images[window_indices[precursors]].sum(axis=0),
+                                               method)
+            if scores is not None:
+                removed.append(window_rows[fragments][scores < threshold])
+        return removed
+
+    def collect(futures):
+        with profile_stage(profiler, 'scoring', items=len(futures)):
+            for future in futures:
+                for removed in future.result():
+                    keep[removed] = False
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = []
+        first = 0
+        while first < n_windows:
+            # Add windows to the chunk until it contains at least IMAGE_BATCH_SIZE features.
+            last = min(int(np.searchsorted(window_starts, window_starts[first] + IMAGE_BATCH_SIZE)), n_windows)
+            last = max(last, first + 1)
+            chunk_rows = rows[window_starts[first]:window_starts[last]]
+            with profile_stage(profiler, 'fetch_images', items=chunk_rows.size):
+                # Features with identical m/z ranges share a single ion image.
+                mz_ranges, image_indices = np.unique(np.column_stack((mz_low[chunk_rows], mz_high[chunk_rows])),
+                                                     axis=0,
+                                                     return_inverse=True)
+                image_indices = image_indices.ravel()
+                images = session.ion_image_cache.get_images(session.dataset_proxy, mz_ranges[:, 0], mz_ranges[:, 1])
+            # Split the chunk into one task per thread.
+            bounds = np.unique(np.linspace(first, last, min(threads, last - first) + 1).astype(int))
+            futures = [executor.submit(score_windows, first, start, end, images, image_indices)
+                       for start, end in zip(bounds[:-1], bounds[1:])]
+            # Wait for the previous chunk while the current chunk is scored.
+            for previous in pending:
+                collect(previous)
+            pending = [futures]
+            first = last
+        for previous in pending:
+            collect(previous)
+    return feature_list[keep]
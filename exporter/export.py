@@ -0,0 +1,255 @@
+import os
+import argparse
+from exporter.mzml_options import DEFAULT_COMPRESSION_LEVEL
+from exporter.feature_table import to_column_list
+from exporter.spectra import extract_ms2_spectra, write_ms2_spectra, get_intensity_column_outdirs
+from exporter.session import open_session
+from exporter.mgf import MgfSink
+from exporter.profiling import ExportProfiler, get_profile_path, profile_export
+from exporter.arguments import add_export_arguments, add_mgf_arguments, add_mzml_arguments, get_export_parameters
+
+
+# Export formats supported by convert_iprmpasef_feature_list().
+EXPORT_FORMATS = ['mgf', 'mzml']
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser()
+    # General parameters
+    add_export_arguments(parser)
+    parser.add_argument('--export_format',
+                        help='One or more export formats. MS/MS spectra are extracted once and written to all '
+                             'selected formats in a single pass.',
+                        nargs='+',
+                        required=True,
+                        choices=EXPORT_FORMATS,
+                        type=str)
+    # MGF parameters
+    add_mgf_arguments(parser)
+    # mzML parameters
+    add_mzml_arguments(parser)
+
+    arguments = parser.parse_args()
+    if 'mzml' in arguments.export_format and arguments.polarity is None:
+        parser.error('--polarity is required when mzml is selected as an export format.')
+    return vars(arguments)
+
+
+def get_export_sinks(slx, outdirs, export_formats, export_single_file, workers=1, mz_precision=None,
+                     intensity_precision=None, polarity=None, barebones_metadata=False, mz_encoding=64,
+                     intensity_encoding=64, compression='zlib', compression_level=DEFAULT_COMPRESSION_LEVEL,
+                     encoding_threads=1, mzmlb=False, archive=None, profiler=None, incremental=False,
+                     write_queue_size=0):
+    """
+    Set up output sinks for each intensity column and export format and create the output directory of each intensity
+    column. Parameters are described in convert_iprmpasef_feature_list().
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output files.
+    :type slx: str
+    :param outdirs: Output directory for each intensity column as returned by
+        exporter.spectra.get_intensity_column_outdirs().
+    :type outdirs: list[str]
+    :return: List containing a list of output sinks for each intensity column.
+    :rtype: list[list]
+    """
+    sinks = []
+    for column_outdir in outdirs:
+        column_sinks = []
+        for export_format in export_formats:
+            if export_format.lower() == 'mgf':
+                column_sinks.append(MgfSink(slx, column_outdir, export_single_file, workers, mz_precision,
+                                            intensity_precision, archive, profiler, incremental, write_queue_size))
+            elif export_format.lower() == 'mzml':
+                # psims is only imported when mzML files are exported.
+                from exporter.mzml import MzmlSink
+                if polarity not in ['+', '-']:
+                    raise ValueError('Polarity must be either "+" or "-" for mzML export.')
+                column_sinks.append(MzmlSink(slx, column_outdir, polarity, barebones_metadata, mz_encoding,
+                                             intensity_encoding, compression, export_single_file, workers,
+                                             compression_level, encoding_threads, mzmlb, archive, profiler,
+                                             incremental, write_queue_size))
+            else:
+                raise ValueError(f'Unknown export format "{export_format}". Expected one of {EXPORT_FORMATS}.')
+        sinks.append(column_sinks)
+        os.makedirs(column_outdir or os.curdir, exist_ok=True)
+    return sinks
+
+
+def write_spectra(spectra, slx, outdir, export_formats, export_single_file, workers=1, mz_precision=None,
+                  intensity_precision=None, polarity=None, barebones_metadata=False, mz_encoding=64,
+                  intensity_encoding=64, compression='zlib', compression_level=DEFAULT_COMPRESSION_LEVEL,
+                  encoding_threads=1, progress_callback=None, cancel_event=None, mzmlb=False, archive=None,
+                  incremental=False, write_queue_size=0):
+    """
+    Write MS/MS spectra returned by exporter.spectra.extract_spectra() to one or more export formats. Output files are
+    identical to those written by convert_iprmpasef_feature_list() for the same feature list and parameters. Parameters
+    not described below are described in convert_iprmpasef_feature_list().
+
+    :param spectra: MS/MS spectra, or a list of MS/MS spectra for each intensity column. The files for each intensity
+        column are written to a subdirectory of the output directory named after the column if a list is given.
+    :type spectra: exporter.spectra.MS2Spectra | list[exporter.spectra.MS2Spectra]
+    :param slx: Path to the SCiLS Lab *.slx file the MS/MS spectra were extracted from, used to name the output files.
+    :type slx: str
+    :param outdir: Path to folder in which to write output file(s). Defaults to the SCiLS Lab *.slx file path.
+    :type outdir: str
+    """
+    if outdir == '':
+        outdir = os.path.dirname(slx)
+    if isinstance(spectra, list):
+        outdirs = get_intensity_column_outdirs(outdir, [column_spectra.intensity_column_name
+                                                        for column_spectra in spectra])
+    else:
+        outdirs = [outdir]
+    sinks = get_export_sinks(slx, outdirs, export_formats, export_single_file, workers, mz_precision,
+                             intensity_precision, polarity, barebones_metadata, mz_encoding, intensity_encoding,
+                             compression, compression_level, encoding_threads, mzmlb, archive, None, incremental,
+                             write_queue_size)
+    write_ms2_spectra(spectra, sinks if isinstance(spectra, list) else sinks[0], progress_callback=progress_callback,
+                      cancel_event=cancel_event)
+
+
+def convert_iprmpasef_feature_list(slx, outdir, feature_list_id, intensity_column_name, export_formats,
+                                   export_single_file, get_precursor_from_isolation_window,
+                                   relative_intensity_threshold=1, workers=1, use_cache=True, mz_precision=None,
+                                   intensity_precision=None, polarity=None, barebones_metadata=False, mz_encoding=64,
+                                   intensity_encoding=64, compression='zlib',
+                                   compression_level=DEFAULT_COMPRESSION_LEVEL, encoding_threads=1,
+                                   progress_callback=None, cancel_event=None, mzmlb=False, archive=None, profile=None,
+                                   incremental=False, float32=False,
+                                   colocalization_threshold=None, colocalization_method='pearson',
+                                   fragment_filters=None, write_queue_size=0):
+    """
+    Convert precursors and fragments found in a iprm-PASEF SCiLS Lab feature list to MS/MS spectra in one or more
+    export formats. The feature table is fetched and MS/MS spectra are built once, after which each spectrum is written
+    to all selected export formats in a single pass.
+
+    :param slx: Path to the input SCiLS Lab *.slx file to analyze or an open exporter.session.ScilsSession to reuse.
+    :type slx: str | exporter.session.ScilsSession
+    :param outdir: Path to folder in which to write output file(s). Defaults to the input SCiLS Lab *.slx file path.
+    :type outdir: str
+    :param feature_list_id: UUID for the MS1 feature table of interest. If unknown, please run the "get_feature_lists"
+        command.
+    :type feature_list_id: str
+    :param intensity_column_name: Name of the column from the feature table to use intensity values from. If unknown,
+        please run the "get_intensity_column_names" command. If a list of column names is given, MS/MS spectra are
+        built for all columns at once and the files for each column are written to a subdirectory of the output
+        directory named after the column.
+    :type intensity_column_name: str | list[str]
+    :param export_formats: Export formats to write. Any combination of "mgf" and "mzml".
+    :type export_formats: list[str]
+    :param export_single_file: If this flag is used, create a single file per export format containing all MS/MS
+        spectra. Otherwise, create individual files for each precursor window.
+    :type export_single_file: bool
+    :param get_precursor_from_isolation_window: If this flag is used, populate the precursor m/z and 1/K0 values from
+        the isolation window that was defined in the iprm-PASEF timsControl method.
+    :type get_precursor_from_isolation_window: bool
+    :param relative_intensity_threshold: Relative intensity threshold value to use for filtering out low intensity
+        fragment peaks. A threshold value of '1' corresponds to a threshold of 1% of the sum of all fragment intensity
+        values for a given precursor.
+    :type relative_intensity_threshold: int
+    :param workers: Number of worker processes used to write individual files for each precursor window when
+        export_single_file is False. Defaults to 1 (serial export).
+    :type workers: int
+    :param use_cache: If True, read the feature table from the on-disk feature table cache if available and cache it
+        after fetching it from SCiLS Lab.
+    :type use_cache: bool
+    :param mz_precision: Number of decimal places used for fragment m/z values in MGF files. Defaults to the shortest
+        representation that round trips.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values in MGF files. Defaults to
+        the shortest representation that round trips.
+    :type intensity_precision: int | None
+    :param polarity: Polarity of the spectra in the dataset. Either "+" or "-". Required for mzML export.
+    :type polarity: str | None
+    :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML files.
+    :type barebones_metadata: bool
+    :param mz_encoding: Choose encoding for m/z array: 32-bit (\"32\"), 64-bit (\"64\"), or MS-Numpress linear
+        prediction (\"numpress_linear\"). Defaults to 64-bit.
+    :type mz_encoding: int | str
+    :param intensity_encoding: Choose encoding for intensity array: 32-bit (\"32\"), 64-bit (\"64\"), MS-Numpress
+        short logged float (\"numpress_slof\"), or MS-Numpress positive integer (\"numpress_pic\"). Defaults to
+        64-bit.
+    :type intensity_encoding: int | str
+    :param compression: Choose between ZLIB compression (\"zlib\") or no compression (\"none\"). ZLIB compression is
+        applied after MS-Numpress encoding. Defaults to \"zlib\".
+    :type compression: str
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files). Defaults to 6.
+    :type compression_level: int
+    :param encoding_threads: Number of threads used to compress and encode mzML binary data arrays while spectra are
+        written when export_single_file is True. Defaults to 1.
+    :type encoding_threads: int
+    :param progress_callback: Function called with per-window progress dicts as described in
+        exporter.spectra.write_ms2_spectra().
+    :type progress_callback: collections.abc.Callable | None
+    :param cancel_event: Event (i.e. threading.Event) used to cancel the export. Output files written before the
+        export was cancelled are removed.
+    :type cancel_event: threading.Event | None
+    :param mzmlb: If True, write mzMLb files instead of mzML files when mzML export is selected. Requires h5py.
+    :type mzmlb: bool
+    :param archive: Archive format used to write individual files for each precursor window when export_single_file is
+        False, either "zip", "tar", or "sharded". One archive is written per export format. If None, individual files
+        are written to the output directory.
+    :type archive: str | None
+    :param profile: Profiling mode, either "stages", "cprofile", or "pyinstrument". If not None, a profiling report is
+        written to the output directory as described in exporter.profiling.ExportProfiler.
+    :type profile: str | None
+    :param incremental: If True, only rewrite the individual files of precursor windows that changed since the previous
+        export to the same output directory and remove the files of windows that no longer exist.
+    :type incremental: bool
+    :param float32: If True, store the m/z, 1/K0, and intensity columns of the feature table as 32-bit floats to reduce
+        memory usage.
+    :type float32: bool
+    :param colocalization_threshold: If not None, remove fragments whose ion image co-localization score with the
+        precursor ion image of their isolation window is below this threshold (-1 to 1) before relative intensity
+        filtering.
+    :type colocalization_threshold: float | None
+    :param colocalization_method: Correlation measure used to score co-localization, either "pearson" or "cosine".
+    :type colocalization_method: str
+    :param fragment_filters: Dict of additional fragment filter values indexed by filter name as described in
+        exporter.fragment_filters.FRAGMENT_FILTERS, i.e. {"top_n": 50, "precursor_exclusion": 1.5}. Filters are applied
+        to all isolation windows at once after relative intensity filtering.
+    :type fragment_filters: dict | None
+    :param write_queue_size: If greater than 0, write single files and archives in a background thread while the next
+        spectra are formatted and encoded, queueing at most this number of spectra.
+    :type write_queue_size: int
+    """
+    profiler = ExportProfiler(profile) if profile is not None else None
+    with open_session(slx) as session:
+        slx = session.filename
+        # Set output directory if not specified.
+        if outdir == '':
+            outdir = os.path.dirname(slx)
+        # Write each intensity column to its own subdirectory if more than one intensity column is exported.
+        intensity_column_names = to_column_list(intensity_column_name)
+        sinks = get_export_sinks(slx, get_intensity_column_outdirs(outdir, intensity_column_names), export_formats,
+                                 export_single_file, workers, mz_precision, intensity_precision, polarity,
+                                 barebones_metadata, mz_encoding, intensity_encoding, compression, compression_level,
+                                 encoding_threads, mzmlb, archive, profiler, incremental, write_queue_size)
+        # Set relative intensity threshold to float value.
+        relative_intensity_threshold = relative_intensity_threshold / 100
+        with profile_export(profiler, get_profile_path(slx, outdir)):
+            # Get iprm-PASEF feature table and build MS/MS spectra for all isolation windows and intensity columns.
+            spectra = extract_ms2_spectra(session, feature_list_id, intensity_column_names,
+                                          get_precursor_from_isolation_window, relative_intensity_threshold, use_cache,
+                                          profiler, float32, colocalization_threshold, colocalization_method,
+                                          fragment_filters)
+            # Export MS/MS spectra to all export formats in a single pass.
+            write_ms2_spectra(spectra, sinks, progress_callback=progress_callback, cancel_event=cancel_event,
+                              profiler=profiler)
+
+
+def main():
+    """
+    Run workflow.
+    """
+    args = get_args()
+    if 'mzml' in args['export_format']:
+        print('WARNING: mzML export feature is still currently in beta. Compatibility is not guaranteed with '
+              'downstream analysis platforms as certain metadata may be missing from resulting mzML files.')
+    convert_iprmpasef_feature_list(**get_export_parameters(args))
@@ -0,0 +1,286 @@
+import os
+import glob
+import hashlib
+import uuid
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+# Default maximum size of the feature table cache in bytes (2 GB).
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+# Feature table columns used to build MS/MS spectra in addition to the intensity column.
+FEATURE_COLUMNS = ['isolation_window', 'type', 'mz_low', 'mz_high', 'one_over_k0_low', 'one_over_k0_high']
+# Feature table columns with a small number of unique values that are stored as categoricals.
+CATEGORICAL_COLUMNS = ['isolation_window', 'type']
+# Numeric feature table columns that can be stored as 32-bit floats in addition to the intensity column.
+FLOAT_COLUMNS = ['mz_low', 'mz_high', 'one_over_k0_low', 'one_over_k0_high']
+
+
+def get_cache_dir():
+    """
+    Get the default directory used to cache SCiLS Lab feature tables. The location can be overridden using the
+    IPRMPASEF_EXPORTER_CACHE environment variable.
+
+    :return: Path to the cache directory.
+    :rtype: str
+    """
+    if 'IPRMPASEF_EXPORTER_CACHE' in os.environ:
+        return os.environ['IPRMPASEF_EXPORTER_CACHE']
+    return os.path.join(os.environ.get('LOCALAPPDATA', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'iprm-PASEF_Exporter',
+                        'feature_tables')
+
+
+def get_dataset_fingerprint(slx):
+    """
+    Get a fingerprint for a SCiLS Lab dataset based on the path, modification time, and size of the *.slx file and its
+    accompanying *.sbd file if present. The fingerprint changes whenever the dataset is modified in SCiLS Lab.
+
+    :param slx: Path to the input SCiLS Lab *.slx file.
+    :type slx: str
+    :return: Dataset fingerprint.
+    :rtype: str
+    """
+    fingerprint = [os.path.abspath(slx)]
+    for path in [slx, f'{os.path.splitext(slx)[0]}.sbd']:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            fingerprint.extend([str(stat.st_mtime_ns), str(stat.st_size)])
+    return '|'.join(fingerprint)
+
+
+def get_cache_path(slx, feature_list_id, cache_dir=None):
+    """
+    Get the path to the cached Parquet file for a given SCiLS Lab dataset and feature list.
+
+    :param slx: Path to the input SCiLS Lab *.slx file.
+    :type slx: str
+    :param feature_list_id: UUID for the feature table of interest.
+    :type feature_list_id: str
+    :param cache_dir: Directory used to cache feature tables. Defaults to get_cache_dir().
+    :type cache_dir: str | None
+    :return: Path to the cached feature table.
+    :rtype: str
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    key = hashlib.sha1(f'{get_dataset_fingerprint(slx)}|{feature_list_id}'.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'{key}.parquet')
+
+
+def evict_feature_table_cache(cache_dir=None, max_cache_size=MAX_CACHE_SIZE, keep=None):
+    """
+    Remove the least recently used cached feature tables until the total size of the cache is below max_cache_size.
+
+    :param cache_dir: Directory used to cache feature tables. Defaults to get_cache_dir().
+    :type cache_dir: str | None
+    :param max_cache_size: Maximum size of the cache in bytes.
+    :type max_cache_size: int
+    :param keep: Path to a cached feature table that should not be removed (i.e. the table that was just written).
+    :type keep: str | None
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    cached_tables = []
+    for path in glob.glob(os.path.join(cache_dir, '*.parquet')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        cached_tables.append((stat.st_mtime, stat.st_size, path))
+    cache_size = sum(size for mtime, size, path in cached_tables)
+    # Cache hits update the modification time, so the oldest files are the least recently used.
+    for mtime, size, path in sorted(cached_tables):
+        if cache_size <= max_cache_size:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+            cache_size -= size
+        except OSError:
+            pass
+
+
+def to_column_list(intensity_column_name):
+    """
+    Convert one or more intensity column names to a list without duplicates.
+
+    :param intensity_column_name: Name or list of names of the columns from the feature table to use intensity values
+        from.
+    :type intensity_column_name: str | list[str]
+    :return: Intensity column names in the order given.
+    :rtype: list[str]
+    """
+    if isinstance(intensity_column_name, str):
+        return [intensity_column_name]
+    return list(dict.fromkeys(intensity_column_name))
+
+
+def get_feature_columns(intensity_column_name):
+    """
+    Get the feature table columns needed to build MS/MS spectra using one or more intensity columns.
+
+    :param intensity_column_name: Name or list of names of the columns from the feature table to use intensity values
+        from.
+    :type intensity_column_name: str | list[str]
+    :return: Column names.
+    :rtype: list[str]
+    """
+    return FEATURE_COLUMNS + [column for column in to_column_list(intensity_column_name)
+                              if column not in FEATURE_COLUMNS]
+
+
+def project_feature_table(feature_list, intensity_column_name, float32=False):
+    """
+    Select only the feature table columns needed to build MS/MS spectra and store them in compact data types. The
+    isolation_window and type columns are stored as categoricals, so each label is only stored once.
+
+    :param feature_list: iprm-PASEF feature table.
+    :type feature_list: pandas.DataFrame
+    :param intensity_column_name: Name or list of names of the columns from the feature table to use intensity values
+        from.
+    :type intensity_column_name: str | list[str]
+    :param float32: If True, store the m/z, 1/K0, and intensity columns as 32-bit floats. Halves the memory used by
+        these columns at the cost of precision (approximately 7 significant digits).
+    :type float32: bool
+    :return: Feature table containing only the columns returned by get_feature_columns().
+    :rtype: pandas.DataFrame
+    """
+    columns = get_feature_columns(intensity_column_name)
+    missing = [column for column in columns if column not in feature_list.columns]
+    if missing:
+        raise ValueError(f'Feature table does not contain the column(s) {missing}. Please ensure that the feature list '
+                         f'was generated from an iprm-PASEF dataset and that the intensity column name is correct.')
+    dtypes = {column: 'category' for column in CATEGORICAL_COLUMNS}
+    if float32:
+        dtypes.update({column: np.float32 for column in FLOAT_COLUMNS + to_column_list(intensity_column_name)})
+    return feature_list[columns].astype(dtypes)
+
+
+def get_feature_table(slx, feature_list_id, session=None, use_cache=True, cache_dir=None,
+                      max_cache_size=MAX_CACHE_SIZE, columns=None):
+    """
+    Get a feature table including all user columns from a SCiLS Lab dataset. Feature tables are cached on disk in
+    Parquet format keyed by the dataset fingerprint and feature list ID, so repeated exports of the same feature list
+    do not need to query SCiLS Lab again. SCiLS Lab is only queried if the feature table is not cached, in which case a
+    new session is opened if no session is provided. The complete feature table is always cached, so a subset of
+    columns can be requested without invalidating the cache for other columns.
+
+    :param slx: Path to the input SCiLS Lab *.slx file.
+    :type slx: str
+    :param feature_list_id: UUID for the feature table of interest.
+    :type feature_list_id: str
+    :param session: SCiLS Lab session (i.e. exporter.session.ScilsSession or scilslab.LocalSession) used to fetch the
+        feature table on cache misses. If None, a new session is opened on cache misses.
+    :type session: exporter.session.ScilsSession | scilslab.LocalSession | None
+    :param use_cache: If False, always fetch the feature table from SCiLS Lab and do not read from or write to the
+        cache.
+    :type use_cache: bool
+    :param cache_dir: Directory used to cache feature tables. Defaults to get_cache_dir().
+    :type cache_dir: str | None
+    :param max_cache_size: Maximum size of the cache in bytes. Least recently used feature tables are removed once
+        this size is exceeded.
+    :type max_cache_size: int
+    :param columns: Columns to return. If not None, only these columns are read from the cache, and all other columns
+        are dropped right after the feature table is fetched from SCiLS Lab. Columns not found in the feature table are
+        omitted.
+    :type columns: list[str] | None
+    :return: Feature table.
+    :rtype: pandas.DataFrame
+    """
+    if use_cache:
+        cache_path = get_cache_path(slx, feature_list_id, cache_dir)
+        if os.path.isfile(cache_path):
+            try:
+                read_columns = columns
+                if columns is not None and pq is not None:
+                    # Only read columns found in the cached feature table, since reading missing columns raises.
+                    cached_columns = pq.ParquetFile(cache_path).schema_arrow.names
+                    read_columns = [column for column in columns if column in cached_columns]
+                # Parquet files are read column by column, so unused columns are never loaded.
+                feature_list = pd.read_parquet(cache_path, columns=read_columns)
+                # Mark as recently used for cache eviction.
+                os.utime(cache_path)
+                return feature_list
+            except (OSError, ValueError, ImportError):
+                # Treat unreadable cache files (or a missing Parquet engine) as cache misses.
+                pass
+
+    if session is None:
+        # scilslab is only imported when the feature table is fetched from SCiLS Lab.
+        from scilslab import LocalSession
+        with LocalSession(filename=slx) as session:
+            feature_list = session.dataset_proxy.feature_table.get_features(feature_list_id,
+                                                                            include_all_user_columns=True)
+    else:
+        feature_list = session.dataset_proxy.feature_table.get_features(feature_list_id,
+                                                                        include_all_user_columns=True)
+
+    if use_cache:
+        # Write to a temporary file first so that partially written tables are never read.
+        tmp_path = f'{cache_path}.{uuid.uuid4().hex}.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            feature_list.to_parquet(tmp_path)
+            os.replace(tmp_path, cache_path)
+            evict_feature_table_cache(os.path.dirname(cache_path), max_cache_size, keep=cache_path)
+        except Exception:
+            # Caching is best effort and should never cause an export to fail.
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+    if columns is not None:
+        feature_list = feature_list[[column for column in columns if column in feature_list.columns]]
+    return feature_list
+
+
+def get_feature_table_schema(slx, feature_list_id, session=None, use_cache=True, cache_dir=None,
+                             max_cache_size=MAX_CACHE_SIZE):
+    """
+    Get the column names, data types, and number of rows of a feature table. If the feature table is cached, the
+    schema is read from the Parquet file metadata without loading any column data. SCiLS Lab does not provide a
+    metadata-only query, so on cache misses (or if use_cache is False or pyarrow is not installed) the complete feature
+    table including all user columns is fetched and loaded using get_feature_table(), which also caches it for
+    subsequent exports.
+
+    :param slx: Path to the input SCiLS Lab *.slx file.
+    :type slx: str
+    :param feature_list_id: UUID for the feature table of interest.
+    :type feature_list_id: str
+    :param session: SCiLS Lab session used to fetch the feature table if it is not cached. If None, a new session is
+        opened if needed.
+    :type session: exporter.session.ScilsSession | scilslab.LocalSession | None
+    :param use_cache: If False, always fetch the feature table from SCiLS Lab and do not read from or write to the
+        cache.
+    :type use_cache: bool
+    :param cache_dir: Directory used to cache feature tables. Defaults to get_cache_dir().
+    :type cache_dir: str | None
+    :param max_cache_size: Maximum size of the cache in bytes.
+    :type max_cache_size: int
+    :return: Dict containing the column names ("columns"), the data type of each column indexed by column name
+        ("dtypes"), and the number of rows ("n_rows").
+    :rtype: dict
+    """
+    if use_cache and pq is not None:
+        cache_path = get_cache_path(slx, feature_list_id, cache_dir)
+        if os.path.isfile(cache_path):
+            try:
+                parquet_file = pq.ParquetFile(cache_path)
+                # Converting an empty table applies the pandas metadata stored in the file (i.e. the index column).
+                dtypes = parquet_file.schema_arrow.empty_table().to_pandas().dtypes
+                n_rows = parquet_file.metadata.num_rows
+                # Mark as recently used for cache eviction.
+                os.utime(cache_path)
+                return {'columns': dtypes.index.tolist(), 'dtypes': dtypes, 'n_rows': n_rows}
+            except Exception:
+                # Treat unreadable cache files as cache misses.
+                pass
+
+    feature_list = get_feature_table(slx, feature_list_id, session=session, use_cache=use_cache, cache_dir=cache_dir,
+                                     max_cache_size=max_cache_size)
+    return {'columns': feature_list.columns.tolist(), 'dtypes': feature_list.dtypes, 'n_rows': feature_list.shape[0]}
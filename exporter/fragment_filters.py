@@ -0,0 +1,151 @@
+import numpy as np
+
+
+def exclude_precursor_fragments(fragments, keep, tolerance):
+    """
+    Remove fragments within an m/z tolerance of the precursor m/z of their isolation window, i.e. unfragmented
+    precursor signal.
+
+    :param fragments: Fragment arrays sorted by isolation window as described in apply_fragment_filters().
+    :type fragments: dict
+    :param keep: Boolean mask of fragments that are kept by the preceding filters.
+    :type keep: numpy.ndarray
+    :param tolerance: m/z tolerance in Da around the precursor m/z.
+    :type tolerance: float
+    :return: Boolean mask of fragments that are kept.
+    :rtype: numpy.ndarray
+    """
+    return keep & (np.abs(fragments['mz'] - fragments['selected_ion_mz'][fragments['codes']]) > tolerance)
+
+
+def filter_absolute_intensity(fragments, keep, min_intensity):
+    """
+    Remove fragments below an absolute intensity.
+
+    :param fragments: Fragment arrays sorted by isolation window as described in apply_fragment_filters().
+    :type fragments: dict
+    :param keep: Boolean mask of fragments that are kept by the preceding filters.
+    :type keep: numpy.ndarray
+    :param min_intensity: Minimum fragment intensity.
+    :type min_intensity: float
+    :return: Boolean mask of fragments that are kept.
+    :rtype: numpy.ndarray
+    """
+    return keep & (fragments['intensity'] >= min_intensity)
+
+
+def filter_signal_to_noise(fragments, keep, min_signal_to_noise):
+    """
+    Remove fragments whose signal-to-noise ratio is below a threshold. The noise level of each isolation window is
+    estimated as the median intensity of all of its fragments, which is computed for all windows at once by sorting
+    fragment intensities within each window.
+
+    :param fragments: Fragment arrays sorted by isolation window as described in apply_fragment_filters().
+    :type fragments: dict
+    :param keep: Boolean mask of fragments that are kept by the preceding filters.
+    :type keep: numpy.ndarray
+    :param min_signal_to_noise: Minimum ratio of fragment intensity to the noise level of its isolation window.
+    :type min_signal_to_noise: float
+    :return: Boolean mask of fragments that are kept.
+    :rtype: numpy.ndarray
+    """
+    codes = fragments['codes']
+    if not codes.size:
+        return keep
+    starts = fragments['window_starts']
+    sizes = fragments['window_sizes']
+    # Fragments are already sorted by window, so sorting by (window, intensity) sorts intensities within each window.
+    intensity = fragments['intensity'][np.lexsort((fragments['intensity'], codes))]
+    has_fragments = sizes > 0
+    lower = starts[has_fragments] + (sizes[has_fragments] - 1) // 2
+    upper = starts[has_fragments] + sizes[has_fragments] // 2
+    noise = np.zeros(sizes.size, dtype=np.float64)
+    noise[has_fragments] = (intensity[lower] + intensity[upper]) / 2
+    return keep & (fragments['intensity'] >= noise[codes] * min_signal_to_noise)
+
+
+def filter_top_n(fragments, keep, top_n):
+    """
+    Keep only the most intense fragments of each isolation window. Kept fragments are ranked within their window using
+    a single sort by (window, descending intensity) over all windows, with ties kept in m/z order.
+
+    :param fragments: Fragment arrays sorted by isolation window as described in apply_fragment_filters().
+    :type fragments: dict
+    :param keep: Boolean mask of fragments that are kept by the preceding filters.
+    :type keep: numpy.ndarray
+    :param top_n: Maximum number of fragments kept for each isolation window.
+    :type top_n: int
+    :return: Boolean mask of fragments that are kept.
+    :rtype: numpy.ndarray
+    """
+    indices = np.flatnonzero(keep)
+    codes = fragments['codes'][indices]
+    order = indices[np.lexsort((-fragments['intensity'][indices], codes))]
+    # Rank of each fragment within its window, i.e. its position after the first kept fragment of the window.
+    window_starts = np.searchsorted(codes, np.arange(fragments['window_sizes'].size))
+    ranks = np.arange(indices.size) - window_starts[codes]
+    keep = np.zeros(keep.size, dtype=bool)
+    keep[order[ranks < top_n]] = True
+    return keep
+
+
+# Fragment filters that can be enabled in addition to the relative intensity threshold, in the order they are applied.
+# Names are used as command line parameters and job keys, and each filter is disabled if its value is None.
+FRAGMENT_FILTERS = {'precursor_exclusion': exclude_precursor_fragments,
+                    'min_intensity': filter_absolute_intensity,
+                    'min_signal_to_noise': filter_signal_to_noise,
+                    'top_n': filter_top_n}
+
+
+def get_fragment_filters(args):
+    """
+    Get the enabled fragment filters from command line arguments or a job dict.
+
+    :param args: Arguments containing a value for some or all of the names in FRAGMENT_FILTERS.
+    :type args: dict
+    :return: Dict of fragment filter values indexed by filter name, only containing enabled filters.
+    :rtype: dict
+    """
+    return {name: args[name] for name in FRAGMENT_FILTERS if args.get(name) is not None}
+
+
+def validate_fragment_filters(fragment_filters):
+    """
+    Check that all fragment filters are known and have valid values.
+
+    :param fragment_filters: Dict of fragment filter values indexed by filter name.
+    :type fragment_filters: dict | None
+    """
+    for name, value in (fragment_filters or {}).items():
+        if name not in FRAGMENT_FILTERS:
+            raise ValueError(f'Unknown fragment filter "{name}". Expected one of {list(FRAGMENT_FILTERS)}.')
+        if value is None:
+            continue
+        if name == 'top_n' and (int(value) != value or value < 1):
+            raise ValueError(f'Fragment filter "top_n" must be a positive integer, got {value}.')
+        if value < 0:
+            raise ValueError(f'Fragment filter "{name}" must not be negative, got {value}.')
+
+
+def apply_fragment_filters(fragment_filters, fragments, keep):
+    """
+    Apply the enabled fragment filters to the fragments of all isolation windows at once, in the order given by
+    FRAGMENT_FILTERS.
+
+    :param fragment_filters: Dict of fragment filter values indexed by filter name. Filters that are missing or None
+        are skipped.
+    :type fragment_filters: dict | None
+    :param fragments: Fragment arrays sorted by isolation window, containing "codes" (isolation window index of each
+        fragment), "mz", "intensity", "window_starts" and "window_sizes" (index of the first fragment and number of
+        fragments of each window), and "selected_ion_mz" (precursor m/z of each window).
+    :type fragments: dict
+    :param keep: Boolean mask of fragments that are kept by the relative intensity threshold.
+    :type keep: numpy.ndarray
+    :return: Boolean mask of fragments that are kept.
+    :rtype: numpy.ndarray
+    """
+    validate_fragment_filters(fragment_filters)
+    for name, fragment_filter in FRAGMENT_FILTERS.items():
+        if fragment_filters and fragment_filters.get(name) is not None:
+            keep = fragment_filter(fragments, keep, fragment_filters[name])
+    return keep
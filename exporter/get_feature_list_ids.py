@@ -1,5 +1,5 @@
 import argparse
-from scilslab import LocalSession
+from exporter.session import open_session
 
 
 def get_args():
@@ -28,9 +28,8 @@ def get_feature_list_ids(slx):
     :param slx:
     :return:
     """
-    with LocalSession(filename=slx) as session:
-        dataset = session.dataset_proxy
-        feature_lists = dataset.feature_table.get_feature_lists()
+    with open_session(slx) as session:
+        feature_lists = session.get_feature_lists()
         print(feature_lists)
 
 
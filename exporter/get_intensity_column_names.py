@@ -1,5 +1,6 @@
 import argparse
-from scilslab import LocalSession
+import pandas as pd
+from exporter.session import open_session
 
 
 def get_args():
@@ -20,24 +21,31 @@ def get_args():
                              '"get_feature_lists" command.',
                         required=True,
                         type=str)
+    parser.add_argument('--no_cache',
+                        help='If this flag is used, always fetch the feature table from SCiLS Lab instead of reading it '
+                             'from the on-disk feature table cache.',
+                        action='store_true')
 
     arguments = parser.parse_args()
     return vars(arguments)
 
 
-def get_intensity_column_names(slx, feature_list_id):
+def get_intensity_column_names(slx, feature_list_id, use_cache=True):
     """
     Get the column names for a given SCiLS Lab feature list. Used to obtain intensity column names for iprm-PASEF
-    Precursor Scheduler workflow.
-
-    :param slx:
-    :param feature_list_id:
-    :return:
+    Precursor Scheduler workflow. Only the feature table schema is read, so the feature table is not loaded if it is
+    cached.
+
+    :param slx: Path to the input SCiLS Lab *.slx file or an open exporter.session.ScilsSession to reuse.
+    :type slx: str | exporter.session.ScilsSession
+    :param feature_list_id: UUID for the feature table of interest.
+    :type feature_list_id: str
+    :param use_cache: If False, always fetch the feature table from SCiLS Lab.
+    :type use_cache: bool
     """
-    with LocalSession(filename=slx) as session:
-        dataset = session.dataset_proxy
-        feature_list = dataset.feature_table.get_features(feature_list_id, include_all_user_columns=True)
-        print(feature_list.columns)
+    with open_session(slx) as session:
+        schema = session.get_feature_schema(feature_list_id, use_cache=use_cache)
+        print(pd.Index(schema['columns']))
 
 
 def main():
@@ -45,4 +53,4 @@ def main():
     Run workflow.
     """
     args = get_args()
-    get_intensity_column_names(args['scils'], args['feature_list_id'])
+    get_intensity_column_names(args['scils'], args['feature_list_id'], use_cache=not args['no_cache'])
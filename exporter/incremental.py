@@ -0,0 +1,119 @@
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+
+
+# Version of the incremental export manifest. Manifests with a different version are ignored and all windows are
+# written again.
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(slx, outdir, extension):
+    """
+    Get the path to the incremental export manifest for the individual files of one export format.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the manifest.
+    :type slx: str
+    :param outdir: Path to folder containing the individual files for each precursor window.
+    :type outdir: str
+    :param extension: File extension of the individual files without the leading period (i.e. "mgf" or "mzML").
+    :type extension: str
+    :return: Path to the manifest.
+    :rtype: str
+    """
+    return os.path.join(outdir, f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_{extension}_manifest.json')
+
+
+class WindowManifest(object):
+    """
+    Manifest of content hashes for the individual files written for each precursor window, used to only rewrite the
+    files of windows that changed since the previous export. Each hash covers the export parameters and the values of
+    the scan dict that determine the file contents. Files of windows that are no longer exported are removed when the
+    manifest is closed.
+
+    :param path: Path to the manifest returned by get_manifest_path().
+    :type path: str
+    :param parameters: Export parameters that affect the contents of the individual files.
+    :type parameters: dict
+    :param scan_keys: Keys of the scan dicts yielded by exporter.spectra.iter_ms2_spectra() that affect the contents of
+        the individual files.
+    :type scan_keys: list[str]
+    """
+    def __init__(self, path, parameters, scan_keys):
+        self.path = path
+        self.parameters = parameters
+        self.scan_keys = scan_keys
+        self.previous = {}
+        self.current = {}
+        self._parameters_hash = hashlib.sha1(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+
+    def load(self):
+        """
+        Load the manifest written by the previous export if present. Unreadable manifests are ignored, in which case
+        all windows are written again.
+        """
+        try:
+            with open(self.path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.previous = dict(manifest['windows'])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.previous = {}
+
+    def get_hash(self, scan):
+        """
+        Get the content hash of a precursor window.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :return: Hexadecimal SHA-1 hash.
+        :rtype: str
+        """
+        window_hash = self._parameters_hash.copy()
+        for key in self.scan_keys:
+            value = scan[key]
+            if isinstance(value, np.ndarray):
+                window_hash.update(value.dtype.str.encode('utf-8'))
+                window_hash.update(np.ascontiguousarray(value).tobytes())
+            else:
+                window_hash.update(repr(value.item() if isinstance(value, np.generic) else value).encode('utf-8'))
+        return window_hash.hexdigest()
+
+    def needs_update(self, path, scan):
+        """
+        Record the content hash of a precursor window and check whether its file needs to be written.
+
+        :param path: Path to the individual file for the precursor window.
+        :type path: str
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :return: True if the window is new or changed since the previous export or its file is missing.
+        :rtype: bool
+        """
+        filename = os.path.basename(path)
+        window_hash = self.get_hash(scan)
+        self.current[filename] = window_hash
+        return self.previous.get(filename) != window_hash or not os.path.isfile(path)
+
+    def close(self):
+        """
+        Remove the files of windows that are no longer exported and write the manifest.
+        """
+        outdir = os.path.dirname(self.path)
+        for filename in self.previous:
+            # Only files in the output directory are removed.
+            if filename not in self.current and filename == os.path.basename(filename):
+                try:
+                    os.remove(os.path.join(outdir, filename))
+                except OSError:
+                    pass
+        manifest = {'version': MANIFEST_VERSION,
+                    'parameters': self.parameters,
+                    'windows': self.current}
+        # Write to a temporary file first so that partially written manifests are never read.
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(tmp_path, self.path)
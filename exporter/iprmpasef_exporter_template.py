@@ -9,14 +9,14 @@
 ################################################################################
 
 from PySide6.QtCore import QCoreApplication, QMetaObject, QRect
-from PySide6.QtWidgets import QCheckBox, QComboBox, QLabel, QLineEdit, QPushButton, QRadioButton, QSpinBox, QWidget
+from PySide6.QtWidgets import QCheckBox, QComboBox, QLabel, QLineEdit, QProgressBar, QPushButton, QRadioButton, QSpinBox, QWidget
 
 
 class Ui_IprmpasefExporterWindow(object):
     def setupUi(self, IprmpasefExporterWindow):
         if not IprmpasefExporterWindow.objectName():
             IprmpasefExporterWindow.setObjectName(u"IprmpasefExporterWindow")
-        IprmpasefExporterWindow.resize(522, 333)
+        IprmpasefExporterWindow.resize(522, 460)
         self.centralwidget = QWidget(IprmpasefExporterWindow)
         self.centralwidget.setObjectName(u"centralwidget")
         self.ScilsLabel = QLabel(self.centralwidget)
@@ -39,7 +39,7 @@ class Ui_IprmpasefExporterWindow(object):
         self.IntensityColumnNameLabel.setGeometry(QRect(10, 110, 261, 16))
         self.IntensityColumnNameCombo = QComboBox(self.centralwidget)
         self.IntensityColumnNameCombo.setObjectName(u"IntensityColumnNameCombo")
-        self.IntensityColumnNameCombo.setGeometry(QRect(10, 130, 261, 24))
+        self.IntensityColumnNameCombo.setGeometry(QRect(10, 130, 181, 24))
         self.ExportSingleFileCheckbox = QCheckBox(self.centralwidget)
         self.ExportSingleFileCheckbox.setObjectName(u"ExportSingleFileCheckbox")
         self.ExportSingleFileCheckbox.setGeometry(QRect(10, 160, 261, 20))
@@ -55,9 +55,6 @@ class Ui_IprmpasefExporterWindow(object):
         self.ExportFormatLabel = QLabel(self.centralwidget)
         self.ExportFormatLabel.setObjectName(u"ExportFormatLabel")
         self.ExportFormatLabel.setGeometry(QRect(300, 10, 211, 16))
-        self.ExportFormatCombo = QComboBox(self.centralwidget)
-        self.ExportFormatCombo.setObjectName(u"ExportFormatCombo")
-        self.ExportFormatCombo.setGeometry(QRect(300, 30, 211, 24))
         self.OutputDirectoryLabel = QLabel(self.centralwidget)
         self.OutputDirectoryLabel.setObjectName(u"OutputDirectoryLabel")
         self.OutputDirectoryLabel.setGeometry(QRect(10, 250, 261, 16))
@@ -96,10 +93,10 @@ class Ui_IprmpasefExporterWindow(object):
         self.IntensityEncoding64bitRadio.setGeometry(QRect(400, 200, 61, 20))
         self.CompressionLabel = QLabel(self.centralwidget)
         self.CompressionLabel.setObjectName(u"CompressionLabel")
-        self.CompressionLabel.setGeometry(QRect(300, 230, 211, 16))
+        self.CompressionLabel.setGeometry(QRect(300, 270, 211, 16))
         self.RunButton = QPushButton(self.centralwidget)
         self.RunButton.setObjectName(u"RunButton")
-        self.RunButton.setGeometry(QRect(10, 300, 501, 24))
+        self.RunButton.setGeometry(QRect(10, 380, 245, 24))
         self.PolarityPositiveRadio = QRadioButton(self.centralwidget)
         self.PolarityPositiveRadio.setObjectName(u"PolarityPositiveRadio")
         self.PolarityPositiveRadio.setGeometry(QRect(300, 100, 71, 20))
@@ -108,10 +105,55 @@ class Ui_IprmpasefExporterWindow(object):
         self.PolarityNegativeRadio.setGeometry(QRect(400, 100, 81, 20))
         self.CompressionZlibRadio = QRadioButton(self.centralwidget)
         self.CompressionZlibRadio.setObjectName(u"CompressionZlibRadio")
-        self.CompressionZlibRadio.setGeometry(QRect(300, 250, 51, 20))
+        self.CompressionZlibRadio.setGeometry(QRect(300, 290, 51, 20))
         self.CompressionNoneRadio = QRadioButton(self.centralwidget)
         self.CompressionNoneRadio.setObjectName(u"CompressionNoneRadio")
-        self.CompressionNoneRadio.setGeometry(QRect(400, 250, 61, 20))
+        self.CompressionNoneRadio.setGeometry(QRect(400, 290, 61, 20))
+        self.WorkersLabel = QLabel(self.centralwidget)
+        self.WorkersLabel.setObjectName(u"WorkersLabel")
+        self.WorkersLabel.setGeometry(QRect(10, 300, 171, 16))
+        self.WorkersSpinBox = QSpinBox(self.centralwidget)
+        self.WorkersSpinBox.setObjectName(u"WorkersSpinBox")
+        self.WorkersSpinBox.setGeometry(QRect(190, 300, 88, 24))
+        self.ExportMgfCheckbox = QCheckBox(self.centralwidget)
+        self.ExportMgfCheckbox.setObjectName(u"ExportMgfCheckbox")
+        self.ExportMgfCheckbox.setGeometry(QRect(300, 30, 91, 20))
+        self.ExportMzmlCheckbox = QCheckBox(self.centralwidget)
+        self.ExportMzmlCheckbox.setObjectName(u"ExportMzmlCheckbox")
+        self.ExportMzmlCheckbox.setGeometry(QRect(400, 30, 111, 20))
+        self.CancelButton = QPushButton(self.centralwidget)
+        self.CancelButton.setObjectName(u"CancelButton")
+        self.CancelButton.setGeometry(QRect(266, 380, 245, 24))
+        self.ProgressBar = QProgressBar(self.centralwidget)
+        self.ProgressBar.setObjectName(u"ProgressBar")
+        self.ProgressBar.setGeometry(QRect(10, 410, 501, 22))
+        self.ProgressLabel = QLabel(self.centralwidget)
+        self.ProgressLabel.setObjectName(u"ProgressLabel")
+        self.ProgressLabel.setGeometry(QRect(10, 436, 501, 16))
+        self.MzEncodingNumpressRadio = QRadioButton(self.centralwidget)
+        self.MzEncodingNumpressRadio.setObjectName(u"MzEncodingNumpressRadio")
+        self.MzEncodingNumpressRadio.setGeometry(QRect(300, 220, 91, 20))
+        self.IntensityEncodingSlofRadio = QRadioButton(self.centralwidget)
+        self.IntensityEncodingSlofRadio.setObjectName(u"IntensityEncodingSlofRadio")
+        self.IntensityEncodingSlofRadio.setGeometry(QRect(400, 220, 111, 20))
+        self.IntensityEncodingPicRadio = QRadioButton(self.centralwidget)
+        self.IntensityEncodingPicRadio.setObjectName(u"IntensityEncodingPicRadio")
+        self.IntensityEncodingPicRadio.setGeometry(QRect(400, 240, 111, 20))
+        self.MzmlbCheckbox = QCheckBox(self.centralwidget)
+        self.MzmlbCheckbox.setObjectName(u"MzmlbCheckbox")
+        self.MzmlbCheckbox.setGeometry(QRect(300, 320, 211, 20))
+        self.ProfileCheckbox = QCheckBox(self.centralwidget)
+        self.ProfileCheckbox.setObjectName(u"ProfileCheckbox")
+        self.ProfileCheckbox.setGeometry(QRect(10, 325, 261, 20))
+        self.IntensityColumnsButton = QPushButton(self.centralwidget)
+        self.IntensityColumnsButton.setObjectName(u"IntensityColumnsButton")
+        self.IntensityColumnsButton.setGeometry(QRect(200, 130, 75, 24))
+        self.FragmentFiltersButton = QPushButton(self.centralwidget)
+        self.FragmentFiltersButton.setObjectName(u"FragmentFiltersButton")
+        self.FragmentFiltersButton.setGeometry(QRect(10, 350, 120, 24))
+        self.FragmentFiltersLabel = QLabel(self.centralwidget)
+        self.FragmentFiltersLabel.setObjectName(u"FragmentFiltersLabel")
+        self.FragmentFiltersLabel.setGeometry(QRect(140, 354, 371, 16))
         IprmpasefExporterWindow.setCentralWidget(self.centralwidget)
 
         self.retranslateUi(IprmpasefExporterWindow)
@@ -146,5 +188,18 @@ class Ui_IprmpasefExporterWindow(object):
         self.PolarityNegativeRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Negative", None))
         self.CompressionZlibRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"zlib", None))
         self.CompressionNoneRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"none", None))
+        self.WorkersLabel.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Worker Processes", None))
+        self.ExportMgfCheckbox.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"MGF", None))
+        self.ExportMzmlCheckbox.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"mzML (Beta)", None))
+        self.CancelButton.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Cancel", None))
+        self.ProgressLabel.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"", None))
+        self.MzEncodingNumpressRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Numpress", None))
+        self.IntensityEncodingSlofRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Numpress slof", None))
+        self.IntensityEncodingPicRadio.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Numpress pic", None))
+        self.MzmlbCheckbox.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Write mzMLb (HDF5) files", None))
+        self.ProfileCheckbox.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Write Profiling Report", None))
+        self.IntensityColumnsButton.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Multiple", None))
+        self.FragmentFiltersButton.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"Fragment Filters...", None))
+        self.FragmentFiltersLabel.setText(QCoreApplication.translate("IprmpasefExporterWindow", u"No additional fragment filters", None))
     # retranslateUi
 
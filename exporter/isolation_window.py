@@ -0,0 +1,78 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Regular expression for a floating point number in an isolation window label.
+NUMBER_PATTERN = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+# Isolation window labels written by SCiLS Lab for iprm-PASEF datasets (i.e. "500.0000 m/z, 1/K0 0.9000"), optionally
+# followed by the isolation width (i.e. "500.0000 m/z, 1/K0 0.9000, width 3.0000").
+ISOLATION_WINDOW_PATTERN = re.compile(rf'^\s*(?P<iso_mz>{NUMBER_PATTERN})\s*m/z\s*,'
+                                      rf'\s*1/K0\s*(?P<iso_ook0>{NUMBER_PATTERN})\s*'
+                                      rf'(?:,\s*width\s*(?P<iso_width>{NUMBER_PATTERN})\s*)?$')
+# Numeric isolation window columns added by parse_isolation_windows().
+ISOLATION_WINDOW_COLUMNS = ['iso_mz', 'iso_ook0', 'iso_width']
+# Maximum number of unexpected isolation window labels listed in error messages.
+MAX_REPORTED_LABELS = 5
+
+
+def parse_isolation_windows(windows):
+    """
+    Parse unique isolation window labels into numeric isolation window m/z, 1/K0, and width values. All labels are
+    parsed at once using a single regular expression, so each unique label is only parsed a single time regardless of
+    the number of features in the isolation window.
+
+    :param windows: Unique isolation window labels (i.e. "500.0000 m/z, 1/K0 0.9000").
+    :type windows: collections.abc.Sequence[str] | numpy.ndarray | pandas.Index
+    :return: Data frame with one row per isolation window containing isolation_window, iso_mz, iso_ook0, and iso_width
+        columns. iso_width is NaN for labels that do not include the isolation width.
+    :rtype: pandas.DataFrame
+    """
+    labels = pd.Series(np.asarray(windows, dtype=object), dtype=object)
+    parsed = labels.astype(str).str.extract(ISOLATION_WINDOW_PATTERN)
+    unexpected = labels[parsed['iso_mz'].isna() | parsed['iso_ook0'].isna()]
+    if not unexpected.empty:
+        examples = ', '.join([repr(label) for label in unexpected.iloc[:MAX_REPORTED_LABELS]])
+        raise ValueError(f'Unable to parse {unexpected.size} isolation window label(s): {examples}. Expected labels '
+                         f'formatted as "<m/z> m/z, 1/K0 <1/K0>" (i.e. "500.0000 m/z, 1/K0 0.9000"), optionally '
+                         f'followed by ", width <width>".')
+    parsed = parsed[ISOLATION_WINDOW_COLUMNS].astype(np.float64)
+    parsed.insert(0, 'isolation_window', labels)
+    return parsed
+
+
+def factorize_isolation_windows(feature_list):
+    """
+    Encode the isolation_window column of a feature table as integer codes and parse each unique isolation window
+    label once using parse_isolation_windows(). Isolation windows are sorted by label to match the order used by
+    pandas.DataFrame.groupby.
+
+    :param feature_list: iprm-PASEF feature table containing an isolation_window column.
+    :type feature_list: pandas.DataFrame
+    :return: Tuple containing the isolation window code of each feature (-1 for features without an isolation window)
+        and the data frame of parsed isolation windows returned by parse_isolation_windows().
+    :rtype: tuple[numpy.ndarray, pandas.DataFrame]
+    """
+    if 'isolation_window' not in feature_list.columns:
+        raise ValueError('Feature table does not contain an "isolation_window" column. Please ensure that the feature '
+                         'list was generated from an iprm-PASEF dataset.')
+    window_codes, windows = pd.factorize(feature_list['isolation_window'], sort=True)
+    return window_codes, parse_isolation_windows(windows)
+
+
+def add_isolation_window_columns(feature_list):
+    """
+    Add numeric iso_mz, iso_ook0, and iso_width columns parsed from the isolation_window column to a feature table.
+    Features without an isolation window are assigned NaN.
+
+    :param feature_list: iprm-PASEF feature table containing an isolation_window column.
+    :type feature_list: pandas.DataFrame
+    :return: Feature table with iso_mz, iso_ook0, and iso_width columns. The feature table is modified in place.
+    :rtype: pandas.DataFrame
+    """
+    window_codes, windows = factorize_isolation_windows(feature_list)
+    for column in ISOLATION_WINDOW_COLUMNS:
+        # Append NaN so that features without an isolation window (code -1) are assigned NaN.
+        values = np.append(windows[column].values, np.nan)
+        feature_list[column] = values[window_codes]
+    return feature_list
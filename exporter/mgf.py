@@ -1,10 +1,18 @@
 import os
-import copy
+import functools
 import argparse
-from scilslab import LocalSession
-import numpy as np
-import pandas as pd
-from pyteomics import mgf
+from exporter.spectra import get_window_filename, remove_files
+from exporter.mgf_writer import BUFFER_SIZE, format_mgf_spectrum, write_mgf
+from exporter.archive import ARCHIVE_FORMATS, WindowArchive, get_archive_path
+from exporter.parallel import BackgroundWriter, WindowPool
+from exporter.incremental import WindowManifest, get_manifest_path
+from exporter.profiling import profile_stage
+from exporter.arguments import add_export_arguments, add_mgf_arguments, get_export_parameters
+
+
+# Values of the scan dicts yielded by exporter.spectra.iter_ms2_spectra() that determine the contents of the individual
+# MGF files for each precursor window. Used to detect changed windows in incremental exports.
+MGF_WINDOW_KEYS = ['selected_ion_mz', 'selected_ion_mobility', 'mz_array', 'intensity_array']
 
 
 def get_args():
@@ -16,63 +24,270 @@ def get_args():
     """
     parser = argparse.ArgumentParser()
     # General parameters
-    parser.add_argument('--scils',
-                        help='Path to SCiLS .slx file.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--outdir',
-                        help='Output directory.',
-                        default='',
-                        type=str)
-    parser.add_argument('--feature_list_id',
-                        help='UUID for the MS1 feature table of interest. If unknown, please run the '
-                             '"get_feature_lists" command.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--intensity_column_name',
-                        help='Name of the column from the feature table to use intensity values from. If unknown, '
-                             'please run the "get_intensity_column_names" command.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--export_single_file',
-                        help='If this flag is used, create a single MGF file containing all MS/MS spectra. Otherwise, '
-                             'create individual MGF files for each precursor window.',
-                        action='store_true')
-    parser.add_argument('--get_precursor_from_isolation_window',
-                        help='If this flag is used, populate the precursor m/z and 1/K0 values from the isolation '
-                             'window that was defined in the iprm-PASEF timsControl method.',
-                        action='store_true')
-    parser.add_argument('--relative_intensity_threshold',
-                        help='Fragments below this percentage of the total ion count (TIC) intensity are filtered and '
-                             'removed from the final MS/MS spectrum for a given precursor. '
-                             'Example: relative_intensity_threshold == 1 is equal to 1%% of the TIC as the cutoff. '
-                             'Defaults to 1 (i.e. 1%%).',
-                        metavar='[0-100]',
-                        default=1,
-                        choices=range(0, 101),
-                        type=int)
+    add_export_arguments(parser, 'MGF')
+    # MGF parameters
+    add_mgf_arguments(parser, 'MGF')
 
     arguments = parser.parse_args()
     return vars(arguments)
 
 
-def convert_iprmpasef_feature_list_to_mgf(slx, outdir, feature_list_id, intensity_column_name, export_single_file,
-                                          get_precursor_from_isolation_window, relative_intensity_threshold=1):
+def get_mgf_spectrum(scan):
+    """
+    Convert an MS/MS spectrum yielded by exporter.spectra.iter_ms2_spectra() to a pyteomics MGF spectrum dict.
+
+    :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+    :type scan: dict
+    :return: pyteomics MGF spectrum dict.
+    :rtype: dict
     """
-    Convert precursors and fragments found in a iprm-PASEF SCiLS Lab feature list to MS/MS spectra in a single MGF
-    file. If precursor is not found in the spectra, the precursor is inferred based on the iprm-PASEF precursor window
-    that was used.
+    return {'m/z array': scan['mz_array'],
+            'intensity array': scan['intensity_array'],
+            'params': {'FEATURE_ID': scan['scan_number'],
+                       'PEPMASS': scan['selected_ion_mz'],
+                       'ION_MOBILITY': scan['selected_ion_mobility'],
+                       'SCANS': 1,  # hard coded to 1 for now
+                       'MSLEVEL': 2}}
+
 
-    :param slx: Path to the input SCiLS Lab *.slx file to analyze.
+def write_mgf_window(ms2_dict, slx, outdir, mz_precision=None, intensity_precision=None):
+    """
+    Write the MS/MS spectrum from a single isolation window to its own MGF file.
+
+    :param ms2_dict: pyteomics MGF spectrum dict returned by get_mgf_spectrum().
+    :type ms2_dict: dict
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output file.
     :type slx: str
+    :param outdir: Path to folder in which to write output file.
+    :type outdir: str
+    :param mz_precision: Number of decimal places used for fragment m/z values.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values.
+    :type intensity_precision: int | None
+    :return: Path to the output MGF file.
+    :rtype: str
+    """
+    mgf_filename = get_window_filename(slx, ms2_dict['params']['PEPMASS'], ms2_dict['params']['ION_MOBILITY'], 'mgf')
+    ms2_dict['params']['FEATURE_ID'] = 1
+    write_mgf([ms2_dict], os.path.join(outdir, mgf_filename), mz_precision, intensity_precision)
+    return os.path.join(outdir, mgf_filename)
+
+
+def format_mgf_window(ms2_dict, mz_precision=None, intensity_precision=None):
+    """
+    Format the MS/MS spectrum from a single isolation window as the contents of its own MGF file. Used to write
+    individual MGF files for each precursor window into an archive.
+
+    :param ms2_dict: pyteomics MGF spectrum dict returned by get_mgf_spectrum().
+    :type ms2_dict: dict
+    :param mz_precision: Number of decimal places used for fragment m/z values.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values.
+    :type intensity_precision: int | None
+    :return: MGF file contents.
+    :rtype: bytes
+    """
+    ms2_dict['params']['FEATURE_ID'] = 1
+    return format_mgf_spectrum(ms2_dict, mz_precision, intensity_precision).encode()
+
+
+class MgfSink(object):
+    """
+    Output sink writing MS/MS spectra to a single MGF file or to individual MGF files for each precursor window. Used
+    with exporter.spectra.write_ms2_spectra().
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output file(s).
+    :type slx: str
+    :param outdir: Path to folder in which to write output file(s).
+    :type outdir: str
+    :param export_single_file: If True, create a single MGF file containing all MS/MS spectra. Otherwise, create
+        individual MGF files for each precursor window.
+    :type export_single_file: bool
+    :param workers: Number of worker processes used to write individual MGF files for each precursor window.
+    :type workers: int
+    :param mz_precision: Number of decimal places used for fragment m/z values. Defaults to the shortest
+        representation that round trips.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values. Defaults to the shortest
+        representation that round trips.
+    :type intensity_precision: int | None
+    :param archive: Archive format used to write individual MGF files for each precursor window, either "zip", "tar",
+        or "sharded". If None, individual MGF files are written to the output directory.
+    :type archive: str | None
+    :param profiler: Export profiler used to time formatting and writing MGF spectra when writing a single MGF file.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    :param incremental: If True, only rewrite the individual MGF files of precursor windows that changed since the
+        previous export and remove the files of windows that no longer exist. Requires individual MGF files to be
+        written to the output directory.
+    :type incremental: bool
+    :param write_queue_size: If greater than 0, write the single MGF file or archive in a background thread while the
+        next spectra are formatted, queueing at most this number of spectra.
+    :type write_queue_size: int
+    """
+    export_format = 'mgf'
+
+    def __init__(self, slx, outdir, export_single_file, workers=1, mz_precision=None, intensity_precision=None,
+                 archive=None, profiler=None, incremental=False, write_queue_size=0):
+        if archive is not None and archive not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unknown archive format "{archive}". Expected one of {ARCHIVE_FORMATS}.')
+        if incremental and (export_single_file or archive is not None):
+            raise ValueError('Incremental export requires individual files for each precursor window and cannot be '
+                             'used when exporting a single file or archives.')
+        self.slx = slx
+        self.outdir = outdir
+        self.export_single_file = export_single_file
+        self.workers = workers
+        self.mz_precision = mz_precision
+        self.intensity_precision = intensity_precision
+        self.archive = archive
+        self.profiler = profiler
+        self.incremental = incremental
+        self.write_queue_size = write_queue_size
+        self.paths = []
+        self._file = None
+        self._archive = None
+        self._pool = None
+        self._manifest = None
+        self._write_queue = None
+
+    def open(self, n_spectra):
+        """
+        Open the output file or worker pool.
+
+        :param n_spectra: Number of MS/MS spectra that will be written.
+        :type n_spectra: int
+        """
+        if self.export_single_file:
+            mgf_filename = f'{os.path.splitext(os.path.split(self.slx)[-1])[0]}_iprm-PASEF_MSMS.mgf'
+            self.paths.append(os.path.join(self.outdir, mgf_filename))
+            self._file = open(self.paths[-1], 'w', buffering=BUFFER_SIZE)
+            if self.write_queue_size > 0:
+                self._write_queue = BackgroundWriter(self._file.write, self.write_queue_size)
+        elif self.archive is not None:
+            self._archive = WindowArchive(get_archive_path(self.slx, self.outdir, 'mgf', self.archive),
+                                          self.archive, self.slx, 'mgf')
+            self.paths.append(self._archive.path)
+            self._archive.open()
+            if self.write_queue_size > 0:
+                self._write_queue = BackgroundWriter(self._archive.write, self.write_queue_size)
+            # MGF file contents are formatted by the worker pool and added to the archive in submission order.
+            self._pool = WindowPool(functools.partial(format_mgf_window,
+                                                      mz_precision=self.mz_precision,
+                                                      intensity_precision=self.intensity_precision),
+                                    workers=self.workers,
+                                    callback=self._archive.write if self._write_queue is None else
+                                    self._write_queue.submit)
+        else:
+            if self.incremental:
+                self._manifest = WindowManifest(get_manifest_path(self.slx, self.outdir, 'mgf'),
+                                                {'format': 'mgf',
+                                                 'mz_precision': self.mz_precision,
+                                                 'intensity_precision': self.intensity_precision},
+                                                MGF_WINDOW_KEYS)
+                self._manifest.load()
+            self._pool = WindowPool(functools.partial(write_mgf_window,
+                                                      slx=self.slx,
+                                                      outdir=self.outdir,
+                                                      mz_precision=self.mz_precision,
+                                                      intensity_precision=self.intensity_precision),
+                                    workers=self.workers)
+
+    def write(self, scan):
+        """
+        Write an MS/MS spectrum.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        """
+        if self.export_single_file:
+            with profile_stage(self.profiler, 'format', items=len(scan['mz_array'])):
+                mgf_spectrum = format_mgf_spectrum(get_mgf_spectrum(scan), self.mz_precision, self.intensity_precision)
+            # Only includes the time spent waiting for the background writer if the write queue is full.
+            with profile_stage(self.profiler, 'file_write'):
+                if self._write_queue is not None:
+                    self._write_queue.submit(mgf_spectrum)
+                else:
+                    self._file.write(mgf_spectrum)
+        elif self._archive is not None:
+            self._archive.add_window(scan)
+            self._pool.submit(get_mgf_spectrum(scan))
+        else:
+            path = os.path.join(self.outdir, get_window_filename(self.slx,
+                                                                 scan['selected_ion_mz'],
+                                                                 scan['selected_ion_mobility'],
+                                                                 'mgf'))
+            # Unchanged windows are skipped in incremental exports.
+            if self._manifest is not None and not self._manifest.needs_update(path, scan):
+                return
+            self.paths.append(path)
+            self._pool.submit(get_mgf_spectrum(scan))
+
+    def close(self):
+        """
+        Close the output file or wait for all worker processes to finish.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._write_queue is not None:
+            self._write_queue.close()
+            self._write_queue = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def abort(self):
+        """
+        Stop writing and remove all MGF files or archives written by this sink.
+        """
+        try:
+            if self._pool is not None:
+                self._pool.close(wait=False)
+            if self._write_queue is not None:
+                self._write_queue.close(wait=False)
+            if self._file is not None:
+                self._file.close()
+        except Exception:
+            # Output files are removed below regardless of whether they could be closed cleanly.
+            pass
+        finally:
+            self._file = None
+            self._pool = None
+            self._write_queue = None
+            # The previous manifest is kept, so files removed below are written again by the next incremental export.
+            self._manifest = None
+            if self._archive is not None:
+                self._archive.abort()
+                self._archive = None
+            remove_files(self.paths)
+
+
+def convert_iprmpasef_feature_list_to_mgf(slx, outdir, feature_list_id, intensity_column_name, export_single_file,
+                                          get_precursor_from_isolation_window, relative_intensity_threshold=1,
+                                          **kwargs):
+    """
+    Convert precursors and fragments found in a iprm-PASEF SCiLS Lab feature list to MS/MS spectra in MGF file(s)
+    using exporter.export.convert_iprmpasef_feature_list(). If precursor is not found in the spectra, the precursor is
+    inferred based on the iprm-PASEF precursor window that was used.
+
+    :param slx: Path to the input SCiLS Lab *.slx file to analyze or an open exporter.session.ScilsSession to reuse.
+    :type slx: str | exporter.session.ScilsSession
     :param outdir: Path to folder in which to write output file(s). Defaults to the input SCiLS Lab *.slx file path.
     :type outdir: str
     :param feature_list_id: UUID for the MS1 feature table of interest. If unknown, please run the "get_feature_lists"
         command.
     :type feature_list_id: str
     :param intensity_column_name: Name of the column from the feature table to use intensity values from. If unknown,
-        please run the "get_intensity_column_names" command.
-    :type intensity_column_name: str
+        please run the "get_intensity_column_names" command. If a list of column names is given, MS/MS spectra are
+        built for all columns at once and the files for each column are written to a subdirectory of the output
+        directory named after the column.
+    :type intensity_column_name: str | list[str]
     :param export_single_file: If this flag is used, create a single MGF file containing all MS/MS spectra. Otherwise,
         create individual MGF files for each precursor window.
     :type export_single_file: bool
@@ -83,67 +298,14 @@ def convert_iprmpasef_feature_list_to_mgf(slx, outdir, feature_list_id, intensit
         fragment peaks. A threshold value of '1' corresponds to a threshold of 1% of the sum of all fragment intensity
         values for a given precursor.
     :type relative_intensity_threshold: int
+    :param kwargs: Additional parameters of exporter.export.convert_iprmpasef_feature_list() (i.e. workers,
+        mz_precision, archive, or fragment_filters).
+    :type kwargs: dict
     """
-    # Set output directory if not specified.
-    if outdir == '':
-        outdir = os.path.dirname(slx)
-    # Set relative intensity threshold to float value.
-    relative_intensity_threshold = relative_intensity_threshold / 100
-    with LocalSession(filename=slx) as session:
-        dataset = session.dataset_proxy
-        # Get iprm-PASEF feature table from iprm SCiLS file containing precursor/fragment and isolation window columns.
-        feature_list = dataset.feature_table.get_features(feature_list_id, include_all_user_columns=True)
-        # Subset feature table by isolation window. Each feature table will contain all precursor and fragment features
-        # detected by Bruker T-ReX feature finding in SCiLS.
-        # Feature tables stored as a dict where key == isolation window string and value == pd.DataFrame.
-        feature_lists = {key: value.reset_index() for key, value in feature_list.groupby('isolation_window')}
-        # Process iprm-PASEF feature table for each precursor/isolation window.
-        count = 1
-        ms2_dict_list = []
-        for window, table in feature_lists.items():
-            precursor_table = table[table['type'] == 'Precursor'].reset_index()
-            fragment_table = table[table['type'] == 'Fragment'].reset_index()
-            # Get precursor m/z and 1/K0 values.
-            if not precursor_table.empty and not get_precursor_from_isolation_window:
-                # Calculated weighted average for precursor m/z and 1/K0 using feature intensity as weights.
-                precursor_mz_array = (precursor_table['mz_low'] + precursor_table['mz_high']) / 2
-                precursor_mz_array = precursor_mz_array.values
-                precursor_ook0_array = (precursor_table['one_over_k0_low'] + precursor_table['one_over_k0_high']) / 2
-                precursor_ook0_array = precursor_ook0_array.values
-                precursor_mz = np.average(precursor_mz_array, weights=precursor_table[intensity_column_name])
-                precursor_ook0 = np.average(precursor_ook0_array, weights=precursor_table[intensity_column_name])
-            else:
-                # If no precursor type feature detected via feature finding, parse and use isolation window for
-                # precursor m/z and 1/K0.
-                precursor_mz = float(window.split(',')[0][:-4])
-                precursor_ook0 = float(window.split(',')[1][6:])
-            # Filter and remove any fragment type features based on relative intensity cutoff.
-            fragment_table = fragment_table[fragment_table[intensity_column_name] >= (
-                    np.sum(fragment_table[intensity_column_name].values) * relative_intensity_threshold)]
-            fragment_mz_array = (fragment_table['mz_low'] + fragment_table['mz_high']) / 2
-            fragment_mz_array = fragment_mz_array.values
-            fragment_table = pd.DataFrame({'mz': fragment_mz_array,
-                                           'intensity': fragment_table[intensity_column_name].values})
-            fragment_table = fragment_table.sort_values(by='mz')
-            # Save to list of MS/MS dicts for export to MGF file.
-            ms2_dict = {'m/z array': copy.deepcopy(fragment_table['mz'].values),
-                        'intensity array': copy.deepcopy(fragment_table['intensity'].values),
-                        'params': {'FEATURE_ID': count,
-                                   'PEPMASS': precursor_mz,
-                                   'ION_MOBILITY': precursor_ook0,
-                                   'SCANS': 1,  # hard coded to 1 for now
-                                   'MSLEVEL': 2}}
-            ms2_dict_list.append(ms2_dict)
-            count += 1
-        # Export MS/MS spectra to MGF file(s).
-        if export_single_file:
-            mgf_filename = f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_MSMS.mgf'
-            mgf.write(ms2_dict_list, output=os.path.join(outdir, mgf_filename), file_mode='w')
-        else:
-            for ms2_dict in ms2_dict_list:
-                mgf_filename = f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_mz{ms2_dict["params"]["PEPMASS"]}_ook0{ms2_dict["params"]["ION_MOBILITY"]}.mgf'
-                ms2_dict['params']['FEATURE_ID'] = 1
-                mgf.write([ms2_dict], output=os.path.join(outdir, mgf_filename), file_mode='w')
+    # exporter.export imports this module, so it is only imported once the export is run.
+    from exporter.export import convert_iprmpasef_feature_list
+    convert_iprmpasef_feature_list(slx, outdir, feature_list_id, intensity_column_name, ['mgf'], export_single_file,
+                                   get_precursor_from_isolation_window, relative_intensity_threshold, **kwargs)
 
 
 def main():
@@ -151,10 +313,4 @@ def main():
     Run workflow.
     """
     args = get_args()
-    convert_iprmpasef_feature_list_to_mgf(slx=args['scils'],
-                                          outdir=args['outdir'],
-                                          feature_list_id=args['feature_list_id'],
-                                          intensity_column_name=args['intensity_column_name'],
-                                          export_single_file=args['export_single_file'],
-                                          get_precursor_from_isolation_window=args['get_precursor_from_isolation_window'],
-                                          relative_intensity_threshold=args['relative_intensity_threshold'])
+    convert_iprmpasef_feature_list_to_mgf(**get_export_parameters(args))
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+# Buffer size in bytes used when writing MGF files.
+BUFFER_SIZE = 1024 ** 2
+
+
+def get_peak_values(array, precision=None):
+    """
+    Convert a peak array to a list of values that are formatted as text in bulk by format_mgf_spectrum().
+
+    :param array: Fragment m/z or intensity array.
+    :type array: numpy.ndarray
+    :param precision: Number of decimal places to write. If None, values are written using the shortest representation
+        that round trips, which is identical to the output of pyteomics.mgf.write().
+    :type precision: int | None
+    :return: List of Python numbers or, for 32-bit float arrays, strings.
+    :rtype: list
+    """
+    array = np.asarray(array)
+    if precision is not None:
+        return array.astype(np.float64).tolist()
+    if array.dtype == np.float32:
+        # tolist() converts 32-bit floats to Python floats, whose shortest representation includes digits that are not
+        # part of the 32-bit value, so 32-bit floats are formatted by numpy instead.
+        return array.astype(str).tolist()
+    # Formatting the Python scalars returned by tolist() gives the same text as formatting the numpy scalars.
+    return array.tolist()
+
+
+def format_mgf_spectrum(spectrum, mz_precision=None, intensity_precision=None):
+    """
+    Format a single MS/MS spectrum as an MGF BEGIN IONS/END IONS block. Peak lists are formatted with a single string
+    formatting operation per spectrum instead of once per peak. With the default precision, the output is byte
+    compatible with pyteomics.mgf.write() for spectra returned by exporter.mgf.get_mgf_spectrum().
+
+    :param spectrum: pyteomics MGF spectrum dict containing 'm/z array', 'intensity array', and 'params' keys.
+    :type spectrum: dict
+    :param mz_precision: Number of decimal places used for fragment m/z values. Defaults to the shortest
+        representation that round trips.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values. Defaults to the shortest
+        representation that round trips.
+    :type intensity_precision: int | None
+    :return: MGF formatted spectrum.
+    :rtype: str
+    """
+    mz_values = get_peak_values(spectrum['m/z array'], mz_precision)
+    intensity_values = get_peak_values(spectrum['intensity array'], intensity_precision)
+    values = [None] * (len(mz_values) + len(intensity_values))
+    values[::2] = mz_values
+    values[1::2] = intensity_values
+    peak_format = (f'%.{mz_precision}f' if mz_precision is not None else '%s') + ' ' + \
+                  (f'%.{intensity_precision}f' if intensity_precision is not None else '%s') + ' \n'
+    return 'BEGIN IONS\n' + \
+        ''.join([f'{key.upper()}={value}\n' for key, value in spectrum['params'].items()]) + \
+        (peak_format * len(mz_values)) % tuple(values) + \
+        'END IONS\n\n'
+
+
+def write_mgf(spectra, output, mz_precision=None, intensity_precision=None):
+    """
+    Write MS/MS spectra to an MGF file using format_mgf_spectrum().
+
+    :param spectra: pyteomics MGF spectrum dicts.
+    :type spectra: collections.abc.Iterable[dict]
+    :param output: Path to the output MGF file or a file object opened in text mode for writing.
+    :type output: str | io.TextIOBase
+    :param mz_precision: Number of decimal places used for fragment m/z values.
+    :type mz_precision: int | None
+    :param intensity_precision: Number of decimal places used for fragment intensity values.
+    :type intensity_precision: int | None
+    """
+    if isinstance(output, str):
+        with open(output, 'w', buffering=BUFFER_SIZE) as mgf_file:
+            write_mgf(spectra, mgf_file, mz_precision, intensity_precision)
+        return
+    for spectrum in spectra:
+        output.write(format_mgf_spectrum(spectrum, mz_precision, intensity_precision))
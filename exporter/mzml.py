@@ -1,10 +1,32 @@
 import os
-import copy
+import io
+import functools
+import contextlib
 import argparse
-from scilslab import LocalSession
+import warnings
 import numpy as np
-import pandas as pd
-from psims.mzml import MzMLWriter
+from exporter.mzml_options import DEFAULT_COMPRESSION_LEVEL
+from exporter.mzml_encoding import NUMPRESS_ENCODINGS, EncodedArrayMzMLWriter, EncodingPool, get_compression_name, \
+    pynumpress
+from exporter.archive import ARCHIVE_FORMATS, WindowArchive, get_archive_path
+from exporter.spectra import get_window_filename, remove_files
+from exporter.parallel import BackgroundWriter, WindowPool
+from exporter.incremental import WindowManifest, get_manifest_path
+from exporter.profiling import profile_stage
+from exporter.arguments import add_export_arguments, add_mzml_arguments, get_export_parameters
+
+try:
+    # psims warns when hdf5plugin is not installed. Only GZIP compression is used for mzMLb files.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        from psims.mzmlb import MzMLbWriter
+except ImportError:
+    MzMLbWriter = None
+
+
+# Values of the scan dicts yielded by exporter.spectra.iter_ms2_spectra() that determine the contents of the individual
+# mzML files for each precursor window. Used to detect changed windows in incremental exports.
+MZML_WINDOW_KEYS = ['scan_number', 'selected_ion_mz', 'selected_ion_mobility', 'mz_array', 'intensity_array']
 
 
 def get_args():
@@ -16,67 +38,9 @@ def get_args():
     """
     parser = argparse.ArgumentParser()
     # General parameters
-    parser.add_argument('--scils',
-                        help='Path to SCiLS .slx file.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--outdir',
-                        help='Output directory.',
-                        default='',
-                        type=str)
-    parser.add_argument('--feature_list_id',
-                        help='UUID for the MS1 feature table of interest. If unknown, please run the '
-                             '"get_feature_lists" command.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--intensity_column_name',
-                        help='Name of the column from the feature table to use intensity values from. If unknown, '
-                             'please run the "get_intensity_column_names" command.',
-                        required=True,
-                        type=str)
-    parser.add_argument('--polarity',
-                        help='Polarity of the spectra in the dataset. Either "positive" or "negative".',
-                        choices=['positive', 'negative'],
-                        required=True,
-                        type=str)
-    parser.add_argument('--barebones_metadata',
-                        help='Only use basic mzML metadata. Use if downstream data analysis tools throw errors with '
-                             'descriptive CV terms.',
-                        action='store_true')
-    parser.add_argument('--export_single_file',
-                        help='If this flag is used, create a single mzML file containing all MS/MS spectra. Otherwise, '
-                             'create individual mzML files for each precursor window.',
-                        action='store_true')
-    parser.add_argument('--get_precursor_from_isolation_window',
-                        help='If this flag is used, populate the precursor m/z and 1/K0 values from the isolation '
-                             'window that was defined in the iprm-PASEF timsControl method.',
-                        action='store_true')
-    parser.add_argument('--relative_intensity_threshold',
-                        help='Fragments below this percentage of the total ion count (TIC) intensity are filtered and '
-                             'removed from the final MS/MS spectrum for a given precursor. '
-                             'Example: relative_intensity_threshold == 1 is equal to 1%% of the TIC as the cutoff. '
-                             'Defaults to 1 (i.e. 1%%).',
-                        metavar='[0-100]',
-                        default=1,
-                        choices=range(0, 101),
-                        type=int)
-    parser.add_argument('--mz_encoding',
-                        help='Choose encoding for m/z array: 32-bit (\"32\") or 64-bit (\"64\"). Defaults to 64-bit.',
-                        default=64,
-                        type=int,
-                        choices=[32, 64])
-    parser.add_argument('--intensity_encoding',
-                        help='Choose encoding for intensity array: 32-bit (\"32\") or 64-bit (\"64\"). Defaults to '
-                             '64-bit.',
-                        default=64,
-                        type=int,
-                        choices=[32, 64])
-    parser.add_argument('--compression',
-                        help='Choose between ZLIB compression (\"zlib\") or no compression (\"none\"). Defaults to '
-                             '\"zlib\".',
-                        default='zlib',
-                        type=str,
-                        choices=['zlib', 'none'])
+    add_export_arguments(parser, 'mzML')
+    # mzML parameters
+    add_mzml_arguments(parser, 'mzML')
 
     arguments = parser.parse_args()
     return vars(arguments)
@@ -133,7 +97,98 @@ def write_mzml_metadata(writer, infile, barebones_metadata):
         writer.data_processing_list([processing])
 
 
-def write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compression):
+def get_encoding_dtype(encoding):
+    """
+    Use "encoding" command line parameter to determine numpy dtype.
+
+    :param encoding: Encoding command line parameter, either "64", "32", or an MS-Numpress encoding. MS-Numpress
+        encoded arrays are decoded as 64-bit floats.
+    :type encoding: int | str
+    :return: Numpy dtype, either float64 or float32
+    :rtype: numpy.dtype
+    """
+    if encoding == 32:
+        return np.float32
+    elif encoding == 64 or encoding in NUMPRESS_ENCODINGS:
+        return np.float64
+
+
+def get_array_compressions(mz_encoding, intensity_encoding, compression, mzmlb=False):
+    """
+    Get the compression names used for the m/z and intensity binary data arrays.
+
+    :param mz_encoding: m/z encoding command line parameter, either "64", "32", or "numpress_linear".
+    :type mz_encoding: int | str
+    :param intensity_encoding: Intensity encoding command line parameter, either "64", "32", "numpress_slof", or
+        "numpress_pic".
+    :type intensity_encoding: int | str
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :param mzmlb: If True, get compression names for an mzMLb file. Binary data arrays in mzMLb files are compressed by
+        HDF5, so they are not compressed themselves.
+    :type mzmlb: bool
+    :return: Dictionary of compression names for the "m/z array" and "intensity array" binary data arrays.
+    :rtype: dict
+    """
+    if mzmlb:
+        compression = 'none'
+    return {'m/z array': get_compression_name(mz_encoding, compression),
+            'intensity array': get_compression_name(intensity_encoding, compression)}
+
+
+def check_mzml_options(mz_encoding, intensity_encoding, mzmlb):
+    """
+    Check that the selected encodings and output file format can be written before exporting any spectra.
+
+    :param mz_encoding: m/z encoding command line parameter, either "64", "32", or "numpress_linear".
+    :type mz_encoding: int | str
+    :param intensity_encoding: Intensity encoding command line parameter, either "64", "32", "numpress_slof", or
+        "numpress_pic".
+    :type intensity_encoding: int | str
+    :param mzmlb: If True, mzMLb files will be written instead of mzML files.
+    :type mzmlb: bool
+    """
+    if mz_encoding not in [32, 64, 'numpress_linear']:
+        raise ValueError(f'Unknown m/z encoding "{mz_encoding}". Expected 32, 64, or "numpress_linear".')
+    if intensity_encoding not in [32, 64, 'numpress_slof', 'numpress_pic']:
+        raise ValueError(f'Unknown intensity encoding "{intensity_encoding}". Expected 32, 64, "numpress_slof", or '
+                         f'"numpress_pic".')
+    if (mz_encoding in NUMPRESS_ENCODINGS or intensity_encoding in NUMPRESS_ENCODINGS) and pynumpress is None:
+        raise ImportError('pynumpress is required for MS-Numpress encoding. Install pynumpress or use 32-bit or 64-bit '
+                          'encoding.')
+    if mzmlb:
+        if MzMLbWriter is None:
+            raise ImportError('h5py is required to write mzMLb files. Install h5py or write mzML files instead.')
+        if mz_encoding in NUMPRESS_ENCODINGS or intensity_encoding in NUMPRESS_ENCODINGS:
+            raise ValueError('MS-Numpress encoding is not supported for mzMLb files. Use 32-bit or 64-bit encoding.')
+
+
+def get_mzml_writer(path, mzmlb, compression, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Get a psims writer for an mzML or mzMLb output file.
+
+    :param path: Path to the output file or a binary file object (i.e. io.BytesIO), which is left open.
+    :type path: str | io.BytesIO
+    :param mzmlb: If True, write an mzMLb file. Otherwise, write an mzML file.
+    :type mzmlb: bool
+    :param compression: Compression command line parameter, either "zlib" or "none". For mzMLb files, determines
+        whether the HDF5 datasets storing binary data arrays are GZIP compressed.
+    :type compression: str
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files).
+    :type compression_level: int
+    :return: Writer for the output file.
+    :rtype: exporter.mzml_encoding.EncodedArrayMzMLWriter | psims.mzmlb.MzMLbWriter
+    """
+    if mzmlb:
+        # psims does not support uncompressed HDF5 datasets, so GZIP level 0 is used for uncompressed mzMLb files.
+        return MzMLbWriter(path,
+                           close=True,
+                           h5_compression='gzip',
+                           h5_compression_options=compression_level if compression == 'zlib' else 0)
+    return EncodedArrayMzMLWriter(path, close=isinstance(path, str))
+
+
+def write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compression, encoded_arrays=None):
     """
     Write an MS/MS spectrum to an mzML file using psims.
 
@@ -145,35 +200,27 @@ def write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compressio
     :type mz_encoding: int
     :param intensity_encoding: Intensity encoding command line parameter, either "64" or "32".
     :type intensity_encoding: int
-    :param compression: Compression command line parameter, either "zlib" or "none".
-    :type compression: str
+    :param compression: Compression command line parameter, either "zlib" or "none", or a dictionary of compression
+        names for each binary data array returned by get_array_compressions().
+    :type compression: str | dict
+    :param encoded_arrays: m/z and intensity arrays that have already been encoded using
+        exporter.mzml_encoding.EncodingPool. Requires writer to be an exporter.mzml_encoding.EncodedArrayMzMLWriter. If
+        None, the arrays in scan are encoded by psims.
+    :type encoded_arrays: tuple[exporter.mzml_encoding.EncodedArray, exporter.mzml_encoding.EncodedArray] | None
     """
-
-    def get_encoding_dtype(encoding):
-        """
-        Use "encoding" command line parameter to determine numpy dtype.
-
-        :param encoding: Encoding command line parameter, either "64" or "32".
-        :type encoding: int
-        :return: Numpy dtype, either float64 or float32
-        :rtype: numpy.dtype
-        """
-        if encoding == 32:
-            return np.float32
-        elif encoding == 64:
-            return np.float64
-
     # Build params list for spectrum.
-    base_peak_index = np.where(scan['intensity_array'] == np.max(scan['intensity_array']))
     params = ['MSn spectrum',
               {'ms level': 2},
-              {'total ion current': sum(scan['mz_array'])},
-              {'base peak m/z': scan['mz_array'][base_peak_index][0].astype(float)},
-              ({'name': 'base peak intensity',
-                'unit_name': 'number of detector counts',
-                'value': scan['intensity_array'][base_peak_index][0].astype(float)}),
-              {'highest observed m/z': float(max(scan['mz_array']))},
-              {'lowest observed m/z': float(min(scan['mz_array']))}]
+              {'total ion current': sum(scan['mz_array'])}]
+    # Spectra without any fragments (i.e. after fragment filtering) have no base peak or observed m/z range.
+    if len(scan['mz_array']):
+        base_peak_index = np.where(scan['intensity_array'] == np.max(scan['intensity_array']))
+        params += [{'base peak m/z': scan['mz_array'][base_peak_index][0].astype(float)},
+                   ({'name': 'base peak intensity',
+                     'unit_name': 'number of detector counts',
+                     'value': scan['intensity_array'][base_peak_index][0].astype(float)}),
+                   {'highest observed m/z': float(max(scan['mz_array']))},
+                   {'lowest observed m/z': float(min(scan['mz_array']))}]
     # Get encoding information
     encoding_dict = {'m/z array': get_encoding_dtype(mz_encoding),
                      'intensity array': get_encoding_dtype(intensity_encoding)}
@@ -181,8 +228,10 @@ def write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compressio
     precursor_info = {'mz': scan['selected_ion_mz'],
                       'isolation_window_args': {'target': scan['selected_ion_mz']},
                       'params': [{'inverse reduced ion mobility': scan['selected_ion_mobility']}]}
-    writer.write_spectrum(scan['mz_array'],
-                          scan['intensity_array'],
+    if encoded_arrays is None:
+        encoded_arrays = (scan['mz_array'], scan['intensity_array'])
+    writer.write_spectrum(encoded_arrays[0],
+                          encoded_arrays[1],
                           id='scan=' + str(scan['scan_number']),
                           polarity=scan['polarity'],
                           centroided=True,
@@ -193,37 +242,420 @@ def write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compressio
                           compression=compression)
 
 
+def write_mzml_window_file(output, scan, slx, barebones_metadata, mz_encoding, intensity_encoding, compression,
+                           compression_level=DEFAULT_COMPRESSION_LEVEL, mzmlb=False):
+    """
+    Write an mzML or mzMLb file containing the MS/MS spectrum from a single isolation window.
+
+    :param output: Path to the output file or a binary file object (i.e. io.BytesIO), which is left open.
+    :type output: str | io.BytesIO
+    :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra() with an added polarity key.
+    :type scan: dict
+    :param slx: Path to the input SCiLS Lab *.slx file used for source file metadata.
+    :type slx: str
+    :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML file.
+    :type barebones_metadata: bool
+    :param mz_encoding: m/z encoding command line parameter, either "64", "32", or "numpress_linear".
+    :type mz_encoding: int | str
+    :param intensity_encoding: Intensity encoding command line parameter, either "64", "32", "numpress_slof", or
+        "numpress_pic".
+    :type intensity_encoding: int | str
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files).
+    :type compression_level: int
+    :param mzmlb: If True, write an mzMLb file instead of an mzML file.
+    :type mzmlb: bool
+    """
+    array_compressions = get_array_compressions(mz_encoding, intensity_encoding, compression, mzmlb)
+    encoded_arrays = None
+    if not mzmlb:
+        # mzMLb binary data arrays are written to HDF5 datasets by psims instead of being encoded in the XML.
+        encoded_arrays = EncodingPool(get_encoding_dtype(mz_encoding),
+                                      get_encoding_dtype(intensity_encoding),
+                                      array_compressions['m/z array'],
+                                      array_compressions['intensity array'],
+                                      compression_level).encode(scan)
+    writer = get_mzml_writer(output, mzmlb, compression, compression_level)
+    with writer:
+        # Begin mzML writer using psims.
+        writer.controlled_vocabularies()
+        # Start write acquisition, instrument config, processing, etc. to mzML.
+        write_mzml_metadata(writer, slx, barebones_metadata)
+        # Parse chunks of data and write to spectrum element.
+        with writer.run(id='run',
+                        instrument_configuration='instrument',
+                        start_time='1969-12-31T19:00:00.000-05:00'):
+            with writer.spectrum_list(count=1):
+                write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, array_compressions, encoded_arrays)
+
+
+def write_mzml_window(scan, slx, outdir, barebones_metadata, mz_encoding, intensity_encoding, compression,
+                      compression_level=DEFAULT_COMPRESSION_LEVEL, mzmlb=False):
+    """
+    Write the MS/MS spectrum from a single isolation window to its own mzML or mzMLb file.
+
+    :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra() with an added polarity key.
+    :type scan: dict
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output file and for source file metadata.
+    :type slx: str
+    :param outdir: Path to folder in which to write output file.
+    :type outdir: str
+    :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML file.
+    :type barebones_metadata: bool
+    :param mz_encoding: m/z encoding command line parameter, either "64", "32", or "numpress_linear".
+    :type mz_encoding: int | str
+    :param intensity_encoding: Intensity encoding command line parameter, either "64", "32", "numpress_slof", or
+        "numpress_pic".
+    :type intensity_encoding: int | str
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files).
+    :type compression_level: int
+    :param mzmlb: If True, write an mzMLb file instead of an mzML file.
+    :type mzmlb: bool
+    :return: Path to the output mzML file.
+    :rtype: str
+    """
+    mzml_filename = get_window_filename(slx, scan['selected_ion_mz'], scan['selected_ion_mobility'],
+                                        'mzMLb' if mzmlb else 'mzML')
+    write_mzml_window_file(os.path.join(outdir, mzml_filename), scan, slx, barebones_metadata, mz_encoding,
+                           intensity_encoding, compression, compression_level, mzmlb)
+    return os.path.join(outdir, mzml_filename)
+
+
+def format_mzml_window(scan, slx, barebones_metadata, mz_encoding, intensity_encoding, compression,
+                       compression_level=DEFAULT_COMPRESSION_LEVEL, mzmlb=False):
+    """
+    Write the MS/MS spectrum from a single isolation window to an in-memory mzML or mzMLb file. Used to write
+    individual mzML files for each precursor window into an archive.
+
+    :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra() with an added polarity key.
+    :type scan: dict
+    :param slx: Path to the input SCiLS Lab *.slx file used for source file metadata.
+    :type slx: str
+    :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML file.
+    :type barebones_metadata: bool
+    :param mz_encoding: m/z encoding command line parameter, either "64", "32", or "numpress_linear".
+    :type mz_encoding: int | str
+    :param intensity_encoding: Intensity encoding command line parameter, either "64", "32", "numpress_slof", or
+        "numpress_pic".
+    :type intensity_encoding: int | str
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files).
+    :type compression_level: int
+    :param mzmlb: If True, write an mzMLb file instead of an mzML file.
+    :type mzmlb: bool
+    :return: mzML or mzMLb file contents.
+    :rtype: bytes
+    """
+    output = io.BytesIO()
+    write_mzml_window_file(output, scan, slx, barebones_metadata, mz_encoding, intensity_encoding, compression,
+                           compression_level, mzmlb)
+    return output.getvalue()
+
+
+class MzmlSink(object):
+    """
+    Output sink writing MS/MS spectra to a single mzML file or to individual mzML files for each precursor window. Used
+    with exporter.spectra.write_ms2_spectra(). mzMLb files are written instead of mzML files if mzmlb is True.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output file(s) and for source file metadata.
+    :type slx: str
+    :param outdir: Path to folder in which to write output file(s).
+    :type outdir: str
+    :param polarity: Polarity of the spectra in the dataset. Either "+" or "-".
+    :type polarity: str
+    :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML files.
+    :type barebones_metadata: bool
+    :param mz_encoding: m/z encoding command line parameter, either "64" or "32".
+    :type mz_encoding: int
+    :param intensity_encoding: Intensity encoding command line parameter, either "64" or "32".
+    :type intensity_encoding: int
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :param export_single_file: If True, create a single mzML file containing all MS/MS spectra. Otherwise, create
+        individual mzML files for each precursor window.
+    :type export_single_file: bool
+    :param workers: Number of worker processes used to write individual mzML files for each precursor window.
+    :type workers: int
+    :param compression_level: ZLIB compression level from 0 (fastest) to 9 (smallest files).
+    :type compression_level: int
+    :param encoding_threads: Number of threads used to compress and encode binary data arrays while spectra are
+        written to a single mzML file.
+    :type encoding_threads: int
+    :param mzmlb: If True, write mzMLb files instead of mzML files.
+    :type mzmlb: bool
+    :param archive: Archive format used to write individual mzML files for each precursor window, either "zip",
+        "tar", or "sharded". If None, individual mzML files are written to the output directory.
+    :type archive: str | None
+    :param profiler: Export profiler used to time encoding binary data arrays and writing spectra when writing a single
+        mzML file.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    :param incremental: If True, only rewrite the individual mzML files of precursor windows that changed since the
+        previous export and remove the files of windows that no longer exist. Requires individual mzML files to be
+        written to the output directory.
+    :type incremental: bool
+    :param write_queue_size: If greater than 0, write the single mzML file or archive in a background thread while
+        the binary data arrays of the next spectra are encoded, queueing at most this number of spectra.
+    :type write_queue_size: int
+    """
+    export_format = 'mzml'
+
+    def __init__(self, slx, outdir, polarity, barebones_metadata, mz_encoding, intensity_encoding, compression,
+                 export_single_file, workers=1, compression_level=DEFAULT_COMPRESSION_LEVEL, encoding_threads=1,
+                 mzmlb=False, archive=None, profiler=None, incremental=False, write_queue_size=0):
+        check_mzml_options(mz_encoding, intensity_encoding, mzmlb)
+        if archive is not None and archive not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unknown archive format "{archive}". Expected one of {ARCHIVE_FORMATS}.')
+        if incremental and (export_single_file or archive is not None):
+            raise ValueError('Incremental export requires individual files for each precursor window and cannot be '
+                             'used when exporting a single file or archives.')
+        self.slx = slx
+        self.outdir = outdir
+        self.polarity = polarity
+        self.barebones_metadata = barebones_metadata
+        self.mz_encoding = mz_encoding
+        self.intensity_encoding = intensity_encoding
+        self.compression = compression
+        self.export_single_file = export_single_file
+        self.workers = workers
+        self.compression_level = compression_level
+        self.encoding_threads = encoding_threads
+        self.mzmlb = mzmlb
+        self.archive = archive
+        self.profiler = profiler
+        self.incremental = incremental
+        self.write_queue_size = write_queue_size
+        self.array_compressions = get_array_compressions(mz_encoding, intensity_encoding, compression, mzmlb)
+        self.paths = []
+        self._writer = None
+        self._contexts = None
+        self._encoder = None
+        self._archive = None
+        self._pool = None
+        self._manifest = None
+        self._write_queue = None
+
+    def _write_spectrum(self, scan, encoded_arrays=None):
+        # Write a spectrum to the single mzML file, either directly or using the background writer.
+        if self._write_queue is not None:
+            self._write_queue.submit(scan, encoded_arrays)
+        else:
+            self._write_to_file(scan, encoded_arrays)
+
+    def _write_to_file(self, scan, encoded_arrays=None):
+        write_ms2_spectrum(self._writer, scan, self.mz_encoding, self.intensity_encoding, self.array_compressions,
+                           encoded_arrays)
+
+    def open(self, n_spectra):
+        """
+        Open the output file and write mzML metadata or open the worker pool.
+
+        :param n_spectra: Number of MS/MS spectra that will be written.
+        :type n_spectra: int
+        """
+        if self.export_single_file:
+            # mzML writing code modified from TIMSCONVERT.
+            # Initialize writer using psims.
+            mzml_filename = f'{os.path.splitext(os.path.split(self.slx)[-1])[0]}_iprm-PASEF_MSMS.' + \
+                            ('mzMLb' if self.mzmlb else 'mzML')
+            self.paths.append(os.path.join(self.outdir, mzml_filename))
+            self._contexts = contextlib.ExitStack()
+            self._writer = self._contexts.enter_context(get_mzml_writer(self.paths[-1], self.mzmlb, self.compression,
+                                                                        self.compression_level))
+            # Begin mzML writer using psims.
+            self._writer.controlled_vocabularies()
+            # Start write acquisition, instrument config, processing, etc. to mzML.
+            write_mzml_metadata(self._writer, self.slx, self.barebones_metadata)
+            # Parse chunks of data and write to spectrum element.
+            self._contexts.enter_context(self._writer.run(id='run',
+                                                          instrument_configuration='instrument',
+                                                          start_time='1969-12-31T19:00:00.000-05:00'))
+            # Count number of spectra in run
+            self._contexts.enter_context(self._writer.spectrum_list(count=n_spectra))
+            # Binary data arrays are encoded ahead of the writer in a thread pool. mzMLb binary data arrays are written
+            # to HDF5 datasets by psims instead.
+            if not self.mzmlb:
+                self._encoder = EncodingPool(get_encoding_dtype(self.mz_encoding),
+                                             get_encoding_dtype(self.intensity_encoding),
+                                             self.array_compressions['m/z array'],
+                                             self.array_compressions['intensity array'],
+                                             self.compression_level,
+                                             self.encoding_threads)
+            # The psims writer is only used by the background writer thread until the file is closed.
+            if self.write_queue_size > 0:
+                self._write_queue = BackgroundWriter(self._write_to_file, self.write_queue_size)
+        elif self.archive is not None:
+            extension = 'mzMLb' if self.mzmlb else 'mzML'
+            self._archive = WindowArchive(get_archive_path(self.slx, self.outdir, extension, self.archive),
+                                          self.archive, self.slx, extension)
+            self.paths.append(self._archive.path)
+            self._archive.open()
+            if self.write_queue_size > 0:
+                self._write_queue = BackgroundWriter(self._archive.write, self.write_queue_size)
+            # mzML file contents are written in memory by the worker pool and added to the archive in submission
+            # order.
+            self._pool = WindowPool(functools.partial(format_mzml_window,
+                                                      slx=self.slx,
+                                                      barebones_metadata=self.barebones_metadata,
+                                                      mz_encoding=self.mz_encoding,
+                                                      intensity_encoding=self.intensity_encoding,
+                                                      compression=self.compression,
+                                                      compression_level=self.compression_level,
+                                                      mzmlb=self.mzmlb),
+                                    workers=self.workers,
+                                    callback=self._archive.write if self._write_queue is None else
+                                    self._write_queue.submit)
+        else:
+            if self.incremental:
+                extension = 'mzMLb' if self.mzmlb else 'mzML'
+                self._manifest = WindowManifest(get_manifest_path(self.slx, self.outdir, extension),
+                                                {'format': extension,
+                                                 'slx': self.slx,
+                                                 'polarity': self.polarity,
+                                                 'barebones_metadata': self.barebones_metadata,
+                                                 'mz_encoding': self.mz_encoding,
+                                                 'intensity_encoding': self.intensity_encoding,
+                                                 'compression': self.compression,
+                                                 'compression_level': self.compression_level},
+                                                MZML_WINDOW_KEYS)
+                self._manifest.load()
+            self._pool = WindowPool(functools.partial(write_mzml_window,
+                                                      slx=self.slx,
+                                                      outdir=self.outdir,
+                                                      barebones_metadata=self.barebones_metadata,
+                                                      mz_encoding=self.mz_encoding,
+                                                      intensity_encoding=self.intensity_encoding,
+                                                      compression=self.compression,
+                                                      compression_level=self.compression_level,
+                                                      mzmlb=self.mzmlb),
+                                    workers=self.workers)
+
+    def write(self, scan):
+        """
+        Write an MS/MS spectrum.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        """
+        scan = {**scan, 'polarity': self.polarity}
+        # With a write queue, file_write only includes the time spent waiting for the background writer.
+        if self.export_single_file and self._encoder is None:
+            with profile_stage(self.profiler, 'file_write', items=len(scan['mz_array'])):
+                self._write_spectrum(scan)
+        elif self.export_single_file:
+            with profile_stage(self.profiler, 'encode', items=len(scan['mz_array'])):
+                encoded_scans = self._encoder.submit(scan)
+            for encoded_scan, encoded_arrays in encoded_scans:
+                with profile_stage(self.profiler, 'file_write', items=len(encoded_scan['mz_array'])):
+                    self._write_spectrum(encoded_scan, encoded_arrays)
+        elif self._archive is not None:
+            self._archive.add_window(scan)
+            self._pool.submit(scan)
+        else:
+            path = os.path.join(self.outdir, get_window_filename(self.slx,
+                                                                 scan['selected_ion_mz'],
+                                                                 scan['selected_ion_mobility'],
+                                                                 'mzMLb' if self.mzmlb else 'mzML'))
+            # Unchanged windows are skipped in incremental exports.
+            if self._manifest is not None and not self._manifest.needs_update(path, scan):
+                return
+            self.paths.append(path)
+            self._pool.submit(scan)
+
+    def close(self):
+        """
+        Finish writing the output file or wait for all worker processes to finish.
+        """
+        if self._encoder is not None:
+            for encoded_scan, encoded_arrays in self._encoder.close():
+                self._write_spectrum(encoded_scan, encoded_arrays)
+            self._encoder = None
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._write_queue is not None:
+            self._write_queue.close()
+            self._write_queue = None
+        if self._contexts is not None:
+            self._contexts.close()
+            self._contexts = None
+            self._writer = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def abort(self):
+        """
+        Stop writing and remove all mzML files or archives written by this sink.
+        """
+        try:
+            if self._encoder is not None:
+                self._encoder.close(wait=False)
+            if self._pool is not None:
+                self._pool.close(wait=False)
+            if self._write_queue is not None:
+                self._write_queue.close(wait=False)
+            if self._contexts is not None:
+                self._contexts.close()
+        except Exception:
+            # Output files are removed below regardless of whether they could be closed cleanly.
+            pass
+        finally:
+            self._encoder = None
+            self._contexts = None
+            self._writer = None
+            self._pool = None
+            self._write_queue = None
+            # The previous manifest is kept, so files removed below are written again by the next incremental export.
+            self._manifest = None
+            if self._archive is not None:
+                self._archive.abort()
+                self._archive = None
+            remove_files(self.paths)
+
+
 def convert_iprmpasef_feature_list_to_mzml(slx, outdir, feature_list_id, intensity_column_name, polarity,
                                            barebones_metadata, mz_encoding, intensity_encoding, compression,
                                            export_single_file, get_precursor_from_isolation_window,
-                                           relative_intensity_threshold=1):
+                                           relative_intensity_threshold=1, **kwargs):
     """
-    Convert precursors and fragments found in a iprm-PASEF SCiLS Lab feature list to MS/MS spectra in a single mzML
-    file. If precursor is not found in the spectra, the precursor is inferred based on the iprm-PASEF precursor window
-    that was used.
+    Convert precursors and fragments found in a iprm-PASEF SCiLS Lab feature list to MS/MS spectra in mzML file(s)
+    using exporter.export.convert_iprmpasef_feature_list(). If precursor is not found in the spectra, the precursor is
+    inferred based on the iprm-PASEF precursor window that was used.
 
-    :param slx: Path to the input SCiLS Lab *.slx file to analyze.
-    :type slx: str
+    :param slx: Path to the input SCiLS Lab *.slx file to analyze or an open exporter.session.ScilsSession to reuse.
+    :type slx: str | exporter.session.ScilsSession
     :param outdir: Path to folder in which to write output file(s). Defaults to the input SCiLS Lab *.slx file path.
     :type outdir: str
     :param feature_list_id: UUID for the MS1 feature table of interest. If unknown, please run the "get_feature_lists"
         command.
     :type feature_list_id: str
     :param intensity_column_name: Name of the column from the feature table to use intensity values from. If unknown,
-        please run the "get_intensity_column_names" command.
-    :type intensity_column_name: str
-    :param polarity: Polarity of the spectra in the dataset. Either "positive" or "negative".
+        please run the "get_intensity_column_names" command. If a list of column names is given, MS/MS spectra are
+        built for all columns at once and the files for each column are written to a subdirectory of the output
+        directory named after the column.
+    :type intensity_column_name: str | list[str]
+    :param polarity: Polarity of the spectra in the dataset. Either "+" or "-".
     :type polarity: str
     :param barebones_metadata: If True, omit software and data processing metadata in the resulting mzML files. Used
         for compatibility with downstream analysis software that does not have support for newer CV params or
         UserParams.
     :type barebones_metadata: bool
-    :param mz_encoding: Choose encoding for m/z array: 32-bit (\"32\") or 64-bit (\"64\"). Defaults to 64-bit.
-    :type mz_encoding: int
-    :param intensity_encoding: Choose encoding for intensity array: 32-bit (\"32\") or 64-bit (\"64\"). Defaults to
+    :param mz_encoding: Choose encoding for m/z array: 32-bit (\"32\"), 64-bit (\"64\"), or MS-Numpress linear
+        prediction (\"numpress_linear\"). Defaults to 64-bit.
+    :type mz_encoding: int | str
+    :param intensity_encoding: Choose encoding for intensity array: 32-bit (\"32\"), 64-bit (\"64\"), MS-Numpress
+        short logged float (\"numpress_slof\"), or MS-Numpress positive integer (\"numpress_pic\"). Defaults to
         64-bit.
-    :type intensity_encoding: int
-    :param compression: Choose between ZLIB compression (\"zlib\") or no compression (\"none\"). Defaults to \"zlib\".
+    :type intensity_encoding: int | str
+    :param compression: Choose between ZLIB compression (\"zlib\") or no compression (\"none\"). ZLIB compression is
+        applied after MS-Numpress encoding. Defaults to \"zlib\".
     :type compression: str
     :param export_single_file: If this flag is used, create a single mzML file containing all MS/MS spectra. Otherwise,
         create individual mzML files for each precursor window.
@@ -235,91 +667,17 @@ def convert_iprmpasef_feature_list_to_mzml(slx, outdir, feature_list_id, intensi
         fragment peaks. A threshold value of '1' corresponds to a threshold of 1% of the sum of all fragment intensity
         values for a given precursor.
     :type relative_intensity_threshold: int
+    :param kwargs: Additional parameters of exporter.export.convert_iprmpasef_feature_list() (i.e. workers,
+        compression_level, encoding_threads, mzmlb, archive, or fragment_filters).
+    :type kwargs: dict
     """
-    # Set output directory if not specified.
-    if outdir == '':
-        outdir = os.path.dirname(slx)
-    # Set relative intensity threshold to float value.
-    relative_intensity_threshold = relative_intensity_threshold / 100
-    with LocalSession(filename=slx) as session:
-        dataset = session.dataset_proxy
-        # Get iprm-PASEF feature table from iprm SCiLS file containing precursor/fragment and isolation window columns.
-        feature_list = dataset.feature_table.get_features(feature_list_id, include_all_user_columns=True)
-        # Subset feature table by isolation window. Each feature table will contain all precursor and fragment features
-        # detected by Bruker T-ReX feature finding in SCiLS.
-        # Feature tables stored as a dict where key == isolation window string and value == pd.DataFrame.
-        feature_lists = {key: value.reset_index() for key, value in feature_list.groupby('isolation_window')}
-        # Process iprm-PASEF feature table for each precursor/isolation window.
-        count = 1
-        scan_list = []
-        for window, table in feature_lists.items():
-            precursor_table = table[table['type'] == 'Precursor'].reset_index()
-            fragment_table = table[table['type'] == 'Fragment'].reset_index()
-            # Get precursor m/z and 1/K0 values.
-            if not precursor_table.empty and not get_precursor_from_isolation_window:
-                # Calculated weighted average for precursor m/z and 1/K0 using feature intensity as weights.
-                precursor_mz_array = (precursor_table['mz_low'] + precursor_table['mz_high']) / 2
-                precursor_mz_array = precursor_mz_array.values
-                precursor_ook0_array = (precursor_table['one_over_k0_low'] + precursor_table['one_over_k0_high']) / 2
-                precursor_ook0_array = precursor_ook0_array.values
-                precursor_mz = np.average(precursor_mz_array, weights=precursor_table[intensity_column_name])
-                precursor_ook0 = np.average(precursor_ook0_array, weights=precursor_table[intensity_column_name])
-            else:
-                # If no precursor type feature detected via feature finding, parse and use isolation window for
-                # precursor m/z and 1/K0.
-                precursor_mz = float(window.split(',')[0][:-4])
-                precursor_ook0 = float(window.split(',')[1][6:])
-            # Filter and remove any fragment type features based on relative intensity cutoff.
-            fragment_table = fragment_table[fragment_table[intensity_column_name] >= (
-                    np.sum(fragment_table[intensity_column_name].values) * relative_intensity_threshold)]
-            fragment_mz_array = (fragment_table['mz_low'] + fragment_table['mz_high']) / 2
-            fragment_mz_array = fragment_mz_array.values
-            fragment_table = pd.DataFrame({'mz': fragment_mz_array,
-                                           'intensity': fragment_table[intensity_column_name].values})
-            fragment_table = fragment_table.sort_values(by='mz')
-            # Save to list of MS/MS dicts for export to mzML file.
-            scan_list.append({'mz_array': copy.deepcopy(fragment_table['mz'].values),
-                              'intensity_array': copy.deepcopy(fragment_table['intensity'].values),
-                              'scan_number': count,
-                              'polarity': polarity,
-                              'selected_ion_mz': precursor_mz,
-                              'selected_ion_mobility': precursor_ook0}),
-            count += 1
-
-        # Export MS/MS spectra to mzML file.
-        # mzML writing code modified from TIMSCONVERT.
-        # Initialize writer using psims.
-        if export_single_file:
-            mzml_filename = f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_MSMS.mzML'
-            writer = MzMLWriter(os.path.join(outdir, mzml_filename), close=True)
-            with writer:
-                # Begin mzML writer using psims.
-                writer.controlled_vocabularies()
-                # Start write acquisition, instrument config, processing, etc. to mzML.
-                write_mzml_metadata(writer, slx, barebones_metadata)
-                # Parse chunks of data and write to spectrum element.
-                with writer.run(id='run',
-                                instrument_configuration='instrument',
-                                start_time='1969-12-31T19:00:00.000-05:00'):
-                    # Count number of spectra in run
-                    with writer.spectrum_list(count=len(scan_list)):
-                        for scan in scan_list:
-                            write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compression)
-        else:
-            for scan in scan_list:
-                mzml_filename = f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_mz{scan["selected_ion_mz"]}_ook0{scan["selected_ion_mobility"]}.mzML'
-                writer = MzMLWriter(os.path.join(outdir, mzml_filename), close=True)
-                with writer:
-                    # Begin mzML writer using psims.
-                    writer.controlled_vocabularies()
-                    # Start write acquisition, instrument config, processing, etc. to mzML.
-                    write_mzml_metadata(writer, slx, barebones_metadata)
-                    # Parse chunks of data and write to spectrum element.
-                    with writer.run(id='run',
-                                    instrument_configuration='instrument',
-                                    start_time='1969-12-31T19:00:00.000-05:00'):
-                        with writer.spectrum_list(count=1):
-                            write_ms2_spectrum(writer, scan, mz_encoding, intensity_encoding, compression)
+    check_mzml_options(mz_encoding, intensity_encoding, kwargs.get('mzmlb', False))
+    # exporter.export imports this module when mzML files are exported, so it is only imported once the export is run.
+    from exporter.export import convert_iprmpasef_feature_list
+    convert_iprmpasef_feature_list(slx, outdir, feature_list_id, intensity_column_name, ['mzml'], export_single_file,
+                                   get_precursor_from_isolation_window, relative_intensity_threshold,
+                                   polarity=polarity, barebones_metadata=barebones_metadata, mz_encoding=mz_encoding,
+                                   intensity_encoding=intensity_encoding, compression=compression, **kwargs)
 
 
 def main():
@@ -329,19 +687,4 @@ def main():
     print('WARNING: mzML export feature is still currently in beta. Compatibility is not guaranteed with downstream '
           'analysis platforms as certain metadata may be missing from resulting mzML files.')
     args = get_args()
-    if args['polarity'] == 'positive':
-        args['polarity'] = '+'
-    elif args['polarity'] == 'negative':
-        args['polarity'] = '-'
-    convert_iprmpasef_feature_list_to_mzml(slx=args['scils'],
-                                           outdir=args['outdir'],
-                                           feature_list_id=args['feature_list_id'],
-                                           intensity_column_name=args['intensity_column_name'],
-                                           polarity=args['polarity'],
-                                           barebones_metadata=args['barebones_metadata'],
-                                           mz_encoding=args['mz_encoding'],
-                                           intensity_encoding=args['intensity_encoding'],
-                                           compression=args['compression'],
-                                           export_single_file=args['export_single_file'],
-                                           get_precursor_from_isolation_window=args['get_precursor_from_isolation_window'],
-                                           relative_intensity_threshold=args['relative_intensity_threshold'])
+    convert_iprmpasef_feature_list_to_mzml(**get_export_parameters(args))
@@ -0,0 +1,39 @@
+from psims.mzml import MzMLWriter
+from psims.document import ChildTrackingMeta
+
+
+# psims registers the component types it creates for each writer as the templates for the next writer, so every writer
+# subclasses the component types of the previous one. Type creation and attribute lookups then get slower with every
+# file written, which makes writing one file per precursor window quadratic in the number of windows. The original
+# component types are taken as templates when this module is imported. This relies on psims internals, so psims' own
+# component lookup is used if they are not available.
+if hasattr(ChildTrackingMeta, '_cache') and all(hasattr(MzMLWriter, attr) for attr in ['_locate_component',
+                                                                                        '_component_partial_type',
+                                                                                        '_prepare_bind_arguments',
+                                                                                        '_update_component_namespace']):
+    COMPONENT_TEMPLATES = {namespace: dict(types) for namespace, types in ChildTrackingMeta._cache.items()}
+else:
+    COMPONENT_TEMPLATES = None
+
+
+class TemplateComponentMzMLWriter(MzMLWriter):
+    """
+    psims.mzml.MzMLWriter that creates its component types from COMPONENT_TEMPLATES instead of the component types
+    registered by the previous writer, so the time needed to create a writer does not grow with the number of files
+    written. psims' global component registry is not modified.
+    """
+    def _locate_component(self, name):
+        if COMPONENT_TEMPLATES is None or not hasattr(self, 'type_cache'):
+            return super(TemplateComponentMzMLWriter, self)._locate_component(name)
+        if name not in self.type_cache:
+            # Same as psims.document.ComponentDispatcher._locate_component() using the original component types as
+            # templates.
+            namespace_templates = COMPONENT_TEMPLATES.get(self.component_namespace, {})
+            template = namespace_templates.get(name, COMPONENT_TEMPLATES.get(None, {}).get(name))
+            if template is None:
+                return super(TemplateComponentMzMLWriter, self)._locate_component(name)
+            component_type = type(template.__name__, (template,), self._update_component_namespace(template))
+            component_type.__module__ = template.__module__
+            component_type.__qualname__ = template.__qualname__
+            self.type_cache[name] = self._component_partial_type(component_type, **self._prepare_bind_arguments())
+        return self.type_cache[name]
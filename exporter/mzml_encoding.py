@@ -0,0 +1,250 @@
+import zlib
+import base64
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from psims.mzml.writer import ARRAY_TYPES, NON_STANDARD_ARRAY
+from psims.mzml.binary_encoding import compression_map, dtype_to_encoding, coerce_array
+from psims.mzml.binary_encoding import encode_array as psims_encode_array
+from psims.mzml.binary_encoding import COMPRESSION_NUMPRESS_LINEAR_PREDICTION, \
+    COMPRESSION_NUMPRESS_SHORT_LOGGED_FLOAT, COMPRESSION_NUMPRESS_POSITIVE_INTEGER
+from exporter.mzml_options import DEFAULT_COMPRESSION_LEVEL
+from exporter.mzml_components import TemplateComponentMzMLWriter
+
+try:
+    import pynumpress
+except ImportError:
+    pynumpress = None
+
+
+# MS-Numpress encoding command line parameters and the psims compression names of the corresponding MS-Numpress
+# compression schemes. Linear prediction is intended for m/z arrays, while short logged float and positive integer
+# compression are intended for intensity arrays.
+NUMPRESS_ENCODINGS = {'numpress_linear': COMPRESSION_NUMPRESS_LINEAR_PREDICTION,
+                      'numpress_slof': COMPRESSION_NUMPRESS_SHORT_LOGGED_FLOAT,
+                      'numpress_pic': COMPRESSION_NUMPRESS_POSITIVE_INTEGER}
+# PSI-MS compression names for MS-Numpress encoded arrays that are compressed with zlib afterwards, mapped to the
+# MS-Numpress compression name.
+NUMPRESS_ZLIB_COMPRESSIONS = {f'{name} followed by zlib compression': name for name in NUMPRESS_ENCODINGS.values()}
+
+
+class EncodedArray(object):
+    """
+    Binary data array that has already been cast, compressed, and base64 encoded for an mzML binaryDataArray element.
+    Written by EncodedArrayMzMLWriter without encoding it again.
+
+    :param encoded_binary: Base64 encoded binary data.
+    :type encoded_binary: bytes
+    :param array_length: Number of values in the array.
+    :type array_length: int
+    :param dtype: numpy dtype the array was encoded as (i.e. numpy.float32 or numpy.float64).
+    :type dtype: type
+    :param compression: Compression name returned by get_compression_name() (i.e. "zlib" or "none").
+    :type compression: str
+    """
+    def __init__(self, encoded_binary, array_length, dtype, compression):
+        self.encoded_binary = encoded_binary
+        self.array_length = array_length
+        self.dtype = dtype
+        self.compression = compression
+
+    def __len__(self):
+        return self.array_length
+
+
+def get_compression_name(encoding, compression):
+    """
+    Get the compression name of a binary data array from the encoding and compression command line parameters.
+
+    :param encoding: Encoding command line parameter, either "64", "32", or an MS-Numpress encoding ("numpress_linear",
+        "numpress_slof", or "numpress_pic").
+    :type encoding: int | str
+    :param compression: Compression command line parameter, either "zlib" or "none".
+    :type compression: str
+    :return: Compression name (i.e. "zlib", "none", "MS-Numpress linear prediction compression", or "MS-Numpress
+        linear prediction compression followed by zlib compression").
+    :rtype: str
+    """
+    if encoding in NUMPRESS_ENCODINGS:
+        if compression == 'zlib':
+            return f'{NUMPRESS_ENCODINGS[encoding]} followed by zlib compression'
+        return NUMPRESS_ENCODINGS[encoding]
+    return compression
+
+
+def numpress_encode(array, compression):
+    """
+    Encode a binary data array using MS-Numpress.
+
+    :param array: Data array to encode.
+    :type array: numpy.ndarray
+    :param compression: psims MS-Numpress compression name.
+    :type compression: str
+    :return: MS-Numpress encoded bytes.
+    :rtype: bytes
+    """
+    if pynumpress is None:
+        raise ImportError('pynumpress is required for MS-Numpress encoding. Install pynumpress or use 32-bit or 64-bit '
+                          'encoding.')
+    array = coerce_array(array, np.float64)
+    if compression == COMPRESSION_NUMPRESS_LINEAR_PREDICTION:
+        encoded_array = pynumpress.encode_linear(array, pynumpress.optimal_linear_fixed_point(array))
+    elif compression == COMPRESSION_NUMPRESS_SHORT_LOGGED_FLOAT:
+        encoded_array = pynumpress.encode_slof(array, pynumpress.optimal_slof_fixed_point(array))
+    elif compression == COMPRESSION_NUMPRESS_POSITIVE_INTEGER:
+        encoded_array = pynumpress.encode_pic(array)
+    else:
+        raise ValueError(f'Unknown MS-Numpress compression "{compression}".')
+    return encoded_array.tobytes()
+
+
+def encode_array(array, dtype, compression, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Cast, compress, and base64 encode a binary data array. zlib releases the GIL while compressing, so arrays can be
+    encoded concurrently in a thread pool.
+
+    :param array: Data array to encode.
+    :type array: numpy.ndarray
+    :param dtype: numpy dtype to encode the array as (i.e. numpy.float32 or numpy.float64). MS-Numpress encoded arrays
+        are always decoded as numpy.float64.
+    :type dtype: type
+    :param compression: Compression name returned by get_compression_name() (i.e. "zlib" or "none").
+    :type compression: str
+    :param compression_level: zlib compression level from 0 (no compression) to 9 (best compression).
+    :type compression_level: int
+    :return: Encoded array.
+    :rtype: EncodedArray
+    """
+    if len(array) < 2 and COMPRESSION_NUMPRESS_LINEAR_PREDICTION in [compression,
+                                                                    NUMPRESS_ZLIB_COMPRESSIONS.get(compression)]:
+        # MS-Numpress decoders fail to read linear prediction encoded arrays containing a single value, so those arrays
+        # are written as 64-bit floats instead.
+        compression = 'zlib' if compression in NUMPRESS_ZLIB_COMPRESSIONS else 'none'
+        dtype = np.float64
+    if compression == 'zlib':
+        encoded_binary = base64.standard_b64encode(zlib.compress(coerce_array(array, dtype).tobytes(),
+                                                                 compression_level))
+    elif compression == 'none':
+        encoded_binary = base64.standard_b64encode(coerce_array(array, dtype).tobytes())
+    elif compression in NUMPRESS_ZLIB_COMPRESSIONS:
+        numpress_binary = numpress_encode(array, NUMPRESS_ZLIB_COMPRESSIONS[compression])
+        encoded_binary = base64.standard_b64encode(zlib.compress(numpress_binary, compression_level))
+    elif compression in NUMPRESS_ENCODINGS.values():
+        encoded_binary = base64.standard_b64encode(numpress_encode(array, compression))
+    else:
+        encoded_binary = psims_encode_array(array, compression=compression, dtype=dtype)
+    return EncodedArray(encoded_binary, len(array), dtype, compression)
+
+
+class EncodedArrayMzMLWriter(TemplateComponentMzMLWriter):
+    """
+    psims.mzml.MzMLWriter that accepts EncodedArray instances in place of numpy arrays when writing spectra, so binary
+    data arrays can be encoded ahead of time outside of the thread writing the XML.
+    """
+    def _prepare_array(self, array, encoding=32, compression='zlib', array_type=None, default_array_length=None,
+                       scope=None):
+        if not isinstance(array, EncodedArray):
+            return super(EncodedArrayMzMLWriter, self)._prepare_array(array, encoding, compression, array_type,
+                                                                      default_array_length, scope)
+        # Same as psims.mzml.MzMLWriter._prepare_array() without encoding the array.
+        params = []
+        if array_type is not None:
+            params.append(array_type)
+            array_type_ = array_type['name'] if isinstance(array_type, Mapping) else array_type
+            if array_type_ not in ARRAY_TYPES:
+                params.append({'name': NON_STANDARD_ARRAY, 'value': array_type_})
+        # MS-Numpress followed by zlib compression names are PSI-MS terms that psims does not map itself.
+        params.append(compression_map.get(array.compression, array.compression))
+        params.append(dtype_to_encoding[array.dtype])
+        override_length = default_array_length is not None and len(array) != default_array_length
+        return self.BinaryDataArray(self.Binary(array.encoded_binary),
+                                    len(array.encoded_binary),
+                                    array_length=(len(array) if override_length else None),
+                                    params=params)
+
+
+class EncodingPool(object):
+    """
+    Encode the m/z and intensity arrays of MS/MS spectra in a pool of threads while spectra are written in submission
+    order. At most a few spectra per thread are encoded ahead of the writer to keep memory bounded.
+
+    :param mz_dtype: numpy dtype to encode m/z arrays as.
+    :type mz_dtype: type
+    :param intensity_dtype: numpy dtype to encode intensity arrays as.
+    :type intensity_dtype: type
+    :param mz_compression: Compression name for m/z arrays returned by get_compression_name().
+    :type mz_compression: str
+    :param intensity_compression: Compression name for intensity arrays returned by get_compression_name().
+    :type intensity_compression: str
+    :param compression_level: zlib compression level from 0 (no compression) to 9 (best compression).
+    :type compression_level: int
+    :param threads: Number of encoding threads. Arrays are encoded in the calling thread if threads is less than or
+        equal to 1.
+    :type threads: int
+    """
+    def __init__(self, mz_dtype, intensity_dtype, mz_compression, intensity_compression,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL, threads=1):
+        self.mz_dtype = mz_dtype
+        self.intensity_dtype = intensity_dtype
+        self.mz_compression = mz_compression
+        self.intensity_compression = intensity_compression
+        self.compression_level = compression_level
+        self.threads = threads
+        self._pending = deque()
+        self._executor = None
+        if threads is not None and threads > 1:
+            self._executor = ThreadPoolExecutor(max_workers=threads)
+
+    def encode(self, scan):
+        """
+        Encode the m/z and intensity arrays of an MS/MS spectrum.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :return: Tuple of the encoded m/z and intensity arrays.
+        :rtype: tuple[EncodedArray, EncodedArray]
+        """
+        return (encode_array(scan['mz_array'], self.mz_dtype, self.mz_compression, self.compression_level),
+                encode_array(scan['intensity_array'], self.intensity_dtype, self.intensity_compression,
+                             self.compression_level))
+
+    def submit(self, scan):
+        """
+        Submit an MS/MS spectrum for encoding.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :return: List of (scan, encoded arrays) tuples that are ready to be written in submission order.
+        :rtype: list[tuple[dict, tuple[EncodedArray, EncodedArray]]]
+        """
+        if self._executor is None:
+            return [(scan, self.encode(scan))]
+        self._pending.append((scan, self._executor.submit(self.encode, scan)))
+        ready = []
+        # Limit the number of spectra encoded ahead of the writer to keep memory bounded.
+        while len(self._pending) > self.threads * 4 or (self._pending and self._pending[0][1].done()):
+            scan, future = self._pending.popleft()
+            ready.append((scan, future.result()))
+        return ready
+
+    def close(self, wait=True):
+        """
+        Wait for all submitted spectra to be encoded and shut down the encoding threads.
+
+        :param wait: If False, discard spectra that have not been encoded yet.
+        :type wait: bool
+        :return: List of remaining (scan, encoded arrays) tuples in submission order.
+        :rtype: list[tuple[dict, tuple[EncodedArray, EncodedArray]]]
+        """
+        ready = []
+        if self._executor is not None:
+            try:
+                while wait and self._pending:
+                    scan, future = self._pending.popleft()
+                    ready.append((scan, future.result()))
+            finally:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                self._pending.clear()
+        return ready
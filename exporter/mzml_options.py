@@ -0,0 +1,15 @@
+# Default zlib compression level. Identical to the level used by psims.
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+def encoding_type(value):
+    """
+    Convert the "mz_encoding" and "intensity_encoding" command line parameters. Bit depths are converted to int, while
+    MS-Numpress encodings are kept as str.
+
+    :param value: Command line parameter value.
+    :type value: str
+    :return: Encoding, either 64, 32, or an MS-Numpress encoding.
+    :rtype: int | str
+    """
+    return int(value) if value.isdigit() else value
@@ -0,0 +1,145 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+class WindowPool(object):
+    """
+    Apply a function to items (i.e. one MS/MS spectrum per isolation window) as they are submitted, either serially or
+    across a pool of worker processes. At most a few items per worker are in flight at a time so that items can be
+    generated lazily without materializing all spectra in memory. Results are collected in submission order.
+
+    :param function: Picklable function taking a single item as input. Use functools.partial to bind any additional
+        parameters.
+    :type function: collections.abc.Callable
+    :param workers: Number of worker processes to use. Items are processed serially in the current process if workers
+        is less than or equal to 1.
+    :type workers: int
+    :param callback: Function called in the current process with each return value of function in submission order as
+        soon as it is available. If None, return values are collected in results instead.
+    :type callback: collections.abc.Callable | None
+    """
+    def __init__(self, function, workers=1, callback=None):
+        self.function = function
+        self.workers = workers
+        self.callback = callback
+        self.results = []
+        self._pending = deque()
+        self._executor = None
+        if workers is not None and workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(wait=exc_type is None)
+
+    def _collect(self, result):
+        """
+        Pass a return value to the callback or collect it in results.
+
+        :param result: Return value of function.
+        """
+        if self.callback is None:
+            self.results.append(result)
+        else:
+            self.callback(result)
+
+    def submit(self, item):
+        """
+        Process an item.
+
+        :param item: Item to process.
+        """
+        if self._executor is None:
+            self._collect(self.function(item))
+            return
+        self._pending.append(self._executor.submit(self.function, item))
+        # Limit the number of in flight items to keep memory bounded.
+        if len(self._pending) >= self.workers * 4:
+            self._collect(self._pending.popleft().result())
+
+    def close(self, wait=True):
+        """
+        Wait for all submitted items to finish and shut down the worker processes.
+
+        :param wait: If False, cancel any items that have not started yet instead of waiting for their results.
+        :type wait: bool
+        :return: List of return values from function for each item in submission order. Empty if a callback is used.
+        :rtype: list
+        """
+        if self._executor is not None:
+            try:
+                while wait and self._pending:
+                    self._collect(self._pending.popleft().result())
+            finally:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                self._pending.clear()
+        return self.results
+
+
+class BackgroundWriter(object):
+    """
+    Call a write function with items in a single background thread, so output is written while the calling thread
+    formats and encodes the next spectra. Items are passed through a bounded queue and written in submission order.
+    submit() blocks once max_size items are waiting to be written, which keeps memory bounded when writing is slower
+    than preparing items (i.e. on network shares). Exceptions raised by the write function are raised again in the
+    calling thread by the next call to submit() or close().
+
+    :param function: Function called in the background thread with the arguments passed to each submit() call.
+    :type function: collections.abc.Callable
+    :param max_size: Maximum number of items waiting to be written.
+    :type max_size: int
+    """
+    def __init__(self, function, max_size):
+        self.function = function
+        self._queue = queue.Queue(maxsize=max(1, max_size))
+        self._error = None
+        self._discard = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # Items are still taken from the queue after an error or abort so that submit() and close() never block.
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is None and not self._discard:
+                try:
+                    self.function(*item)
+                except BaseException as error:
+                    self._error = error
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, *args):
+        """
+        Queue an item to be written, waiting for the background thread if the queue is full.
+
+        :param args: Arguments passed to function.
+        """
+        self._raise_error()
+        self._queue.put(args)
+
+    def close(self, wait=True):
+        """
+        Wait for all queued items to be written and stop the background thread.
+
+        :param wait: If False, discard items that have not been written yet.
+        :type wait: bool
+        """
+        if self._thread is None:
+            return
+        if not wait:
+            self._discard = True
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if wait:
+            self._raise_error()
@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import contextlib
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+# Profiling modes for the "profile" command line parameter. "stages" only writes the per-stage JSON report, while
+# "cprofile" and "pyinstrument" additionally capture a function level profile of the export.
+PROFILE_MODES = ['stages', 'cprofile', 'pyinstrument']
+# Precursor windows taking longer than this multiple of the median time per window are reported as outliers.
+OUTLIER_FACTOR = 5
+# Maximum number of outlier precursor windows included in the report.
+MAX_OUTLIERS = 20
+
+
+def get_peak_rss(children=False):
+    """
+    Get the peak resident set size (peak working set size on Windows) of the current process.
+
+    :param children: If True, get the largest peak resident set size of all terminated child processes (i.e. the
+        worker processes of exporter.parallel.WindowPool) instead. Not available on Windows.
+    :type children: bool
+    :return: Peak resident set size in bytes or None if it cannot be determined on this platform.
+    :rtype: int | None
+    """
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux.
+        return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+    if sys.platform == 'win32' and not children:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                    ctypes.byref(counters),
+                                                    counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+def get_profile_path(slx, outdir):
+    """
+    Get the path to the profiling report without a file extension. The JSON report is written to this path with a
+    ".json" extension, while cProfile and pyinstrument profiles use ".prof" and ".html" extensions.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the report.
+    :type slx: str
+    :param outdir: Path to folder in which to write the report.
+    :type outdir: str
+    :return: Path to the profiling report without a file extension.
+    :rtype: str
+    """
+    return os.path.join(outdir, f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_profile')
+
+
+class ExportProfiler(object):
+    """
+    Record wall time, CPU time, peak resident set size increase, and item counts for each stage of an export as well as
+    the time spent writing each precursor window. Stages are timed in the thread running the export, so stages that
+    hand work to worker threads or processes only include the time spent waiting for them. CPU time is measured for the
+    whole process. Stages started within another stage are recorded as "<parent>/<stage>".
+
+    The peak resident set size only ever rises, so for each stage the amount by which it rose while the stage was
+    running is recorded. A stage using less memory than an earlier stage therefore shows no increase. Memory used by
+    worker processes is not included in stages and is reported separately for the whole export.
+
+    :param mode: Profiling mode, either "stages", "cprofile", or "pyinstrument".
+    :type mode: str
+    """
+    def __init__(self, mode='stages'):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profiling mode "{mode}". Expected one of {PROFILE_MODES}.')
+        if mode == 'pyinstrument' and pyinstrument is None:
+            raise ImportError('pyinstrument is required for pyinstrument profiling. Install pyinstrument or use '
+                              'cProfile.')
+        self.mode = mode
+        self.stages = {}
+        self.windows = []
+        self._stack = []
+        self._start = None
+        self._end = None
+        self._profiler = None
+
+    def start(self):
+        """
+        Start timing the export and start the cProfile or pyinstrument profiler if selected.
+        """
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.mode == 'pyinstrument':
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+        self._start = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        """
+        Stop timing the export and stop the cProfile or pyinstrument profiler if selected.
+        """
+        self._end = (time.perf_counter(), time.process_time())
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+        elif self.mode == 'pyinstrument':
+            self._profiler.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0):
+        """
+        Time a stage of the export. Timings of stages that are run repeatedly (i.e. once per precursor window) are
+        summed up.
+
+        :param name: Stage name.
+        :type name: str
+        :param items: Number of items processed in the stage. Can be updated using the "items" key of the yielded
+            dict if it is not known before the stage is run.
+        :type items: int
+        :return: Context manager yielding a dict containing the number of items processed in the stage.
+        :rtype: contextlib.AbstractContextManager[dict]
+        """
+        self._stack.append(name)
+        stage = {'items': items}
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        start_peak_rss = get_peak_rss()
+        try:
+            yield stage
+        finally:
+            wall_time = time.perf_counter() - start_time
+            cpu_time = time.process_time() - start_cpu_time
+            key = '/'.join(self._stack)
+            self._stack.pop()
+            end_peak_rss = get_peak_rss()
+            record = self.stages.setdefault(key, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'items': 0,
+                                                  'peak_rss_increase': 0 if start_peak_rss is not None else None})
+            record['calls'] += 1
+            record['wall_time'] += wall_time
+            record['cpu_time'] += cpu_time
+            record['items'] += stage['items']
+            if record['peak_rss_increase'] is not None:
+                record['peak_rss_increase'] += end_peak_rss - start_peak_rss
+
+    def add_window(self, scan, wall_time):
+        """
+        Record the time spent writing a single precursor window to all output sinks.
+
+        :param scan: Scan dict yielded by exporter.spectra.iter_ms2_spectra().
+        :type scan: dict
+        :param wall_time: Time in seconds.
+        :type wall_time: float
+        """
+        self.windows.append((wall_time, scan['scan_number'], scan['isolation_window'], len(scan['mz_array'])))
+
+    def get_window_summary(self):
+        """
+        Summarize the time spent writing each precursor window.
+
+        :return: Dict containing the number of windows, median, 95th percentile, and maximum time per window in
+            seconds, and up to MAX_OUTLIERS windows taking longer than OUTLIER_FACTOR times the median, slowest first.
+        :rtype: dict
+        """
+        if not self.windows:
+            return {'count': 0, 'median': None, 'p95': None, 'max': None, 'outliers': []}
+        wall_times = np.array([window[0] for window in self.windows])
+        median = float(np.median(wall_times))
+        outliers = sorted([window for window in self.windows if window[0] > median * OUTLIER_FACTOR],
+                          key=lambda window: window[0],
+                          reverse=True)
+        return {'count': len(self.windows),
+                'median': median,
+                'p95': float(np.percentile(wall_times, 95)),
+                'max': float(wall_times.max()),
+                'outliers': [{'scan_number': int(scan_number),
+                              'isolation_window': str(isolation_window),
+                              'peaks': int(peaks),
+                              'wall_time': float(wall_time)}
+                             for wall_time, scan_number, isolation_window, peaks in outliers[:MAX_OUTLIERS]]}
+
+    def get_report(self):
+        """
+        Get the profiling report.
+
+        :return: Report containing the total wall time, CPU time, and peak resident set size of the export process and
+            of its largest worker process, per-stage timings in the order in which stages finished for the first time,
+            and the precursor window summary returned by get_window_summary(). Throughput is given in items per second
+            of wall time for stages that processed any items.
+        :rtype: dict
+        """
+        stages = []
+        for name, record in self.stages.items():
+            items_per_second = record['items'] / record['wall_time'] if record['items'] and record['wall_time'] else None
+            stages.append({'stage': name, **record, 'items_per_second': items_per_second})
+        end = self._end if self._end is not None else (time.perf_counter(), time.process_time())
+        return {'profile_mode': self.mode,
+                'wall_time': end[0] - self._start[0] if self._start is not None else None,
+                'cpu_time': end[1] - self._start[1] if self._start is not None else None,
+                'peak_rss': get_peak_rss(),
+                'peak_rss_workers': get_peak_rss(children=True),
+                'stages': stages,
+                'windows': self.get_window_summary()}
+
+    def write_report(self, path):
+        """
+        Write the JSON profiling report and the cProfile or pyinstrument profile if selected.
+
+        :param path: Path to the report without a file extension as returned by get_profile_path().
+        :type path: str
+        :return: Paths to the files written.
+        :rtype: list[str]
+        """
+        paths = [f'{path}.json']
+        with open(paths[0], 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent=4)
+        if self.mode == 'cprofile':
+            paths.append(f'{path}.prof')
+            self._profiler.dump_stats(paths[-1])
+        elif self.mode == 'pyinstrument':
+            paths.append(f'{path}.html')
+            with open(paths[-1], 'w', encoding='utf-8') as profile_file:
+                profile_file.write(self._profiler.output_html())
+        return paths
+
+
+def profile_stage(profiler, name, items=0):
+    """
+    Time a stage of the export using ExportProfiler.stage() if a profiler is used.
+
+    :param profiler: Export profiler or None if the export is not profiled.
+    :type profiler: ExportProfiler | None
+    :param name: Stage name.
+    :type name: str
+    :param items: Number of items processed in the stage.
+    :type items: int
+    :return: Context manager yielding a dict containing the number of items processed in the stage.
+    :rtype: contextlib.AbstractContextManager[dict]
+    """
+    if profiler is None:
+        # Stages are timed once per precursor window, so no overhead beyond a null context is added when not profiling.
+        return contextlib.nullcontext({'items': items})
+    return profiler.stage(name, items)
+
+
+@contextlib.contextmanager
+def profile_export(profiler, path):
+    """
+    Profile an export using an ExportProfiler if a profiler is used. The profiling report is only written if the export
+    finishes successfully.
+
+    :param profiler: Export profiler or None if the export is not profiled.
+    :type profiler: ExportProfiler | None
+    :param path: Path to the report without a file extension as returned by get_profile_path().
+    :type path: str
+    :return: Context manager.
+    :rtype: contextlib.AbstractContextManager
+    """
+    if profiler is None:
+        yield
+        return
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+    profiler.write_report(path)
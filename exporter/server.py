@@ -0,0 +1,427 @@
+import os
+import hmac
+import json
+import time
+import secrets
+import argparse
+import threading
+import traceback
+import contextlib
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from exporter.session import ScilsSession
+from exporter.feature_table import get_dataset_fingerprint
+from exporter.batch import run_job_with_result
+from exporter.client import TOKEN_HEADER, get_token_path
+
+
+# Default host and port of the export server. The server only listens on localhost by default.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Default maximum number of SCiLS Lab datasets kept in the session pool.
+MAX_SESSIONS = 4
+# Default maximum number of feature tables kept in memory for each dataset.
+MAX_FEATURE_TABLES = 4
+# Default time in seconds after which SCiLS Lab sessions that are not in use are closed to free *.slx and *.sbd files.
+IDLE_TIMEOUT = 300
+
+
+class SessionPool(object):
+    """
+    Least recently used pool of warm SCiLS Lab sessions for the export server. Each dataset has a single
+    exporter.session.ScilsSession and a lock, so requests for the same dataset run one after another while requests
+    for different datasets run concurrently. Sessions are replaced if the dataset was modified since the session was
+    created, and the least recently used datasets that are not in use are removed once more than max_sessions
+    datasets are in the pool.
+
+    :param max_sessions: Maximum number of datasets kept in the pool.
+    :type max_sessions: int
+    :param max_feature_tables: Maximum number of feature tables kept in memory for each dataset.
+    :type max_feature_tables: int
+    :param session_factory: Callable used to open the underlying sessions. Defaults to scilslab.LocalSession.
+    :type session_factory: collections.abc.Callable | None
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, max_feature_tables=MAX_FEATURE_TABLES, session_factory=None):
+        self.max_sessions = max_sessions
+        self.max_feature_tables = max_feature_tables
+        self.session_factory = session_factory
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        # Remove least recently used datasets that are not in use. Must be called while holding the pool lock.
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_sessions:
+                break
+            entry = self._entries[key]
+            if entry['users'] == 0:
+                del self._entries[key]
+                if entry['session'] is not None:
+                    entry['session'].close()
+
+    @contextlib.contextmanager
+    def acquire(self, slx):
+        """
+        Acquire the session for a dataset, waiting for other requests for the same dataset to finish first.
+
+        :param slx: Path to the input SCiLS Lab *.slx file.
+        :type slx: str
+        :return: Context manager yielding the session for the dataset.
+        :rtype: contextlib.AbstractContextManager[exporter.session.ScilsSession]
+        """
+        key = os.path.abspath(slx)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = {'session': None,
+                                      'fingerprint': None,
+                                      'lock': threading.Lock(),
+                                      'users': 0,
+                                      'last_used': time.monotonic()}
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            entry['users'] += 1
+        try:
+            with entry['lock']:
+                fingerprint = get_dataset_fingerprint(key)
+                if entry['session'] is None or entry['fingerprint'] != fingerprint:
+                    # Feature tables and schemas of modified datasets are fetched again using a new session.
+                    if entry['session'] is not None:
+                        entry['session'].close()
+                    entry['session'] = ScilsSession(key,
+                                                    session_factory=self.session_factory,
+                                                    max_feature_tables=self.max_feature_tables)
+                    entry['fingerprint'] = fingerprint
+                yield entry['session']
+        finally:
+            with self._lock:
+                entry['users'] -= 1
+                entry['last_used'] = time.monotonic()
+                self._evict()
+
+    def close_idle(self, timeout=IDLE_TIMEOUT):
+        """
+        Close the underlying SCiLS Lab sessions of datasets that have not been used for timeout seconds. Feature tables
+        and schemas kept in memory are retained, so the sessions are only reopened if SCiLS Lab needs to be queried
+        again.
+
+        :param timeout: Time in seconds.
+        :type timeout: float
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['users'] == 0 and entry['session'] is not None and entry['session'].is_open and \
+                        time.monotonic() - entry['last_used'] > timeout:
+                    entry['session'].close()
+
+    def get_status(self):
+        """
+        Get the status of the datasets in the pool.
+
+        :return: List of dicts containing the path, whether the SCiLS Lab session is open, the number of requests using
+            the dataset, and the seconds since it was last used for each dataset, most recently used last.
+        :rtype: list[dict]
+        """
+        with self._lock:
+            return [{'scils': key,
+                     'open': entry['session'] is not None and entry['session'].is_open,
+                     'requests': entry['users'],
+                     'idle_time': time.monotonic() - entry['last_used']}
+                    for key, entry in self._entries.items()]
+
+    def close(self):
+        """
+        Close all sessions and remove all datasets from the pool.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['session'] is not None:
+                    entry['session'].close()
+            self._entries.clear()
+
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler for export server requests. Requests and responses are JSON objects. GET /status returns the status of the
+    session pool, while POST /feature_lists, /intensity_columns, /export, and /shutdown list the feature lists of a
+    dataset, list the columns of a feature table, run an export job as described in exporter.batch.run_job(), and stop
+    the server, respectively. Responses contain a "status" key that is either "success" or "failed" and an "error" key
+    containing the error message of failed requests.
+
+    Requests must contain the access token of the server in the TOKEN_HEADER header and a Host header matching the
+    address of the server, and POST requests must have a Content-Type of application/json. This prevents web pages
+    opened in a browser on the same computer from sending requests to the server (i.e. using cross-origin requests or
+    DNS rebinding).
+    """
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super(ExportRequestHandler, self).log_message(format, *args)
+
+    def send_json(self, response, code=200):
+        """
+        Send a JSON response.
+
+        :param response: Response.
+        :type response: dict
+        :param code: HTTP status code.
+        :type code: int
+        """
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorize(self):
+        """
+        Check the Host header and access token of a request, sending an error response if the request is rejected.
+
+        :return: True if the request is authorized.
+        :rtype: bool
+        """
+        if self.headers.get('Host', '').lower() not in self.server.allowed_hosts:
+            self.send_json({'status': 'failed', 'error': 'Invalid Host header.'}, 403)
+            return False
+        if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, '').encode('utf-8'),
+                                   self.server.token.encode('utf-8')):
+            self.send_json({'status': 'failed', 'error': 'Missing or invalid access token.'}, 403)
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.authorize():
+            return
+        if self.path == '/status':
+            self.send_json({'status': 'success', 'error': None, 'sessions': self.server.pool.get_status()})
+        else:
+            self.send_json({'status': 'failed', 'error': f'Unknown request "GET {self.path}".'}, 404)
+
+    def do_POST(self):
+        if not self.authorize():
+            return
+        routes = {'/feature_lists': self.get_feature_lists,
+                  '/intensity_columns': self.get_intensity_columns,
+                  '/export': self.run_export,
+                  '/shutdown': self.stop_server}
+        if self.path not in routes:
+            self.send_json({'status': 'failed', 'error': f'Unknown request "POST {self.path}".'}, 404)
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.send_json({'status': 'failed', 'error': 'Content-Type must be application/json.'}, 415)
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object.')
+        except ValueError as exception:
+            self.send_json({'status': 'failed', 'error': f'Invalid request: {exception}'}, 400)
+            return
+        try:
+            response = routes[self.path](request)
+        except Exception as exception:
+            response = {'status': 'failed',
+                        'error': ''.join(traceback.format_exception_only(type(exception), exception)).strip()}
+        self.send_json(response)
+
+    def get_feature_lists(self, request):
+        """
+        Get the feature lists of a dataset.
+
+        :param request: Request containing the scils key.
+        :type request: dict
+        :return: Response containing a list of feature list records with at least name and id keys.
+        :rtype: dict
+        """
+        with self.server.pool.acquire(get_parameter(request, 'scils')) as session:
+            feature_lists = session.get_feature_lists()
+        return {'status': 'success',
+                'error': None,
+                'feature_lists': json.loads(feature_lists.to_json(orient='records'))}
+
+    def get_intensity_columns(self, request):
+        """
+        Get the column names of a feature table.
+
+        :param request: Request containing the scils and feature_list_id keys and an optional no_cache key.
+        :type request: dict
+        :return: Response containing the list of column names.
+        :rtype: dict
+        """
+        with self.server.pool.acquire(get_parameter(request, 'scils')) as session:
+            schema = session.get_feature_schema(get_parameter(request, 'feature_list_id'),
+                                                use_cache=not request.get('no_cache', False))
+        return {'status': 'success', 'error': None, 'columns': list(schema['columns'])}
+
+    def run_export(self, request):
+        """
+        Run an export job using exporter.batch.run_job_with_result().
+
+        :param request: Job dict as described in exporter.batch.run_job().
+        :type request: dict
+        :return: Job result dict.
+        :rtype: dict
+        """
+        with self.server.pool.acquire(get_parameter(request, 'scils')) as session:
+            return run_job_with_result(request, session)
+
+    def stop_server(self, request):
+        """
+        Stop the server after the response has been sent. Requests that are already running are finished first.
+
+        :param request: Empty request.
+        :type request: dict
+        :return: Response.
+        :rtype: dict
+        """
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {'status': 'success', 'error': None}
+
+
+class ExportServer(ThreadingHTTPServer):
+    """
+    Local HTTP server that keeps SCiLS Lab sessions and feature tables warm between requests. Each request runs in its
+    own thread, and requests are handled by ExportRequestHandler. A random access token is written to a file that only
+    the current user can read when the server starts, and the file is removed when the server is closed.
+
+    :param server_address: Host and port to listen on.
+    :type server_address: tuple[str, int]
+    :param pool: Session pool shared by all requests.
+    :type pool: SessionPool
+    :param idle_timeout: Time in seconds after which SCiLS Lab sessions that are not in use are closed.
+    :type idle_timeout: float
+    :param quiet: If True, do not log requests.
+    :type quiet: bool
+    :param token_path: Path to the file the access token is written to. Defaults to
+        exporter.client.get_token_path() for the port the server listens on.
+    :type token_path: str | None
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, pool, idle_timeout=IDLE_TIMEOUT, quiet=False, token_path=None):
+        super(ExportServer, self).__init__(server_address, ExportRequestHandler)
+        self.pool = pool
+        self.idle_timeout = idle_timeout
+        self.quiet = quiet
+        port = self.server_address[1]
+        # Clients must connect using the address the server listens on or localhost.
+        self.allowed_hosts = {f'{host.lower()}:{port}' for host in [server_address[0], '127.0.0.1', 'localhost']}
+        self.token = secrets.token_urlsafe(32)
+        self.token_path = token_path if token_path is not None else get_token_path(port)
+        try:
+            write_token(self.token_path, self.token)
+        except OSError:
+            super(ExportServer, self).server_close()
+            raise
+        self._stopped = threading.Event()
+        self._idle_thread = threading.Thread(target=self._close_idle_sessions, daemon=True)
+
+    def _close_idle_sessions(self):
+        while not self._stopped.wait(min(self.idle_timeout, 10)):
+            self.pool.close_idle(self.idle_timeout)
+
+    def serve_forever(self, poll_interval=0.5):
+        self._idle_thread.start()
+        try:
+            super(ExportServer, self).serve_forever(poll_interval)
+        finally:
+            self._stopped.set()
+
+    def server_close(self):
+        super(ExportServer, self).server_close()
+        self.pool.close()
+        if os.path.isfile(self.token_path):
+            os.remove(self.token_path)
+
+
+def write_token(token_path, token):
+    """
+    Write the access token of the export server to a file that only the current user can read. An existing token file
+    (i.e. from a server that was not shut down cleanly) is replaced.
+
+    :param token_path: Path to the token file.
+    :type token_path: str
+    :param token: Access token.
+    :type token: str
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(token_path)), exist_ok=True)
+    if os.path.isfile(token_path):
+        os.remove(token_path)
+    # Permissions are only applied to new files, so the file is always created here.
+    with os.fdopen(os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as token_file:
+        token_file.write(token)
+
+
+def get_parameter(request, key):
+    """
+    Get a required request parameter.
+
+    :param request: Request.
+    :type request: dict
+    :param key: Parameter name.
+    :type key: str
+    :return: Parameter value.
+    :rtype: object
+    """
+    if key not in request:
+        raise ValueError(f'Request is missing required parameter "{key}".')
+    return request[key]
+
+
+def get_args():
+    """
+    Parse command line parameters.
+
+    :return: Arguments with default or user specified values.
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser()
+    # General parameters
+    parser.add_argument('--host',
+                        help=f'Host name or IP address to listen on. Defaults to {DEFAULT_HOST} (localhost only).',
+                        default=DEFAULT_HOST,
+                        type=str)
+    parser.add_argument('--port',
+                        help=f'Port to listen on. Defaults to {DEFAULT_PORT}.',
+                        default=DEFAULT_PORT,
+                        type=int)
+    parser.add_argument('--max_sessions',
+                        help=f'Maximum number of SCiLS .slx files kept open. Defaults to {MAX_SESSIONS}.',
+                        default=MAX_SESSIONS,
+                        type=int)
+    parser.add_argument('--max_feature_tables',
+                        help='Maximum number of feature tables kept in memory for each SCiLS .slx file. Defaults to '
+                             f'{MAX_FEATURE_TABLES}.',
+                        default=MAX_FEATURE_TABLES,
+                        type=int)
+    parser.add_argument('--idle_timeout',
+                        help='Time in seconds after which unused SCiLS .slx files are closed so they can be modified '
+                             f'in SCiLS Lab. Defaults to {IDLE_TIMEOUT}.',
+                        default=IDLE_TIMEOUT,
+                        type=float)
+    parser.add_argument('--token_file',
+                        help='Path to the file the access token required by clients is written to. Defaults to a '
+                             'file in the local application data directory of the current user.',
+                        default=None,
+                        type=str)
+    parser.add_argument('--quiet',
+                        help='If this flag is used, do not log requests.',
+                        action='store_true')
+
+    arguments = parser.parse_args()
+    return vars(arguments)
+
+
+def main():
+    """
+    Run workflow.
+    """
+    args = get_args()
+    pool = SessionPool(args['max_sessions'], args['max_feature_tables'])
+    with ExportServer((args['host'], args['port']), pool, args['idle_timeout'], args['quiet'],
+                      args['token_file']) as server:
+        print(f'iprm-PASEF export server listening on http://{args["host"]}:{args["port"]}. Access token written to '
+              f'{server.token_path}. Press Ctrl+C to stop.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
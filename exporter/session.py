@@ -0,0 +1,147 @@
+import contextlib
+import collections
+from exporter.feature_table import get_feature_table, get_feature_table_schema
+from exporter.colocalization import IonImageCache
+
+
+class ScilsSession(object):
+    """
+    Reusable SCiLS Lab session for a single *.slx file. The underlying session is opened lazily on first use and kept
+    open until close() is called, so a single warm session can be shared between feature list discovery, intensity
+    column discovery, and export. Converters accept a ScilsSession in place of an *.slx file path. Feature table schemas
+    are memoized and ion images are cached for the life of the session. Feature tables can optionally be kept in memory
+    as well (i.e. by exporter.server), so repeated exports of the same feature list do not read them again.
+
+    :param filename: Path to the input SCiLS Lab *.slx file.
+    :type filename: str
+    :param session_factory: Callable used to open the underlying session with a filename keyword argument. Defaults
+        to scilslab.LocalSession, which is only imported when the session is first opened. Can be replaced with an
+        in-memory stand-in for testing.
+    :type session_factory: collections.abc.Callable | None
+    :param max_feature_tables: Maximum number of feature tables kept in memory. Least recently used feature tables are
+        removed once this number is exceeded. Defaults to 0 (feature tables are not kept in memory).
+    :type max_feature_tables: int
+    """
+    def __init__(self, filename, session_factory=None, max_feature_tables=0):
+        self.filename = filename
+        self.session_factory = session_factory
+        self.max_feature_tables = max_feature_tables
+        self._session = None
+        self._schemas = {}
+        self._features = collections.OrderedDict()
+        self.ion_image_cache = IonImageCache()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def is_open(self):
+        """
+        :return: True if the underlying SCiLS Lab session is currently open.
+        :rtype: bool
+        """
+        return self._session is not None
+
+    @property
+    def dataset_proxy(self):
+        """
+        :return: Dataset proxy of the underlying SCiLS Lab session, opening the session if needed.
+        :rtype: scilslab.DatasetProxy
+        """
+        if self._session is None:
+            session_factory = self.session_factory
+            if session_factory is None:
+                from scilslab import LocalSession
+                session_factory = LocalSession
+            self._session = session_factory(filename=self.filename)
+        return self._session.dataset_proxy
+
+    def get_feature_lists(self):
+        """
+        Get the feature lists in the SCiLS Lab dataset.
+
+        :return: Feature lists containing at least name and id columns.
+        :rtype: pandas.DataFrame
+        """
+        return self.dataset_proxy.feature_table.get_feature_lists()
+
+    def get_features(self, feature_list_id, use_cache=True, columns=None):
+        """
+        Get a feature table including all user columns using exporter.feature_table.get_feature_table(). The session is
+        only opened if the feature table is not found in the feature table cache. If max_feature_tables is greater than
+        0, feature tables are kept in memory for each feature list and set of columns, and the returned feature table
+        must not be modified.
+
+        :param feature_list_id: UUID for the feature table of interest.
+        :type feature_list_id: str
+        :param use_cache: If False, always fetch the feature table from SCiLS Lab.
+        :type use_cache: bool
+        :param columns: Columns to return. If None, all columns are returned.
+        :type columns: list[str] | None
+        :return: Feature table.
+        :rtype: pandas.DataFrame
+        """
+        if not use_cache or self.max_feature_tables <= 0:
+            return get_feature_table(self.filename, feature_list_id, session=self, use_cache=use_cache, columns=columns)
+        key = (feature_list_id, tuple(columns) if columns is not None else None)
+        if key not in self._features:
+            self._features[key] = get_feature_table(self.filename, feature_list_id, session=self, columns=columns)
+            while len(self._features) > self.max_feature_tables:
+                self._features.popitem(last=False)
+        self._features.move_to_end(key)
+        return self._features[key]
+
+    def get_feature_schema(self, feature_list_id, use_cache=True):
+        """
+        Get the column names, data types, and number of rows of a feature table using
+        exporter.feature_table.get_feature_table_schema(). Schemas are memoized per feature list for the life of the
+        session, so repeated lookups (i.e. reselecting a feature list in the GUI) do not read the feature table again.
+        The first lookup of a feature list that is not cached loads the complete feature table from SCiLS Lab.
+
+        :param feature_list_id: UUID for the feature table of interest.
+        :type feature_list_id: str
+        :param use_cache: If False, fetch the feature table from SCiLS Lab instead of reading the schema from the
+            feature table cache the first time the schema of a feature list is requested.
+        :type use_cache: bool
+        :return: Dict containing the column names ("columns"), the data type of each column indexed by column name
+            ("dtypes"), and the number of rows ("n_rows").
+        :rtype: dict
+        """
+        if feature_list_id not in self._schemas:
+            self._schemas[feature_list_id] = get_feature_table_schema(self.filename, feature_list_id, session=self,
+                                                                      use_cache=use_cache)
+        return self._schemas[feature_list_id]
+
+    def close(self):
+        """
+        Close the underlying SCiLS Lab session to free *.slx and *.sbd files. The session is reopened if used again.
+        Cached ion images are removed, while memoized schemas and feature tables kept in memory are retained.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        self.ion_image_cache.clear()
+
+
+@contextlib.contextmanager
+def open_session(slx, session_factory=None):
+    """
+    Context manager yielding a ScilsSession for an *.slx file path. If an existing ScilsSession is provided, it is
+    yielded unchanged and left open for reuse by the caller. Otherwise, a new session is created and closed on exit.
+
+    :param slx: Path to the input SCiLS Lab *.slx file or an existing ScilsSession.
+    :type slx: str | ScilsSession
+    :param session_factory: Callable used to open new sessions. Defaults to scilslab.LocalSession. Ignored if slx is
+        already a ScilsSession.
+    :type session_factory: collections.abc.Callable | None
+    :return: SCiLS Lab session.
+    :rtype: collections.abc.Iterator[ScilsSession]
+    """
+    if isinstance(slx, ScilsSession):
+        yield slx
+    else:
+        with ScilsSession(slx, session_factory=session_factory) as session:
+            yield session
@@ -0,0 +1,492 @@
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+from exporter.feature_table import get_feature_columns, project_feature_table, to_column_list
+from exporter.isolation_window import factorize_isolation_windows
+from exporter.colocalization import filter_colocalized_fragments
+from exporter.fragment_filters import apply_fragment_filters, validate_fragment_filters
+from exporter.profiling import profile_stage
+from exporter.session import open_session
+
+
+# Minimum number of seconds between progress events emitted by write_ms2_spectra().
+PROGRESS_INTERVAL = 0.1
+# Characters that cannot be used in directory names on Windows, replaced when naming the output directory of each
+# intensity column.
+INVALID_PATH_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class ExportCancelled(Exception):
+    """
+    Raised when an export is cancelled using the cancel event passed to write_ms2_spectra().
+    """
+    pass
+
+
+class MS2Spectra(object):
+    """
+    Compact array-backed MS/MS spectra for all isolation windows of an iprm-PASEF feature list. Isolation window and
+    precursor values are stored as one array per value with one element per spectrum, while the fragment m/z and
+    intensity arrays of all spectra are concatenated and indexed using offsets, so the peaks of a single spectrum are
+    views into the concatenated arrays and no spectrum data is copied when accessing or iterating over spectra.
+    Indexing and iterating yield the scan dicts consumed by the MGF and mzML writers.
+
+    :param isolation_window: Isolation window label of each spectrum.
+    :type isolation_window: numpy.ndarray
+    :param iso_mz: Isolation window m/z of each spectrum.
+    :type iso_mz: numpy.ndarray
+    :param iso_ook0: Isolation window 1/K0 of each spectrum.
+    :type iso_ook0: numpy.ndarray
+    :param iso_width: Isolation window width of each spectrum.
+    :type iso_width: numpy.ndarray
+    :param selected_ion_mz: Precursor m/z of each spectrum.
+    :type selected_ion_mz: numpy.ndarray
+    :param selected_ion_mobility: Precursor 1/K0 of each spectrum.
+    :type selected_ion_mobility: numpy.ndarray
+    :param mz_array: Sorted fragment m/z values of all spectra concatenated.
+    :type mz_array: numpy.ndarray
+    :param intensity_array: Fragment intensity values of all spectra concatenated.
+    :type intensity_array: numpy.ndarray
+    :param offsets: Offsets (length n_spectra + 1) of the fragments of each spectrum within mz_array and
+        intensity_array.
+    :type offsets: numpy.ndarray
+    :param intensity_column_name: Name of the feature table column the intensity values were taken from.
+    :type intensity_column_name: str | None
+    """
+    def __init__(self, isolation_window, iso_mz, iso_ook0, iso_width, selected_ion_mz, selected_ion_mobility,
+                 mz_array, intensity_array, offsets, intensity_column_name=None):
+        if len(offsets) != len(isolation_window) + 1 or offsets[-1] != len(mz_array) or \
+                len(mz_array) != len(intensity_array):
+            raise ValueError('Offsets must contain one more element than there are spectra and end at the length of '
+                             'the m/z and intensity arrays.')
+        self.isolation_window = isolation_window
+        self.iso_mz = iso_mz
+        self.iso_ook0 = iso_ook0
+        self.iso_width = iso_width
+        self.selected_ion_mz = selected_ion_mz
+        self.selected_ion_mobility = selected_ion_mobility
+        self.mz_array = mz_array
+        self.intensity_array = intensity_array
+        self.offsets = offsets
+        self.intensity_column_name = intensity_column_name
+
+    def __len__(self):
+        return len(self.isolation_window)
+
+    def __getitem__(self, index):
+        """
+        Get a single MS/MS spectrum.
+
+        :param index: Index of the spectrum. Negative indices count from the last spectrum.
+        :type index: int
+        :return: Dictionary containing the scan number, isolation window label and numeric isolation window m/z, 1/K0,
+            and width, precursor m/z and 1/K0, and fragment m/z and intensity arrays (views) of the spectrum.
+        :rtype: dict
+        """
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Spectrum index {index} is out of range for {len(self)} spectra.')
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return {'scan_number': index + 1,
+                'isolation_window': self.isolation_window[index],
+                'iso_mz': self.iso_mz[index],
+                'iso_ook0': self.iso_ook0[index],
+                'iso_width': self.iso_width[index],
+                'selected_ion_mz': self.selected_ion_mz[index],
+                'selected_ion_mobility': self.selected_ion_mobility[index],
+                'mz_array': self.mz_array[start:end],
+                'intensity_array': self.intensity_array[start:end]}
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def n_peaks(self):
+        """
+        :return: Number of fragment peaks in each spectrum.
+        :rtype: numpy.ndarray
+        """
+        return np.diff(self.offsets)
+
+    def get_peaks(self, index):
+        """
+        Get the fragment peaks of a single MS/MS spectrum without copying them.
+
+        :param index: Index of the spectrum.
+        :type index: int
+        :return: Tuple containing views of the fragment m/z and intensity arrays of the spectrum.
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        scan = self[index]
+        return scan['mz_array'], scan['intensity_array']
+
+    def get_precursors(self):
+        """
+        Get the isolation window and precursor values of all MS/MS spectra as a table.
+
+        :return: Table with one row per spectrum containing the scan_number, isolation_window, iso_mz, iso_ook0,
+            iso_width, selected_ion_mz, selected_ion_mobility, and n_peaks columns.
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame({'scan_number': np.arange(1, len(self) + 1),
+                             'isolation_window': self.isolation_window,
+                             'iso_mz': self.iso_mz,
+                             'iso_ook0': self.iso_ook0,
+                             'iso_width': self.iso_width,
+                             'selected_ion_mz': self.selected_ion_mz,
+                             'selected_ion_mobility': self.selected_ion_mobility,
+                             'n_peaks': self.n_peaks})
+
+
+def build_ms2_spectra(feature_list, intensity_column_name, get_precursor_from_isolation_window,
+                      relative_intensity_threshold, profiler=None, fragment_filters=None):
+    """
+    Build MS/MS spectra for every isolation window in an iprm-PASEF SCiLS Lab feature list at once. The feature table
+    is split by feature type and fragments are sorted a single time by (isolation window, m/z), after which precursor
+    values, fragment intensity thresholds, and fragment peak lists are computed for all windows using whole-array
+    operations. If multiple intensity columns are given, isolation windows, feature types, m/z and 1/K0 values, and the
+    fragment sort order are shared, and only the intensity dependent values are computed for each column.
+
+    :param feature_list: iprm-PASEF feature table containing precursor/fragment and isolation window columns.
+    :type feature_list: pandas.DataFrame
+    :param intensity_column_name: Name of the column from the feature table to use intensity values from, or a list of
+        column names to build one set of MS/MS spectra per column.
+    :type intensity_column_name: str | list[str]
+    :param get_precursor_from_isolation_window: If True, populate the precursor m/z and 1/K0 values from the isolation
+        window that was defined in the iprm-PASEF timsControl method.
+    :type get_precursor_from_isolation_window: bool
+    :param relative_intensity_threshold: Relative intensity threshold as a fraction of the sum of all fragment
+        intensity values for a given precursor (i.e. 0.01 == 1%).
+    :type relative_intensity_threshold: float
+    :param profiler: Export profiler used to time the windowing and filtering stages.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    :param fragment_filters: Dict of additional fragment filter values indexed by filter name as described in
+        exporter.fragment_filters.FRAGMENT_FILTERS, applied to all isolation windows at once after the relative
+        intensity threshold.
+    :type fragment_filters: dict | None
+    :return: MS/MS spectra for all isolation windows. If a list of intensity column names is given, a list containing
+        the MS/MS spectra for each column is returned.
+    :rtype: MS2Spectra | list[MS2Spectra]
+    """
+    intensity_column_names = to_column_list(intensity_column_name)
+    validate_fragment_filters(fragment_filters)
+    with profile_stage(profiler, 'windowing', items=feature_list.shape[0]):
+        # Isolation windows are sorted to match the order used by pandas.DataFrame.groupby. Rows without an isolation
+        # window are assigned -1 and ignored.
+        window_codes, isolation_windows = factorize_isolation_windows(feature_list)
+        windows = isolation_windows['isolation_window'].values
+        n_windows = windows.size
+    with profile_stage(profiler, 'filtering', items=feature_list.shape[0] * len(intensity_column_names)):
+        feature_type = feature_list['type'].values
+        is_precursor = (feature_type == 'Precursor') & (window_codes >= 0)
+        is_fragment = (feature_type == 'Fragment') & (window_codes >= 0)
+        mz = (feature_list['mz_low'].values + feature_list['mz_high'].values) / 2
+        if not get_precursor_from_isolation_window:
+            ook0 = (feature_list['one_over_k0_low'].values + feature_list['one_over_k0_high'].values) / 2
+            precursor_codes = window_codes[is_precursor]
+            precursor_mz = mz[is_precursor]
+            precursor_ook0 = ook0[is_precursor]
+            has_precursor = np.bincount(precursor_codes, minlength=n_windows) > 0
+
+        # Sort fragments by isolation window and m/z in a single pass.
+        fragment_codes = window_codes[is_fragment]
+        fragment_mz = mz[is_fragment]
+        order = np.lexsort((fragment_mz, fragment_codes))
+        fragment_codes = fragment_codes[order]
+        fragment_mz = fragment_mz[order]
+        window_sizes = np.bincount(fragment_codes, minlength=n_windows)
+        window_starts = np.searchsorted(fragment_codes, np.arange(n_windows))
+
+        spectra = []
+        for column in intensity_column_names:
+            intensity = feature_list[column].values
+            # Get precursor m/z and 1/K0 values from the isolation window.
+            selected_ion_mz = isolation_windows['iso_mz'].values.copy()
+            selected_ion_mobility = isolation_windows['iso_ook0'].values.copy()
+            if not get_precursor_from_isolation_window:
+                # Calculate weighted average for precursor m/z and 1/K0 using feature intensity as weights. Windows
+                # without any precursor type features or whose precursors have a total intensity of zero (i.e. in a
+                # region without signal) keep the values parsed from the isolation window instead of becoming NaN.
+                weights = intensity[is_precursor]
+                weight_sums = np.bincount(precursor_codes, weights=weights, minlength=n_windows)
+                weighted = has_precursor & (weight_sums > 0)
+                selected_ion_mz[weighted] = np.bincount(precursor_codes,
+                                                        weights=weights * precursor_mz,
+                                                        minlength=n_windows)[weighted] / weight_sums[weighted]
+                selected_ion_mobility[weighted] = np.bincount(precursor_codes,
+                                                              weights=weights * precursor_ook0,
+                                                              minlength=n_windows)[weighted] / weight_sums[weighted]
+
+            # Filter and remove any fragment type features based on relative intensity cutoff.
+            fragment_intensity = intensity[is_fragment][order]
+            window_tics = np.zeros(n_windows, dtype=np.float64)
+            if fragment_intensity.size:
+                window_tics[window_sizes > 0] = np.add.reduceat(fragment_intensity, window_starts[window_sizes > 0])
+            keep = fragment_intensity >= window_tics[fragment_codes] * relative_intensity_threshold
+            if fragment_filters:
+                keep = apply_fragment_filters(fragment_filters,
+                                              {'codes': fragment_codes,
+                                               'mz': fragment_mz,
+                                               'intensity': fragment_intensity,
+                                               'window_starts': window_starts,
+                                               'window_sizes': window_sizes,
+                                               'selected_ion_mz': selected_ion_mz},
+                                              keep)
+            offsets = np.zeros(n_windows + 1, dtype=np.int64)
+            np.cumsum(np.bincount(fragment_codes[keep], minlength=n_windows), out=offsets[1:])
+
+            spectra.append(MS2Spectra(isolation_window=windows,
+                                      iso_mz=isolation_windows['iso_mz'].values,
+                                      iso_ook0=isolation_windows['iso_ook0'].values,
+                                      iso_width=isolation_windows['iso_width'].values,
+                                      selected_ion_mz=selected_ion_mz,
+                                      selected_ion_mobility=selected_ion_mobility,
+                                      mz_array=fragment_mz[keep],
+                                      intensity_array=fragment_intensity[keep],
+                                      offsets=offsets,
+                                      intensity_column_name=column))
+
+    return spectra[0] if isinstance(intensity_column_name, str) else spectra
+
+
+def iter_ms2_spectra(spectra):
+    """
+    Iterate over MS/MS spectra built by build_ms2_spectra() one isolation window at a time. Data arrays are views into
+    the concatenated fragment arrays, so no spectrum data is copied and only a single spectrum is materialized at once.
+
+    :param spectra: MS/MS spectra returned by build_ms2_spectra().
+    :type spectra: MS2Spectra
+    :return: Generator yielding a dictionary containing the scan number, isolation window label and numeric isolation
+        window m/z, 1/K0, and width, precursor m/z and 1/K0, and fragment m/z and intensity arrays for each isolation
+        window.
+    :rtype: collections.abc.Iterator[dict]
+    """
+    return iter(spectra)
+
+
+def get_window_filename(slx, selected_ion_mz, selected_ion_mobility, extension):
+    """
+    Get the output filename used when writing the MS/MS spectrum from a single isolation window to its own file.
+
+    :param slx: Path to the input SCiLS Lab *.slx file used to name the output file.
+    :type slx: str
+    :param selected_ion_mz: Precursor m/z of the MS/MS spectrum.
+    :type selected_ion_mz: float
+    :param selected_ion_mobility: Precursor 1/K0 of the MS/MS spectrum.
+    :type selected_ion_mobility: float
+    :param extension: File extension without the leading period (i.e. "mgf" or "mzML").
+    :type extension: str
+    :return: Output filename.
+    :rtype: str
+    """
+    return f'{os.path.splitext(os.path.split(slx)[-1])[0]}_iprm-PASEF_mz{selected_ion_mz}' \
+           f'_ook0{selected_ion_mobility}.{extension}'
+
+
+def get_intensity_column_outdirs(outdir, intensity_column_names):
+    """
+    Get the output directory for each intensity column. If a single intensity column is exported, files are written to
+    the output directory itself. Otherwise, the files of each intensity column are written to a subdirectory of the
+    output directory named after the column.
+
+    :param outdir: Path to folder in which to write output file(s).
+    :type outdir: str
+    :param intensity_column_names: Names of the intensity columns to export.
+    :type intensity_column_names: list[str]
+    :return: Output directory for each intensity column.
+    :rtype: list[str]
+    """
+    if len(intensity_column_names) == 1:
+        return [outdir]
+    dirnames = [INVALID_PATH_CHARACTERS.sub('_', column).strip(' .') or '_' for column in intensity_column_names]
+    if len(set(dirname.lower() for dirname in dirnames)) != len(dirnames):
+        raise ValueError(f'Intensity columns {intensity_column_names} cannot be written to separate output '
+                         f'directories because their names are identical after removing invalid characters.')
+    return [os.path.join(outdir, dirname) for dirname in dirnames]
+
+
+def remove_files(paths):
+    """
+    Remove output files written by an aborted export. Files that do not exist or cannot be removed are skipped.
+
+    :param paths: Paths to the output files to remove.
+    :type paths: list[str]
+    """
+    for path in paths:
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def extract_ms2_spectra(session, feature_list_id, intensity_column_name, get_precursor_from_isolation_window,
+                        relative_intensity_threshold, use_cache=True, profiler=None, float32=False,
+                        colocalization_threshold=None, colocalization_method='pearson', fragment_filters=None):
+    """
+    Get an iprm-PASEF feature table from a SCiLS Lab session and build MS/MS spectra for all isolation windows. Only
+    the columns needed to build MS/MS spectra are kept, stored in the compact data types returned by
+    exporter.feature_table.project_feature_table().
+
+    :param session: SCiLS Lab session for the input *.slx file.
+    :type session: exporter.session.ScilsSession
+    :param feature_list_id: UUID for the MS1 feature table of interest.
+    :type feature_list_id: str
+    :param intensity_column_name: Name of the column from the feature table to use intensity values from, or a list of
+        column names to build one set of MS/MS spectra per column.
+    :type intensity_column_name: str | list[str]
+    :param get_precursor_from_isolation_window: If True, populate the precursor m/z and 1/K0 values from the isolation
+        window that was defined in the iprm-PASEF timsControl method.
+    :type get_precursor_from_isolation_window: bool
+    :param relative_intensity_threshold: Relative intensity threshold as a fraction of the sum of all fragment
+        intensity values for a given precursor (i.e. 0.01 == 1%).
+    :type relative_intensity_threshold: float
+    :param use_cache: If True, use the on-disk feature table cache.
+    :type use_cache: bool
+    :param profiler: Export profiler used to time the fetch, windowing, and filtering stages.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    :param float32: If True, store the m/z, 1/K0, and intensity columns of the feature table as 32-bit floats.
+    :type float32: bool
+    :param colocalization_threshold: If not None, remove fragments whose ion image co-localization score with the
+        precursor ion image of their isolation window is below this threshold (-1 to 1) using
+        exporter.colocalization.filter_colocalized_fragments() before building MS/MS spectra.
+    :type colocalization_threshold: float | None
+    :param colocalization_method: Correlation measure used to score co-localization, either "pearson" or "cosine".
+    :type colocalization_method: str
+    :param fragment_filters: Dict of additional fragment filter values indexed by filter name as described in
+        exporter.fragment_filters.FRAGMENT_FILTERS.
+    :type fragment_filters: dict | None
+    :return: MS/MS spectra or list of MS/MS spectra for each intensity column as returned by build_ms2_spectra().
+    :rtype: MS2Spectra | list[MS2Spectra]
+    """
+    # Get iprm-PASEF feature table from iprm SCiLS file containing precursor/fragment and isolation window columns.
+    with profile_stage(profiler, 'fetch') as stage:
+        feature_list = session.get_features(feature_list_id, use_cache=use_cache,
+                                            columns=get_feature_columns(intensity_column_name))
+        feature_list = project_feature_table(feature_list, intensity_column_name, float32)
+        stage['items'] = feature_list.shape[0]
+    # Remove fragments that are not spatially co-localized with the precursor of their isolation window.
+    if colocalization_threshold is not None:
+        with profile_stage(profiler, 'colocalization', items=feature_list.shape[0]):
+            feature_list = filter_colocalized_fragments(session, feature_list, colocalization_threshold,
+                                                        colocalization_method, profiler=profiler)
+    # Build MS/MS spectra for all isolation windows. Each spectrum will contain all precursor and fragment features
+    # detected by Bruker T-ReX feature finding in SCiLS.
+    return build_ms2_spectra(feature_list, intensity_column_name, get_precursor_from_isolation_window,
+                             relative_intensity_threshold, profiler, fragment_filters)
+
+
+def extract_spectra(slx, feature_list_id, intensity_column_name, get_precursor_from_isolation_window=False,
+                    relative_intensity_threshold=1, use_cache=True, float32=False, colocalization_threshold=None,
+                    colocalization_method='pearson', fragment_filters=None):
+    """
+    Extract MS/MS spectra from an iprm-PASEF SCiLS Lab feature list without writing any files. The returned MS2Spectra
+    can be used directly in Python or written to MGF and/or mzML files using exporter.export.write_spectra().
+
+    :param slx: Path to the input SCiLS Lab *.slx file to analyze or an open exporter.session.ScilsSession to reuse.
+    :type slx: str | exporter.session.ScilsSession
+    :param feature_list_id: UUID for the MS1 feature table of interest.
+    :type feature_list_id: str
+    :param intensity_column_name: Name of the column from the feature table to use intensity values from, or a list of
+        column names to extract one set of MS/MS spectra per column.
+    :type intensity_column_name: str | list[str]
+    :param get_precursor_from_isolation_window: If True, populate the precursor m/z and 1/K0 values from the isolation
+        window that was defined in the iprm-PASEF timsControl method.
+    :type get_precursor_from_isolation_window: bool
+    :param relative_intensity_threshold: Relative intensity threshold value to use for filtering out low intensity
+        fragment peaks. A threshold value of '1' corresponds to a threshold of 1% of the sum of all fragment intensity
+        values for a given precursor.
+    :type relative_intensity_threshold: int | float
+    :param use_cache: If True, use the on-disk feature table cache.
+    :type use_cache: bool
+    :param float32: If True, store the m/z, 1/K0, and intensity columns of the feature table as 32-bit floats.
+    :type float32: bool
+    :param colocalization_threshold: If not None, remove fragments whose ion image co-localization score with the
+        precursor ion image of their isolation window is below this threshold (-1 to 1).
+    :type colocalization_threshold: float | None
+    :param colocalization_method: Correlation measure used to score co-localization, either "pearson" or "cosine".
+    :type colocalization_method: str
+    :param fragment_filters: Dict of additional fragment filter values indexed by filter name as described in
+        exporter.fragment_filters.FRAGMENT_FILTERS, i.e. {"top_n": 50, "precursor_exclusion": 1.5}.
+    :type fragment_filters: dict | None
+    :return: MS/MS spectra for all isolation windows, or a list of MS/MS spectra for each intensity column if a list
+        of intensity column names is given.
+    :rtype: MS2Spectra | list[MS2Spectra]
+    """
+    with open_session(slx) as session:
+        return extract_ms2_spectra(session, feature_list_id, intensity_column_name, get_precursor_from_isolation_window,
+                                   relative_intensity_threshold / 100, use_cache, float32=float32,
+                                   colocalization_threshold=colocalization_threshold,
+                                   colocalization_method=colocalization_method,
+                                   fragment_filters=fragment_filters)
+
+
+def write_ms2_spectra(spectra, sinks, progress_callback=None, cancel_event=None, profiler=None):
+    """
+    Write MS/MS spectra to one or more output sinks in a single pass over all isolation windows. Each sink must have
+    an export_format attribute and implement open(n_spectra), write(scan), close(), and abort() methods, where scan is
+    a dict yielded by iter_ms2_spectra() and abort() stops writing and removes any files written by the sink. If
+    writing fails or is cancelled, all sinks are aborted so that no partial files are left behind.
+
+    :param spectra: MS/MS spectra returned by build_ms2_spectra(), or a list of MS/MS spectra for each intensity column
+        returned by build_ms2_spectra() for a list of intensity columns.
+    :type spectra: MS2Spectra | list[MS2Spectra]
+    :param sinks: Output sinks (i.e. exporter.mgf.MgfSink, exporter.mzml.MzmlSink), or a list containing a list of
+        output sinks for each intensity column if a list of MS/MS spectra is given.
+    :type sinks: list | list[list]
+    :param progress_callback: Function called with a progress dict containing windows_done, windows_total,
+        spectra_per_second, and eta (estimated seconds remaining) keys. Called at most every PROGRESS_INTERVAL seconds
+        and once after the last isolation window is written.
+    :type progress_callback: collections.abc.Callable | None
+    :param cancel_event: Event (i.e. threading.Event) checked before each isolation window is written. If set, the
+        export is stopped and ExportCancelled is raised.
+    :type cancel_event: threading.Event | None
+    :param profiler: Export profiler used to time opening, writing to, and closing each sink and the time spent writing
+        each isolation window to all sinks. Sinks are identified by their export_format attribute.
+    :type profiler: exporter.profiling.ExportProfiler | None
+    """
+    if isinstance(spectra, MS2Spectra):
+        spectra, sinks = [spectra], [sinks]
+    if len(spectra) != len(sinks):
+        raise ValueError('A list of output sinks is required for the MS/MS spectra of each intensity column.')
+    all_sinks = [sink for column_sinks in sinks for sink in column_sinks]
+    # All MS/MS spectra built from the same feature table share the same isolation windows.
+    windows_total = len(spectra[0])
+    start_time = time.perf_counter()
+    last_progress_time = start_time
+    try:
+        for sink in all_sinks:
+            with profile_stage(profiler, f'open_{sink.export_format}'):
+                sink.open(windows_total)
+        for scans in zip(*[iter_ms2_spectra(column_spectra) for column_spectra in spectra]):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled('Export was cancelled.')
+            window_start_time = time.perf_counter()
+            for scan, column_sinks in zip(scans, sinks):
+                for sink in column_sinks:
+                    with profile_stage(profiler, f'write_{sink.export_format}', items=1):
+                        sink.write(scan)
+            scan = scans[0]
+            now = time.perf_counter()
+            if profiler is not None:
+                profiler.add_window(scan, now - window_start_time)
+            if progress_callback is not None and \
+                    (now - last_progress_time >= PROGRESS_INTERVAL or scan['scan_number'] == windows_total):
+                last_progress_time = now
+                spectra_per_second = scan['scan_number'] / max(now - start_time, 1e-9)
+                progress_callback({'windows_done': scan['scan_number'],
+                                   'windows_total': windows_total,
+                                   'spectra_per_second': spectra_per_second,
+                                   'eta': (windows_total - scan['scan_number']) / spectra_per_second})
+        for sink in all_sinks:
+            with profile_stage(profiler, f'close_{sink.export_format}'):
+                sink.close()
+    except BaseException:
+        for sink in all_sinks:
+            sink.abort()
+        raise
@@ -1,11 +1,53 @@
 import os
-import sys
-import io
-from scilslab import LocalSession
-from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QButtonGroup, QMessageBox
+import threading
+import traceback
+import multiprocessing
+from PySide6.QtCore import Qt, QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QButtonGroup, QMessageBox, QDialog, \
+    QDialogButtonBox, QListWidget, QListWidgetItem, QVBoxLayout, QGridLayout, QCheckBox, QDoubleSpinBox, QSpinBox
 from exporter.iprmpasef_exporter_template import Ui_IprmpasefExporterWindow
-from exporter.mgf import convert_iprmpasef_feature_list_to_mgf
-from exporter.mzml import convert_iprmpasef_feature_list_to_mzml
+from exporter.export import convert_iprmpasef_feature_list
+from exporter.feature_table import to_column_list
+from exporter.fragment_filters import FRAGMENT_FILTERS
+from exporter.session import ScilsSession
+from exporter.spectra import ExportCancelled
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by a Worker running in a QThreadPool thread"""
+    result = Signal(object)
+    error = Signal(str)
+    cancelled = Signal()
+    progress = Signal(object)
+
+
+class Worker(QRunnable):
+    """
+    Run a function in a QThreadPool thread so the GUI stays responsive. The return value, any error message, or
+    cancellation is reported using the signals in Worker.signals.
+
+    :param function: Function to run.
+    :type function: collections.abc.Callable
+    :param kwargs: Keyword arguments passed to function.
+    """
+    def __init__(self, function, **kwargs):
+        super(Worker, self).__init__()
+        self.function = function
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        """
+        Run function and emit its result, error message, or cancellation.
+        """
+        try:
+            result = self.function(**self.kwargs)
+        except ExportCancelled:
+            self.signals.cancelled.emit()
+        except Exception as exception:
+            self.signals.error.emit(''.join(traceback.format_exception_only(type(exception), exception)).strip())
+        else:
+            self.signals.result.emit(result)
 
 
 class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
@@ -14,11 +56,13 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         super(IprmpasefExporterWindow, self).__init__()
 
         self.session = None
+        self.worker = None
+        self.cancel_event = None
 
         # self.input
         self.args = {'scils': '',
                      'outdir': '',
-                     'export_format': '',
+                     'export_formats': [],
                      'feature_list_id': '',
                      'intensity_column_name': '',
                      'export_single_file': False,
@@ -28,7 +72,11 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
                      'barebones_metadata': False,
                      'mz_encoding': 64,
                      'intensity_encoding': 64,
-                     'compression': 'zlib'}
+                     'compression': 'zlib',
+                     'mzmlb': False,
+                     'workers': 1,
+                     'profile': None,
+                     'fragment_filters': {}}
 
         # setup UI
         self.setupUi(self)
@@ -44,12 +92,16 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         self.MzEncodingLabel.setVisible(False)
         self.MzEncoding32bitRadio.setVisible(False)
         self.MzEncoding64bitRadio.setVisible(False)
+        self.MzEncodingNumpressRadio.setVisible(False)
         self.IntensityEncodingLabel.setVisible(False)
         self.IntensityEncoding32bitRadio.setVisible(False)
         self.IntensityEncoding64bitRadio.setVisible(False)
+        self.IntensityEncodingSlofRadio.setVisible(False)
+        self.IntensityEncodingPicRadio.setVisible(False)
         self.CompressionLabel.setVisible(False)
         self.CompressionZlibRadio.setVisible(False)
         self.CompressionNoneRadio.setVisible(False)
+        self.MzmlbCheckbox.setVisible(False)
         # Group radio buttons
         self.PolarityGroup = QButtonGroup()
         self.PolarityGroup.addButton(self.PolarityPositiveRadio)
@@ -57,9 +109,12 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         self.MzEncodingGroup = QButtonGroup()
         self.MzEncodingGroup.addButton(self.MzEncoding32bitRadio)
         self.MzEncodingGroup.addButton(self.MzEncoding64bitRadio)
+        self.MzEncodingGroup.addButton(self.MzEncodingNumpressRadio)
         self.IntensityEncodingGroup = QButtonGroup()
         self.IntensityEncodingGroup.addButton(self.IntensityEncoding32bitRadio)
         self.IntensityEncodingGroup.addButton(self.IntensityEncoding64bitRadio)
+        self.IntensityEncodingGroup.addButton(self.IntensityEncodingSlofRadio)
+        self.IntensityEncodingGroup.addButton(self.IntensityEncodingPicRadio)
         self.CompressionGroup = QButtonGroup()
         self.CompressionGroup.addButton(self.CompressionZlibRadio)
         self.CompressionGroup.addButton(self.CompressionNoneRadio)
@@ -68,10 +123,15 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         self.RelativeIntensityThresholdSpinBox.setMinimum(0)
         self.RelativeIntensityThresholdSpinBox.setMaximum(100)
         self.RelativeIntensityThresholdSpinBox.setValue(1)
+        self.WorkersSpinBox.setMinimum(1)
+        self.WorkersSpinBox.setMaximum(os.cpu_count())
+        self.WorkersSpinBox.setValue(1)
         self.PolarityPositiveRadio.setChecked(True)
         self.MzEncoding64bitRadio.setChecked(True)
         self.IntensityEncoding64bitRadio.setChecked(True)
         self.CompressionZlibRadio.setChecked(True)
+        self.CancelButton.setEnabled(False)
+        self.ProgressBar.setValue(0)
 
         # File browser dialogues
         # Select SLX file
@@ -79,36 +139,99 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         # Select output directory
         self.OutputDirectoryBrowseButton.clicked.connect(self.select_output_directory)
 
-        # Get and set export format from combo box
+        # Get and set export formats from checkboxes
         # Show/hide mzML parameters
-        self.ExportFormatCombo.addItems(['', 'MGF', 'mzML (Beta)'])
-        self.ExportFormatCombo.currentIndexChanged.connect(self.export_format_selected)
+        self.ExportMgfCheckbox.stateChanged.connect(self.export_format_selected)
+        self.ExportMzmlCheckbox.stateChanged.connect(self.export_format_selected)
 
         # Update intensity column names when feature list selected
         # Update args when feature list or intensity column name selected
         self.FeatureListIdCombo.currentIndexChanged.connect(self.feature_list_selected)
         self.IntensityColumnNameCombo.currentIndexChanged.connect(self.intensity_column_name_selected)
+        # Select multiple intensity columns
+        self.IntensityColumnsButton.clicked.connect(self.select_intensity_columns)
+        # Select additional fragment filters
+        self.FragmentFiltersButton.clicked.connect(self.select_fragment_filters)
 
         # Run
         self.RunButton.clicked.connect(self.run)
+        # Cancel
+        self.CancelButton.clicked.connect(self.cancel)
 
     def close_session(self):
         """
         Close SCiLS session to free *.slx and *.sbd files.
         """
-        self.session.close()
-        self.session = None
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def set_inputs_enabled(self, enabled):
+        """
+        Enable or gray out and disable ability to click all buttons.
+
+        :param enabled: If True, enable buttons. Otherwise, disable buttons.
+        :type enabled: bool
+        """
+        self.ScilsBrowseButton.setEnabled(enabled)
+        self.FeatureListIdCombo.setEnabled(enabled)
+        self.IntensityColumnNameCombo.setEnabled(enabled)
+        self.IntensityColumnsButton.setEnabled(enabled)
+        self.FragmentFiltersButton.setEnabled(enabled)
+        self.OutputDirectoryBrowseButton.setEnabled(enabled)
+        self.ExportMgfCheckbox.setEnabled(enabled)
+        self.ExportMzmlCheckbox.setEnabled(enabled)
+        self.RunButton.setEnabled(enabled)
+
+    def start_worker(self, function, result, progress=None, cancelled=None, **kwargs):
+        """
+        Run a function in a worker thread so the GUI stays responsive. Buttons are disabled until the function has
+        finished and the result slot is called.
+
+        :param function: Function to run.
+        :type function: collections.abc.Callable
+        :param result: Slot called with the return value of function.
+        :type result: collections.abc.Callable
+        :param progress: Slot called with progress dicts. If provided, function is passed a progress_callback keyword
+            argument.
+        :type progress: collections.abc.Callable | None
+        :param cancelled: Slot called if function raises exporter.spectra.ExportCancelled.
+        :type cancelled: collections.abc.Callable | None
+        :param kwargs: Keyword arguments passed to function.
+        """
+        self.set_inputs_enabled(False)
+        self.worker = Worker(function, **kwargs)
+        self.worker.signals.result.connect(result)
+        self.worker.signals.error.connect(self.worker_error)
+        if progress is not None:
+            self.worker.kwargs['progress_callback'] = self.worker.signals.progress.emit
+            self.worker.signals.progress.connect(progress)
+        if cancelled is not None:
+            self.worker.signals.cancelled.connect(cancelled)
+        QThreadPool.globalInstance().start(self.worker)
+
+    def worker_error(self, message):
+        """
+        Show error message box if a worker thread fails and re-enable buttons.
+
+        :param message: Error message.
+        :type message: str
+        """
+        self.set_inputs_enabled(True)
+        self.CancelButton.setEnabled(False)
+        self.ProgressBar.setMaximum(100)
+        self.ProgressBar.setValue(0)
+        self.ProgressLabel.setText('')
+        error = QMessageBox(self)
+        error.setWindowTitle('Error')
+        error.setText(message)
+        error.exec()
 
     def select_slx(self):
         """
         Select *.slx file when Browse button is clicked and populate the feature list combo box.
         """
-        self.ScilsBrowseButton.setEnabled(False)
-        self.FeatureListIdCombo.setEnabled(False)
-        self.IntensityColumnNameCombo.setEnabled(False)
-        self.OutputDirectoryBrowseButton.setEnabled(False)
-        self.ExportFormatCombo.setEnabled(False)
-        self.RunButton.setEnabled(False)
+        self.set_inputs_enabled(False)
 
         if self.session is not None:
             self.close_session()
@@ -122,18 +245,22 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
             self.args['scils'] = input_path
             self.ScilsLineEdit.setText(input_path)
             # Update combo box feature list names/IDs
-            self.session = LocalSession(filename=self.args['scils'])
-            dataset = self.session.dataset_proxy
-            feature_lists = dataset.feature_table.get_feature_lists()
-            for index, row in feature_lists.iterrows():
-                self.FeatureListIdCombo.addItem('|'.join([row['name'], row['id']]))
-
-        self.ScilsBrowseButton.setEnabled(True)
-        self.FeatureListIdCombo.setEnabled(True)
-        self.IntensityColumnNameCombo.setEnabled(True)
-        self.OutputDirectoryBrowseButton.setEnabled(True)
-        self.ExportFormatCombo.setEnabled(True)
-        self.RunButton.setEnabled(True)
+            # The session is kept open and reused for column discovery and export.
+            self.session = ScilsSession(self.args['scils'])
+            self.start_worker(self.session.get_feature_lists, self.feature_lists_loaded)
+        else:
+            self.set_inputs_enabled(True)
+
+    def feature_lists_loaded(self, feature_lists):
+        """
+        Populate the feature list combo box once feature lists have been loaded in the worker thread.
+
+        :param feature_lists: Feature lists containing at least name and id columns.
+        :type feature_lists: pandas.DataFrame
+        """
+        self.set_inputs_enabled(True)
+        for index, row in feature_lists.iterrows():
+            self.FeatureListIdCombo.addItem('|'.join([row['name'], row['id']]))
 
     def select_output_directory(self):
         """
@@ -142,15 +269,19 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         self.args['outdir'] = QFileDialog().getExistingDirectory(self, 'Select Directory...', '').replace('/', '\\')
         self.OutputDirectoryLineEdit.setText(self.args['outdir'])
 
-    def export_format_selected(self, index):
+    def export_format_selected(self, state):
         """
-        Set export format when combo box is modified and show or hide mzML specific parameters if mzML is selected.
+        Set export formats when an export format checkbox is modified and show or hide mzML specific parameters if mzML
+        is selected. Multiple export formats can be selected and are written in a single pass.
 
-        :param index: Index of selected ExportFormatCombo item.
+        :param state: Check state of the modified export format checkbox.
         """
-        self.args['export_format'] = self.ExportFormatCombo.itemText(index)
-        if self.args['export_format'] == 'mzML (Beta)':
-            self.args['export_format'] = 'mzML'
+        self.args['export_formats'] = []
+        if self.ExportMgfCheckbox.isChecked():
+            self.args['export_formats'].append('mgf')
+        if self.ExportMzmlCheckbox.isChecked():
+            self.args['export_formats'].append('mzml')
+        if 'mzml' in self.args['export_formats']:
             self.MzmlExportParametersLabel.setVisible(True)
             self.PolarityLabel.setVisible(True)
             self.PolarityPositiveRadio.setVisible(True)
@@ -159,12 +290,16 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
             self.MzEncodingLabel.setVisible(True)
             self.MzEncoding32bitRadio.setVisible(True)
             self.MzEncoding64bitRadio.setVisible(True)
+            self.MzEncodingNumpressRadio.setVisible(True)
             self.IntensityEncodingLabel.setVisible(True)
             self.IntensityEncoding32bitRadio.setVisible(True)
             self.IntensityEncoding64bitRadio.setVisible(True)
+            self.IntensityEncodingSlofRadio.setVisible(True)
+            self.IntensityEncodingPicRadio.setVisible(True)
             self.CompressionLabel.setVisible(True)
             self.CompressionZlibRadio.setVisible(True)
             self.CompressionNoneRadio.setVisible(True)
+            self.MzmlbCheckbox.setVisible(True)
         else:
             self.MzmlExportParametersLabel.setVisible(False)
             self.PolarityLabel.setVisible(False)
@@ -174,12 +309,16 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
             self.MzEncodingLabel.setVisible(False)
             self.MzEncoding32bitRadio.setVisible(False)
             self.MzEncoding64bitRadio.setVisible(False)
+            self.MzEncodingNumpressRadio.setVisible(False)
             self.IntensityEncodingLabel.setVisible(False)
             self.IntensityEncoding32bitRadio.setVisible(False)
             self.IntensityEncoding64bitRadio.setVisible(False)
+            self.IntensityEncodingSlofRadio.setVisible(False)
+            self.IntensityEncodingPicRadio.setVisible(False)
             self.CompressionLabel.setVisible(False)
             self.CompressionZlibRadio.setVisible(False)
             self.CompressionNoneRadio.setVisible(False)
+            self.MzmlbCheckbox.setVisible(False)
 
     def feature_list_selected(self, index):
         """
@@ -187,27 +326,25 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
 
         :param index: Index of selected FeatureListIdCombo item.
         """
-        self.ScilsBrowseButton.setEnabled(False)
-        self.FeatureListIdCombo.setEnabled(False)
-        self.IntensityColumnNameCombo.setEnabled(False)
-        self.OutputDirectoryBrowseButton.setEnabled(False)
-        self.ExportFormatCombo.setEnabled(False)
-        self.RunButton.setEnabled(False)
-
+        # Combo box was cleared.
+        if index < 0:
+            return
         feature_list_name, feature_list_id = self.FeatureListIdCombo.itemText(index).split('|')
         self.args['feature_list_id'] = feature_list_id
-        dataset = self.session.dataset_proxy
-        feature_list = dataset.feature_table.get_features(self.args['feature_list_id'],
-                                                          include_all_user_columns=True)
-        for col in feature_list.columns.values.tolist():
-            self.IntensityColumnNameCombo.addItem(col)
+        self.start_worker(self.session.get_feature_schema, self.intensity_column_names_loaded,
+                          feature_list_id=self.args['feature_list_id'])
+
+    def intensity_column_names_loaded(self, schema):
+        """
+        Populate the intensity column name combo box once the feature table schema has been loaded in the worker thread.
 
-        self.ScilsBrowseButton.setEnabled(True)
-        self.FeatureListIdCombo.setEnabled(True)
-        self.IntensityColumnNameCombo.setEnabled(True)
-        self.OutputDirectoryBrowseButton.setEnabled(True)
-        self.ExportFormatCombo.setEnabled(True)
-        self.RunButton.setEnabled(True)
+        :param schema: Feature table schema returned by exporter.session.ScilsSession.get_feature_schema().
+        :type schema: dict
+        """
+        self.set_inputs_enabled(True)
+        self.IntensityColumnNameCombo.clear()
+        for col in schema['columns']:
+            self.IntensityColumnNameCombo.addItem(col)
 
     def intensity_column_name_selected(self, index):
         """
@@ -216,30 +353,102 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         :param index: Index of selected IntensityColumnNameCombo item.
         """
         self.args['intensity_column_name'] = self.IntensityColumnNameCombo.itemText(index)
+        self.IntensityColumnNameLabel.setText('Intensity Column Name')
 
-    def run(self):
+    def select_intensity_columns(self):
         """
-        Run workflow.
+        Open a dialog to select multiple intensity columns. Spectra are exported for each selected column in a single
+        pass, and the files for each column are written to a subdirectory of the output directory named after the
+        column.
         """
-        # Replace stdout with Progress Update Stream.
-        sys.stderr = io.StringIO()
-
-        # Gray out and disable ability to click all buttons
-        self.ScilsBrowseButton.setEnabled(False)
-        self.FeatureListIdCombo.setEnabled(False)
-        self.IntensityColumnNameCombo.setEnabled(False)
-        self.OutputDirectoryBrowseButton.setEnabled(False)
-        self.ExportFormatCombo.setEnabled(False)
-        self.RunButton.setEnabled(False)
+        selected = to_column_list(self.args['intensity_column_name'])
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Select Intensity Columns')
+        layout = QVBoxLayout(dialog)
+        column_list = QListWidget(dialog)
+        for index in range(self.IntensityColumnNameCombo.count()):
+            item = QListWidgetItem(self.IntensityColumnNameCombo.itemText(index), column_list)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if item.text() in selected else Qt.Unchecked)
+        layout.addWidget(column_list)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        columns = [column_list.item(index).text() for index in range(column_list.count())
+                   if column_list.item(index).checkState() == Qt.Checked]
+        if not columns:
+            return
+        # Show the first selected column without resetting the selection.
+        self.IntensityColumnNameCombo.blockSignals(True)
+        self.IntensityColumnNameCombo.setCurrentText(columns[0])
+        self.IntensityColumnNameCombo.blockSignals(False)
+        if len(columns) == 1:
+            self.args['intensity_column_name'] = columns[0]
+            self.IntensityColumnNameLabel.setText('Intensity Column Name')
+        else:
+            self.args['intensity_column_name'] = columns
+            self.IntensityColumnNameLabel.setText(f'Intensity Column Names ({len(columns)} selected)')
 
-        self.close_session()
+    def select_fragment_filters(self):
+        """
+        Open a dialog to enable additional fragment filters and set their values. Enabled filters are applied to all
+        isolation windows after the relative intensity threshold in the order given by
+        exporter.fragment_filters.FRAGMENT_FILTERS.
+        """
+        labels = {'precursor_exclusion': 'Precursor Exclusion (m/z)',
+                  'min_intensity': 'Minimum Intensity',
+                  'min_signal_to_noise': 'Minimum Signal-to-Noise',
+                  'top_n': 'Top N Fragments per Window'}
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Fragment Filters')
+        layout = QGridLayout(dialog)
+        inputs = {}
+        for row, name in enumerate(FRAGMENT_FILTERS):
+            checkbox = QCheckBox(labels[name], dialog)
+            if name == 'top_n':
+                spinbox = QSpinBox(dialog)
+                spinbox.setRange(1, 10000)
+                spinbox.setValue(50)
+            else:
+                spinbox = QDoubleSpinBox(dialog)
+                spinbox.setRange(0, 1e12)
+                spinbox.setDecimals(2)
+                spinbox.setValue(1 if name != 'min_intensity' else 0)
+            if name in self.args['fragment_filters']:
+                checkbox.setChecked(True)
+                spinbox.setValue(self.args['fragment_filters'][name])
+            spinbox.setEnabled(checkbox.isChecked())
+            checkbox.toggled.connect(spinbox.setEnabled)
+            layout.addWidget(checkbox, row, 0)
+            layout.addWidget(spinbox, row, 1)
+            inputs[name] = (checkbox, spinbox)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons, len(FRAGMENT_FILTERS), 0, 1, 2)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        self.args['fragment_filters'] = {name: spinbox.value() for name, (checkbox, spinbox) in inputs.items()
+                                         if checkbox.isChecked()}
+        if self.args['fragment_filters']:
+            self.FragmentFiltersLabel.setText(f'{len(self.args["fragment_filters"])} additional fragment filter(s) '
+                                              f'enabled')
+        else:
+            self.FragmentFiltersLabel.setText('No additional fragment filters')
+        self.FragmentFiltersLabel.setToolTip('\n'.join([f'{labels[name]}: {value:g}'
+                                                        for name, value in self.args['fragment_filters'].items()]))
 
+    def run(self):
+        """
+        Run workflow.
+        """
         # Collect arguments from GUI
         self.args['outdir'] = str(self.OutputDirectoryLineEdit.text())
         if self.args['outdir'] == '':
             self.args['outdir'] = os.path.dirname(self.args['scils'])
-        if not os.path.isdir(self.args['outdir']):
-            os.mkdir(self.args['outdir'])
         if self.ExportSingleFileCheckbox.isChecked():
             self.args['export_single_file'] = True
         elif not self.ExportSingleFileCheckbox.isChecked():
@@ -249,6 +458,7 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
         elif not self.GetPrecursorFromIsolationWindowCheckbox.isChecked():
             self.args['get_precursor_from_isolation_window'] = False
         self.args['relative_intensity_threshold'] = int(self.RelativeIntensityThresholdSpinBox.text())
+        self.args['workers'] = int(self.WorkersSpinBox.text())
         if self.PolarityPositiveRadio.isChecked() and not self.PolarityNegativeRadio.isChecked():
             self.args['polarity'] = 'positive'
         elif not self.PolarityPositiveRadio.isChecked() and self.PolarityNegativeRadio.isChecked():
@@ -257,77 +467,142 @@ class IprmpasefExporterWindow(QMainWindow, Ui_IprmpasefExporterWindow):
             self.args['barebones_metadata'] = True
         elif not self.BarebonesMetadataCheckbox.isChecked():
             self.args['barebones_metadata'] = False
-        if self.MzEncoding64bitRadio.isChecked() and not self.MzEncoding32bitRadio.isChecked():
+        if self.MzEncoding64bitRadio.isChecked():
             self.args['mz_encoding'] = 64
-        elif not self.MzEncoding64bitRadio.isChecked() and self.MzEncoding32bitRadio.isChecked():
+        elif self.MzEncoding32bitRadio.isChecked():
             self.args['mz_encoding'] = 32
-        if self.IntensityEncoding64bitRadio.isChecked() and not self.IntensityEncoding32bitRadio.isChecked():
+        elif self.MzEncodingNumpressRadio.isChecked():
+            self.args['mz_encoding'] = 'numpress_linear'
+        if self.IntensityEncoding64bitRadio.isChecked():
             self.args['intensity_encoding'] = 64
-        elif not self.IntensityEncoding64bitRadio.isChecked() and self.IntensityEncoding32bitRadio.isChecked():
+        elif self.IntensityEncoding32bitRadio.isChecked():
             self.args['intensity_encoding'] = 32
+        elif self.IntensityEncodingSlofRadio.isChecked():
+            self.args['intensity_encoding'] = 'numpress_slof'
+        elif self.IntensityEncodingPicRadio.isChecked():
+            self.args['intensity_encoding'] = 'numpress_pic'
         if self.CompressionZlibRadio.isChecked() and not self.CompressionNoneRadio.isChecked():
             self.args['compression'] = 'zlib'
-        elif not self.CompressionZlibRadio.isChecked() and not self.CompressionNoneRadio.isChecked():
+        elif not self.CompressionZlibRadio.isChecked() and self.CompressionNoneRadio.isChecked():
             self.args['compression'] = 'none'
+        if self.MzmlbCheckbox.isChecked():
+            self.args['mzmlb'] = True
+        elif not self.MzmlbCheckbox.isChecked():
+            self.args['mzmlb'] = False
+        if self.ProfileCheckbox.isChecked():
+            self.args['profile'] = 'stages'
+        elif not self.ProfileCheckbox.isChecked():
+            self.args['profile'] = None
 
         # Check for required arguments
         if self.args['scils'] == '' or \
                 self.args['outdir'] == '' or \
-                self.args['export_format'] == '' or \
+                self.args['export_formats'] == [] or \
                 self.args['feature_list_id'] == '' or \
                 self.args['intensity_column_name'] == '':
             args_error = QMessageBox(self)
             args_error.setWindowTitle('Error')
             args_error.setText('One or more required arguments are missing. Please check export parameters and try again.')
             args_error.exec()
+            return
+        if not os.path.isdir(self.args['outdir']):
+            os.mkdir(self.args['outdir'])
+
+        # Convert to all selected export formats in a worker thread.
+        self.cancel_event = threading.Event()
+        self.CancelButton.setEnabled(True)
+        self.ProgressBar.setMaximum(0)
+        self.ProgressBar.setValue(0)
+        self.ProgressLabel.setText('Loading feature table...')
+        self.start_worker(convert_iprmpasef_feature_list,
+                          self.export_finished,
+                          progress=self.export_progress,
+                          cancelled=self.export_cancelled,
+                          slx=self.session,
+                          outdir=self.args['outdir'],
+                          feature_list_id=self.args['feature_list_id'],
+                          intensity_column_name=self.args['intensity_column_name'],
+                          export_formats=self.args['export_formats'],
+                          export_single_file=self.args['export_single_file'],
+                          get_precursor_from_isolation_window=self.args['get_precursor_from_isolation_window'],
+                          relative_intensity_threshold=self.args['relative_intensity_threshold'],
+                          workers=self.args['workers'],
+                          polarity='+' if self.args['polarity'] == 'positive' else '-',
+                          barebones_metadata=self.args['barebones_metadata'],
+                          mz_encoding=self.args['mz_encoding'],
+                          intensity_encoding=self.args['intensity_encoding'],
+                          compression=self.args['compression'],
+                          mzmlb=self.args['mzmlb'],
+                          profile=self.args['profile'],
+                          fragment_filters=self.args['fragment_filters'],
+                          cancel_event=self.cancel_event)
+
+    def export_progress(self, progress):
+        """
+        Update progress bar and label with the number of exported isolation windows, spectra per second, and
+        estimated time remaining.
+
+        :param progress: Progress dict emitted by exporter.spectra.write_ms2_spectra().
+        :type progress: dict
+        """
+        self.ProgressBar.setMaximum(progress['windows_total'])
+        self.ProgressBar.setValue(progress['windows_done'])
+        self.ProgressLabel.setText(f'{progress["windows_done"]}/{progress["windows_total"]} windows | '
+                                   f'{progress["spectra_per_second"]:.1f} spectra/s | '
+                                   f'ETA {progress["eta"]:.0f} s')
+
+    def cancel(self):
+        """
+        Cancel the running export when Cancel button is clicked. Output files that have already been written are
+        removed once the worker thread stops.
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.CancelButton.setEnabled(False)
+        self.ProgressLabel.setText('Cancelling...')
+
+    def export_cancelled(self):
+        """
+        Reset progress and re-enable buttons after the export was cancelled.
+        """
+        self.ProgressBar.setMaximum(100)
+        self.ProgressBar.setValue(0)
+        self.ProgressLabel.setText('Export cancelled.')
+        self.set_inputs_enabled(True)
+
+    def export_finished(self, result):
+        """
+        Close SCiLS session, show finished message box, and reset inputs after the export has finished.
+
+        :param result: Return value of exporter.export.convert_iprmpasef_feature_list().
+        """
+        self.CancelButton.setEnabled(False)
+        self.close_session()
 
-        # Convert to mgf
-        if self.args['export_format'] == 'MGF':
-            convert_iprmpasef_feature_list_to_mgf(slx=self.args['scils'],
-                                                  outdir=self.args['outdir'],
-                                                  feature_list_id=self.args['feature_list_id'],
-                                                  intensity_column_name=self.args['intensity_column_name'],
-                                                  export_single_file=self.args['export_single_file'],
-                                                  get_precursor_from_isolation_window=self.args['get_precursor_from_isolation_window'],
-                                                  relative_intensity_threshold=self.args['relative_intensity_threshold'])
-        # Convert to mzml
-        elif self.args['export_format'] == 'mzML':
-            convert_iprmpasef_feature_list_to_mzml(slx=self.args['scils'],
-                                                   outdir=self.args['outdir'],
-                                                   feature_list_id=self.args['feature_list_id'],
-                                                   intensity_column_name=self.args['intensity_column_name'],
-                                                   polarity=self.args['polarity'],
-                                                   barebones_metadata=self.args['barebones_metadata'],
-                                                   mz_encoding=self.args['mz_encoding'],
-                                                   intensity_encoding=self.args['intensity_encoding'],
-                                                   compression=self.args['compression'],
-                                                   export_single_file=self.args['export_single_file'],
-                                                   get_precursor_from_isolation_window=self.args['get_precursor_from_isolation_window'],
-                                                   relative_intensity_threshold=self.args['relative_intensity_threshold'])
-
-        # Finish and/or error message boxes
+        # Finish message box
         finished = QMessageBox(self)
         finished.setWindowTitle('iprm-PASEF Exporter')
         finished.setText('iprm-PASEF Exporter has finished running.')
         finished.exec()
 
-        stderr = sys.stderr.getvalue()
-        if stderr != '':
-            error = QMessageBox(self)
-            error.setWindowTitle('Error')
-            error.setText(stderr)
-            error.exec()
-
         self.ScilsLineEdit.setText('')
         self.FeatureListIdCombo.clear()
         self.IntensityColumnNameCombo.clear()
+        self.ProgressLabel.setText('')
+
+        self.set_inputs_enabled(True)
 
-        self.ScilsBrowseButton.setEnabled(True)
-        self.FeatureListIdCombo.setEnabled(True)
-        self.IntensityColumnNameCombo.setEnabled(True)
-        self.OutputDirectoryBrowseButton.setEnabled(True)
-        self.ExportFormatCombo.setEnabled(True)
-        self.RunButton.setEnabled(True)
+    def closeEvent(self, event):
+        """
+        Cancel any running export and close SCiLS session when the window is closed.
+
+        :param event: Close event.
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        QThreadPool.globalInstance().waitForDone()
+        self.close_session()
+        super(IprmpasefExporterWindow, self).closeEvent(event)
 
 
 def main():
@@ -338,4 +613,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # Required for worker processes in the PyInstaller packaged GUI.
+    multiprocessing.freeze_support()
     main()
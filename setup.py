@@ -11,6 +11,11 @@ setup(name='iprm-PASEF_Exporter',
       entry_points={'console_scripts': ['get_feature_lists=exporter.get_feature_list_ids:main',
                                         'get_intensity_column_names=exporter.get_intensity_column_names:main',
                                         'iprmpasef_to_mgf=exporter.mgf:main',
-                                        'iprmpasef_to_mzml=exporter.mzml:main']},
-      install_requires=['numpy', 'pandas', 'pyopenms', 'pyteomics', 'psims', 'PySide6'])
+                                        'iprmpasef_to_mzml=exporter.mzml:main',
+                                        'iprmpasef_export=exporter.export:main',
+                                        'iprmpasef_batch=exporter.batch:main',
+                                        'iprmpasef_server=exporter.server:main',
+                                        'iprmpasef_client=exporter.client:main']},
+      install_requires=['numpy', 'pandas', 'pyarrow', 'pyopenms', 'pyteomics', 'psims>=1.3.5', 'PySide6'],
+      extras_require={'numpress': ['pynumpress'], 'mzmlb': ['h5py']})
 